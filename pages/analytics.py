@@ -2,4 +2,33 @@ import streamlit_analytics as sta
 import streamlit as st
 
 sta.start_tracking(load_from_json='streamlit_analytics/data.json')
-sta.stop_tracking(show=True, unsafe_password=st.secrets.get('ANALYTICS_PASSWORD', 'admin'), json_location='streamlit_analytics/data.json')
\ No newline at end of file
+sta.stop_tracking(show=True, unsafe_password=st.secrets.get('ANALYTICS_PASSWORD', 'admin'), json_location='streamlit_analytics/data.json')
+
+from utils.extraction_cache import extraction_cache
+
+with st.expander("📦 Cache estrazioni PDF"):
+    stats = extraction_cache.stats()
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Hit rate", f"{stats['hit_rate']:.0%}", help=f"{stats['hit_memoria']} in memoria, {stats['hit_disco']} su disco, {stats['miss']} miss")
+    c2.metric("Bollette in cache", stats['voci_disco'])
+    c3.metric("Spazio su disco", f"{stats['bytes_disco'] / 1024:.1f} KB")
+
+from utils.estrazione_locale import statistiche as statistiche_estrazione
+
+with st.expander("⚡ Percorsi di estrazione delle bollette"):
+    stats = statistiche_estrazione()
+    percorsi = {k: v for k, v in stats.items() if k != 'layout'}
+    if percorsi:
+        st.caption("Richieste e latenza (s) per percorso: deterministico (senza modello), solo testo, PDF intero")
+        st.dataframe(percorsi, use_container_width=True)
+    if stats.get('layout'):
+        st.caption("Copertura dei 13 campi per layout riconosciuto")
+        st.dataframe(stats['layout'], use_container_width=True)
+
+from utils.estrazione_hedged import latenze
+
+with st.expander("🏁 Estrazioni su più modelli"):
+    stats = latenze.stats()
+    if stats:
+        st.caption("Per modello: chiamate, errori, risposte vincenti, chiamate annullate e p95 della latenza (s)")
+        st.dataframe(stats, use_container_width=True)
@@ -2,6 +2,10 @@ import streamlit as st
 import streamlit_analytics as sta
 from utils import analysis_offerte as ao
 from utils import model_name_format, pdf_request, get_user_cache 
+from utils.estrazione_jobs import COMPLETATO, IN_CODA, CodaPiena, coda_estrazioni
+from utils.extraction_cache import chiave_estrazione
+from utils.openrouter_request import SCHEMA_VERSION
+import time
 
 cache = get_user_cache()
 
@@ -9,16 +13,39 @@ cache['homepage_visited'] = True
 
 def upload_bill():
     cache['bill_info_confirmed'] = False
+    if cache.get('pdf_job') is not None:
+        coda_estrazioni.annulla(cache['pdf_job'])
+        cache['pdf_job'] = None
     if 'pdf_file' in st.session_state and st.session_state['pdf_file'] is not None:
         cache['pdf_model'] = cache['selected_model']
+        data = st.session_state['pdf_file'].getvalue()
+        # l'estrazione gira nel pool di background: lo script non resta bloccato sul modello
         try:
-            with st.spinner(text="Stiamo analizzando la tua bolletta, per favore attendi.", show_time=True):
-                res = pdf_request(cache['pdf_model'], st.session_state['pdf_file'].getvalue())
-                cache['pdf_content'] = res
-        except KeyError:
-            st.error('Our chatbot couldn\'t analyze your pdf.')
-        except Exception as e:
-            st.error(e)
+            cache['pdf_job'] = coda_estrazioni.sottometti(
+                pdf_request, cache['pdf_model'], data, riserve=cache.get('available_models'), con_modello=True,
+                chiave=chiave_estrazione(data, cache['pdf_model']['id'], SCHEMA_VERSION))
+        except CodaPiena:
+            st.error("Troppe bollette in analisi in questo momento, riprova tra qualche secondo.")
+
+@st.fragment(run_every=2)
+def show_extraction_status():
+    lavoro = coda_estrazioni.stato(cache.get('pdf_job'))
+    if lavoro is None or lavoro.concluso:
+        cache['pdf_job'] = None
+        if lavoro is not None and lavoro.stato == COMPLETATO:
+            # con l'estrazione su più modelli può aver risposto un modello di riserva
+            cache['pdf_content'], cache['pdf_model'] = coda_estrazioni.risultato(lavoro.id)
+        elif lavoro is not None and isinstance(lavoro.errore, (KeyError, ValueError)):
+            cache['pdf_error'] = 'Our chatbot couldn\'t analyze your pdf.'
+        elif lavoro is not None and lavoro.errore is not None:
+            cache['pdf_error'] = str(lavoro.errore)
+        st.rerun()
+
+    with st.container(border=True):
+        if lavoro.stato == IN_CODA:
+            st.info(f"La tua bolletta è in coda ({coda_estrazioni.posizione(lavoro.id)} prima di te), per favore attendi.", icon="⏳")
+        else:
+            st.info(f"Stiamo analizzando la tua bolletta, per favore attendi. ({time.time() - lavoro.iniziato:.0f} s)", icon="⏳")
 
 def show_info_about_bill():
     cache['pdf_content']['estimated_annual_cost'] = cache['pdf_content']['total_price']*12
@@ -49,8 +76,14 @@ def show_info_about_bill():
                 "€{:.2f}".format(cache['pdf_content']["estimated_annual_cost"])
             )
 
-def show_offers(best_offers: list):
-    for i, offer in enumerate(best_offers[:10]):
+def show_offers(ranking: ao.OfferRanking, page_size=10):
+    if len(ranking) == 0:
+        return
+    n_pages = ranking.n_pages(page_size)
+    if st.session_state.get('offers_page', 1) > n_pages:
+        st.session_state['offers_page'] = 1
+    page = st.session_state.get('offers_page', 1) - 1
+    for i, offer in enumerate(ranking.page(page, page_size), start=page * page_size):
         is_best = offer['consigliata']
         
         with st.container(border=True):
@@ -101,20 +134,50 @@ def show_offers(best_offers: list):
                 if offer.get('url_offerta') and offer['url_offerta'] != 'nan':
                     st.markdown(f"🔗 [Vai all'offerta sul Portale ARERA]({offer['url_offerta']})")
 
+    st.number_input(f"Pagina (di {n_pages})", min_value=1, max_value=n_pages, step=1, key='offers_page')
+
+
 
+def show_best_by_consumption(df_offerte, ranking: ao.OfferRanking):
+    if df_offerte is None:
+        return
+    # stesse offerte (zona) e stessi prezzi per fascia della classifica mostrata sopra
+    with st.expander("📈 Offerta più economica per consumo annuo"):
+        for r in ao.best_consumption_ranges(df_offerte, ranking.offer_index()):
+            intervallo = f"oltre {r['da_kwh']:.0f}" if r['a_kwh'] == float('inf') else f"{r['da_kwh']:.0f} - {r['a_kwh']:.0f}"
+            st.text(f"{intervallo} kWh/anno: {r['fornitore']} ({r['offerta']})")
 
-def show_compared_to_other_bills() -> list:
+def get_ranking(df_offerte) -> ao.OfferRanking:
+    if df_offerte is None:
+        return ao.rank_offers(df_offerte, cache['pdf_content'])
+
+    # Classifica di sessione: ricostruita solo se cambiano catalogo o città,
+    # altrimenti aggiornata incrementalmente sui campi modificati
+    key = (ao.catalog_version(), cache['pdf_content'].get('city'))
+    if cache.get('ranking_key') != key or 'ranking_state' not in cache:
+        try:
+            zona = ao.offers_in_area(cache['pdf_content'].get('city'))
+        except Exception:
+            zona = None
+        cache['ranking_state'] = ao.IncrementalRanking(df_offerte, cache['pdf_content'], candidate=zona)
+        cache['ranking_key'] = key
+    else:
+        cache['ranking_state'].sync(cache['pdf_content'])
+    return cache['ranking_state']
+
+def show_compared_to_other_bills() -> ao.OfferRanking:
     df_offerte, error = ao.load_arera_offers()
-    best_offers = ao.find_best_offers(df_offerte, cache['pdf_content'], top_n=-1)
-    if len(best_offers) == 0:
+    ranking = get_ranking(df_offerte)
+    if len(ranking) == 0:
         st.warning("Nessuna offerta migliore trovata nel database")
     else:
+        stats = ranking.stats()
         with st.container(border=True):
             # Statistiche rapide
             col_s1, col_s2, col_s3, col_s4 = st.columns(4)
             
             with col_s1:
-                max_saving = max([o['risparmio_euro'] for o in best_offers])
+                max_saving = stats['max_saving']
                 st.metric(
                     "Risparmio Max",
                     f"€{max_saving:.2f}/anno",
@@ -122,17 +185,16 @@ def show_compared_to_other_bills() -> list:
                 )
             
             with col_s2:
-                avg_saving = sum([o['risparmio_euro'] for o in best_offers]) / len(best_offers)
-                st.metric("Risparmio Medio", f"€{avg_saving:.2f}/anno")
+                st.metric("Risparmio Medio", f"€{stats['avg_saving']:.2f}/anno")
             
             with col_s3:
-                recommended = sum([1 for o in best_offers if o['consigliata']])
-                st.metric("Consigliate", recommended)
+                st.metric("Consigliate", stats['recommended'])
             
             with col_s4:
-                n_fisso = sum([1 for o in best_offers if o['tipo_prezzo'] == 'Fisso'])
-                st.metric("Prezzo Fisso", f"{n_fisso}/{len(best_offers)}")
-    return best_offers
+                st.metric("Prezzo Fisso", f"{stats['fixed']}/{stats['count']}")
+
+            show_best_by_consumption(df_offerte, ranking)
+    return ranking
 
 def change_value(key):
     cache['pdf_content'][key] = st.session_state[key]
@@ -258,12 +320,17 @@ with st.container(border=True):
     st.file_uploader('Carica la tua bolletta elettrica per un confronto dell\'offerta', accept_multiple_files=False, key='pdf_file', on_change=upload_bill, type='pdf')
     model_signature = st.empty()
 
-if 'pdf_model' in cache and cache['pdf_model'] is not None and 'pdf_file' in st.session_state and st.session_state['pdf_file'] is not None:
+if cache.get('pdf_error'):
+    st.error(cache.pop('pdf_error'))
+
+if cache.get('pdf_job') is not None:
+    show_extraction_status()
+elif 'pdf_model' in cache and cache['pdf_model'] is not None and 'pdf_file' in st.session_state and st.session_state['pdf_file'] is not None:
     model_signature.write(f':gray[*file analizzato da {model_name_format(cache["pdf_model"]).split(", from")[0]}*]')
     if 'bill_info_confirmed' in cache and cache['bill_info_confirmed'] == True:
         show_info_about_bill()
-        best_offers = show_compared_to_other_bills()
-        show_offers(best_offers)
+        ranking = show_compared_to_other_bills()
+        show_offers(ranking)
     else:
         try:
             show_editable_info()
@@ -1,9 +1,8 @@
 import streamlit as st
 import streamlit_analytics as sta
-from openrouter import OpenRouter
-import requests
 from elements import footer, header
 from utils import model_name_format, get_user_cache
+from utils.http_transport import OPENROUTER_BASE_URL, TIMEOUT, openrouter_client, sessione
 
 sta.start_tracking(load_from_json='streamlit_analytics/data.json')
 
@@ -19,8 +18,9 @@ pages = [
 if 'OPENROUTER_API_KEY' not in st.secrets or st.secrets['OPENROUTER_API_KEY'] is None: 
     st.error("La chiave API di OpenRouter manca dai segreti dell'app! Si prega di contattare un amministratore.", icon="🗝️")
     st.stop()
-elif 'openai_client' not in st.session_state:
-    st.session_state.client = OpenRouter(api_key=st.secrets['OPENROUTER_API_KEY'])
+elif 'client' not in st.session_state:
+    # client unico per il processo: tutte le sessioni condividono il pool di connessioni
+    st.session_state.client = openrouter_client(st.secrets['OPENROUTER_API_KEY'])
 
 cache = get_user_cache() 
 
@@ -39,7 +39,7 @@ if 'available_models' not in cache:
         with open('available_models.json', 'r') as f:   
             cache['available_models'] = json.load(f)
     except:
-        models = requests.get('https://openrouter.ai/api/v1/models/user', headers={'Authorization': f'Bearer {st.secrets["OPENROUTER_API_KEY"]}'}).json()['data']
+        models = sessione().get(f'{OPENROUTER_BASE_URL}/models/user', headers={'Authorization': f'Bearer {st.secrets["OPENROUTER_API_KEY"]}'}, timeout=TIMEOUT).json()['data']
         models = list(filter(lambda model:model['id'].endswith(':free'), models))
         cache['available_models'] = models
 
@@ -0,0 +1,17 @@
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def radice_repo(monkeypatch):
+    """I percorsi degli asset (./assets/...) sono relativi alla radice del repo, come in Streamlit"""
+    monkeypatch.chdir(ROOT)
+
+
+@pytest.fixture(scope='session')
+def catalogo():
+    from utils.analysis_offerte import PATH_PLACET, parse_arera_offers
+    return parse_arera_offers(os.path.join(ROOT, PATH_PLACET))
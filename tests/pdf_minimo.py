@@ -0,0 +1,34 @@
+"""PDF di prova senza dipendenze: una pagina per elemento di `pagine`, una riga di testo per stringa"""
+
+
+def _testo(riga):
+    return riga.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def pdf(pagine) -> bytes:
+    oggetti = []
+
+    def aggiungi(corpo):
+        oggetti.append(corpo)
+        return len(oggetti)
+
+    font = aggiungi(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    contenuti = []
+    for righe in pagine:
+        operatori = "BT /F1 10 Tf 40 800 Td 14 TL " + " ".join(f"({_testo(r)}) Tj T*" for r in righe) + " ET"
+        dati = operatori.encode('cp1252')
+        contenuti.append(aggiungi(b"<< /Length %d >>\nstream\n" % len(dati) + dati + b"\nendstream"))
+    radice_pagine = len(oggetti) + len(pagine) + 1
+    figli = [aggiungi(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 %d 0 R >> >>"
+                      b" /Contents %d 0 R >>" % (radice_pagine, font, c)) for c in contenuti]
+    aggiungi(b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % k for k in figli) + b"] /Count %d >>" % len(figli))
+    catalogo = aggiungi(b"<< /Type /Catalog /Pages %d 0 R >>" % radice_pagine)
+
+    out, offset = b"%PDF-1.4\n", []
+    for i, corpo in enumerate(oggetti, 1):
+        offset.append(len(out))
+        out += b"%d 0 obj\n" % i + corpo + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(oggetti) + 1) + b"".join(b"%010d 00000 n \n" % o for o in offset)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF" % (len(oggetti) + 1, catalogo, xref)
+    return out
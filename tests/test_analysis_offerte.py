@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import analysis_offerte as ao
+
+BOLLETTA = {'annual_consume': 2700, 'estimated_annual_cost': 900,
+            'f1_consume': 900, 'f2_consume': 850, 'f3_consume': 950}
+
+
+def _offerta(**prezzi):
+    riga = {'denominazione': 'Fornitore', 'nome_offerta': 'Offerta', 'tipo_offerta': 'Fisso',
+            'p_fix_f': 60.0, 'p_fix_v': np.nan, 'p_vol_f1': np.nan, 'p_vol_f2': np.nan, 'p_vol_f3': np.nan,
+            'p_vol_bf1': np.nan, 'p_vol_bf23': np.nan, 'p_vol_mono': np.nan}
+    riga.update(prezzi)
+    return riga
+
+
+def test_prezzi_colonnari_come_riga_per_riga(catalogo):
+    # riferimento: il CSV letto senza compattazione dei prezzi
+    csv = pd.read_csv(ao.PATH_PLACET).dropna(subset=['denominazione', 'nome_offerta'])
+    assert len(csv) == len(catalogo)
+    for fasce in (False, True):
+        prezzo, fisso, is_fixed = ao.extract_prices(catalogo, user_has_fasce=fasce)
+        for i in range(len(catalogo)):
+            atteso = ao.extract_price_from_row(csv.iloc[i], user_has_fasce=fasce)
+            assert prezzo[i] == pytest.approx(atteso[0], abs=1e-12), i
+            assert fisso[i] == pytest.approx(atteso[1])
+            assert is_fixed[i] == atteso[2]
+
+
+def test_matrice_fasce_pesi_fissi_come_trioraria(catalogo):
+    bande = ao.band_price_matrix(catalogo)
+    prezzo, _, _ = ao.extract_prices(catalogo, user_has_fasce=True)
+    p_f1, p_f2, p_f3 = (ao._price_column(catalogo, c) for c in ('p_vol_f1', 'p_vol_f2', 'p_vol_f3'))
+    tri = np.isfinite(p_f1) & np.isfinite(p_f2) & np.isfinite(p_f3)
+    np.testing.assert_allclose(ao.band_weighted_price(bande, np.array([33., 33., 34.]))[tri], prezzo[tri])
+
+
+def test_trioraria_incompleta_passa_alla_struttura_successiva():
+    df = pd.DataFrame([
+        _offerta(p_vol_f1=0.15, p_vol_f2=0.14, p_vol_f3=0.13),
+        _offerta(p_vol_f1=0.15, p_vol_f2=0.14, p_vol_bf1=0.16, p_vol_bf23=0.12),
+        _offerta(p_vol_f1=0.15, p_vol_f2=0.14, p_vol_bf23=0.12, p_vol_mono=0.149),
+        _offerta(p_vol_f1=0.15, p_vol_f2=0.14),
+    ])
+    bande = ao.band_price_matrix(df)
+    np.testing.assert_allclose(bande, [[0.15, 0.14, 0.13], [0.16, 0.12, 0.12],
+                                       [0.149, 0.149, 0.149], [0.12, 0.12, 0.12]])
+    for fasce in (False, True):
+        prezzo, _, _ = ao.extract_prices(df, user_has_fasce=fasce)
+        assert np.isfinite(prezzo).all()
+        attesi = [ao.extract_price_from_row(riga, user_has_fasce=fasce)[0] for _, riga in df.iterrows()]
+        np.testing.assert_allclose(prezzo, attesi, rtol=0, atol=1e-15)
+
+
+def test_catalogo_prezzato_su_tutte_le_fasce(catalogo):
+    assert np.isfinite(ao.band_price_matrix(catalogo)).all()
+    stats = ao.rank_offers(catalogo, BOLLETTA).stats()
+    assert np.isfinite(stats['max_saving']) and np.isfinite(stats['avg_saving'])
+
+
+def test_prezzo_pesato_sui_consumi_reali(catalogo):
+    consumi = ao.band_consumption(BOLLETTA)
+    classifica = ao.rank_offers(catalogo, BOLLETTA)
+    bande = ao.band_price_matrix(catalogo)
+    primo = classifica[0]
+    riga = classifica._righe[classifica._ordinate[0]]
+    assert primo['prezzo_kwh'] == round(float(bande[riga] @ consumi / consumi.sum()), 4)
+
+
+def _costi(classifica, consumo):
+    return consumo * classifica._prezzo_kwh + classifica._costo_fisso
+
+
+@pytest.mark.parametrize('consumo', [500, 1800, 2700, 6000, 20000])
+def test_inviluppo_come_classifica(catalogo, consumo):
+    zona = ao.load_geo_index().candidates(regione='Lazio')
+    for classifica in (ao.rank_offers(catalogo, BOLLETTA, candidate=zona),
+                       ao.IncrementalRanking(catalogo, BOLLETTA, candidate=zona)):
+        indice = classifica.offer_index()
+        costi = dict(zip(classifica._righe.tolist(), _costi(classifica, consumo)))
+        assert set(indice.top_k(consumo, 5)) <= set(costi)
+        assert costi[indice.best(consumo)] == pytest.approx(min(costi.values()))
+        assert [costi[r] for r in indice.top_k(consumo, 5)] == pytest.approx(sorted(costi.values())[:5])
+
+
+def test_inviluppo_segue_le_modifiche_della_bolletta(catalogo):
+    classifica = ao.IncrementalRanking(catalogo, BOLLETTA)
+    prima = classifica.offer_index()
+    classifica.update('f1_consume', 2500)
+    indice = classifica.offer_index()
+    assert indice is not prima
+    costi = dict(zip(classifica._righe.tolist(), _costi(classifica, 2700)))
+    assert costi[indice.best(2700)] == pytest.approx(min(costi.values()))
+
+
+def test_stats_ignorano_prezzi_non_finiti():
+    righe = np.arange(3)
+    classifica = ao.OfferRanking(pd.DataFrame(index=righe), righe, np.array([0.10, np.nan, 0.20]),
+                                 np.array([50.0, 50.0, 50.0]), np.array([True, False, False]), 1000, 300)
+    stats = classifica.stats()
+    assert stats['max_saving'] == 150.0 and stats['avg_saving'] == 100.0
+    assert stats['count'] == 3 and stats['fixed'] == 1
+
+
+def test_stats_classifica_vuota():
+    assert ao.rank_offers(None, BOLLETTA).stats() == {'count': 0, 'max_saving': 0.0, 'avg_saving': 0.0,
+                                                      'recommended': 0, 'fixed': 0}
@@ -0,0 +1,54 @@
+import tracemalloc
+
+from utils import mercato_libero as ml
+from utils.xml_benchmark import xml_sintetico
+
+
+def _scrivi(tmp_path, xml, nome='offerte.xml'):
+    path = tmp_path / nome
+    path.write_text(xml, encoding='utf-8')
+    return str(path)
+
+
+def test_aggiornamento_come_parsing_completo(tmp_path):
+    xml = xml_sintetico(300, seed=8)
+    precedente = ml.aggiorna_offerte_xml(_scrivi(tmp_path, xml, 'prima.xml'))
+    assert precedente.offerte == ml.parsa_offerte_da_stringa(xml)
+    assert precedente.codici == [o['codice'] for o in precedente.offerte]
+
+    # una offerta modificata, una rimossa, una aggiunta
+    blocchi = xml.split('<offerta>')
+    blocchi[5] = blocchi[5].replace('<NOME_OFFERTA>Offerta 4<', '<NOME_OFFERTA>Offerta 4 bis<')
+    del blocchi[10]
+    blocchi.append(xml_sintetico(301, seed=8).split('<offerta>')[-1].replace('</Offerte>', ''))
+    blocchi[-2] = blocchi[-2].replace('</Offerte>', '')
+    nuovo = '<offerta>'.join(blocchi) + '</Offerte>'
+
+    archivio = ml.aggiorna_offerte_xml(_scrivi(tmp_path, nuovo, 'dopo.xml'), precedente)
+    assert archivio.offerte == ml.parsa_offerte_da_stringa(nuovo)
+    r = archivio.resoconto
+    assert (r['aggiunte'], r['rimosse'], r['modificate'], r['parsate']) == (1, 1, 1, 2)
+
+
+def test_latin1_senza_dichiarazione(tmp_path):
+    xml = xml_sintetico(5).split('\n', 1)[1].replace('Offerta 1<', 'Offerta città<')
+    path = tmp_path / 'offerte.xml'
+    path.write_bytes(xml.encode('latin-1'))
+    archivio = ml.aggiorna_offerte_xml(str(path))
+    assert archivio.offerte[1]['nome'] == 'Offerta città'
+    assert archivio.impronte == [None] * 5
+
+
+def test_blocchi_non_copiati(tmp_path):
+    xml = xml_sintetico(2000, seed=9)
+    path = _scrivi(tmp_path, xml)
+    precedente = ml.aggiorna_offerte_xml(path)
+    # nulla da riparsare: in memoria solo impronte, codici e posizioni, non i byte delle offerte
+    tracemalloc.start()
+    try:
+        archivio = ml.aggiorna_offerte_xml(path, precedente)
+        picco = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert archivio.resoconto['parsate'] == 0
+    assert picco < len(xml) / 2
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from utils import batch_scoring
+from utils.analysis_offerte import rank_offers
+
+
+def _profili(n, seed=0):
+    rng = np.random.default_rng(seed)
+    profili = []
+    for i in range(n):
+        profilo = {'id': i, 'annual_consume': float(rng.integers(500, 6000)),
+                   'estimated_annual_cost': round(float(rng.uniform(300, 2500)), 2),
+                   'client_type': 'business' if i % 4 == 0 else 'Domestico'}
+        if i % 2:
+            fasce = rng.dirichlet([2, 2, 2]) * profilo['annual_consume']
+            profilo.update(f1_consume=fasce[0], f2_consume=fasce[1], f3_consume=fasce[2])
+        profili.append(profilo)
+    return profili
+
+
+def _attese(catalogo, profilo, top_k):
+    """rank_offers sulle sole offerte della tipologia di cliente del profilo"""
+    business = catalogo['tipo_cliente'].astype(str).str.lower().str.startswith('non').to_numpy()
+    candidate = np.flatnonzero(business == batch_scoring._is_business(profilo))
+    return rank_offers(catalogo, profilo, candidate=candidate)[:top_k]
+
+
+@pytest.mark.parametrize('top_k', [1, 10, 40])
+def test_batch_come_rank_offers(catalogo, top_k):
+    profili = _profili(120)
+    for profilo, migliori in zip(profili, batch_scoring.BatchScorer(catalogo).score(profili, top_k)):
+        assert migliori == _attese(catalogo, profilo, top_k), profilo['id']
+
+
+def test_blocchi_indipendenti(catalogo):
+    profili = _profili(50, seed=1)
+    intero = [r for _, r in batch_scoring.score_profiles(catalogo, profili, top_k=5)]
+    a_blocchi = [r for _, r in batch_scoring.score_profiles(catalogo, profili, top_k=5, chunk_size=7)]
+    assert intero == a_blocchi
+
+
+def test_prezzi_non_finiti_esclusi(catalogo):
+    catalogo = catalogo.copy()
+    for col in ('p_fix_v', 'p_fix_f'):
+        catalogo[col] = catalogo[col].astype(float)
+        catalogo.loc[catalogo.index[:5], col] = np.inf
+    profili = _profili(20, seed=2)
+    for profilo, migliori in zip(profili, batch_scoring.BatchScorer(catalogo).score(profili, 10)):
+        assert migliori == _attese(catalogo, profilo, 10)
+        assert all(np.isfinite(o['risparmio_euro']) for o in migliori)
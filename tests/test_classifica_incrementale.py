@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from utils import analysis_offerte as ao
+
+BOLLETTA = {'annual_consume': 2700, 'estimated_annual_cost': 900,
+            'f1_consume': 900, 'f2_consume': 850, 'f3_consume': 950}
+
+MODIFICHE = [('f1_consume', 1200), ('estimated_annual_cost', 1100), ('f3_consume', 400),
+             ('annual_consume', 3500), ('f2_consume', 0), ('f1_consume', 0), ('f3_consume', 0),
+             ('f2_consume', 700), ('city', 'Roma')]
+
+
+def _uguali(incrementale, completa, n=None):
+    assert len(incrementale) == len(completa)
+    n = len(completa) if n is None else n
+    assert incrementale[:n] == completa[:n]
+    np.testing.assert_array_equal(incrementale._costo_totale, completa._costo_totale)
+    assert incrementale.stats() == completa.stats()
+
+
+@pytest.mark.parametrize('zona', [None, 'Lazio'])
+def test_modifiche_come_classifica_completa(catalogo, zona):
+    candidate = ao.load_geo_index().candidates(regione=zona) if zona else None
+    bolletta = dict(BOLLETTA)
+    classifica = ao.IncrementalRanking(catalogo, bolletta, candidate=candidate)
+    _uguali(classifica, ao.rank_offers(catalogo, bolletta, candidate=candidate))
+    for campo, valore in MODIFICHE:
+        bolletta[campo] = valore
+        assert classifica.update(campo, valore) == (campo != 'city')
+        _uguali(classifica, ao.rank_offers(catalogo, bolletta, candidate=candidate), n=50)
+
+
+def test_sync_aggiorna_solo_i_campi_cambiati(catalogo):
+    bolletta = dict(BOLLETTA)
+    classifica = ao.IncrementalRanking(catalogo, bolletta)
+    assert classifica.sync(bolletta) == 0
+    bolletta.update(f2_consume=100, estimated_annual_cost=700)
+    assert classifica.sync(bolletta) == 2
+    _uguali(classifica, ao.rank_offers(catalogo, bolletta))
+
+
+def test_molte_modifiche_senza_errori_accumulati(catalogo):
+    bolletta = dict(BOLLETTA)
+    classifica = ao.IncrementalRanking(catalogo, bolletta)
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        campo = ao.BAND_FIELDS[rng.integers(3)]
+        bolletta[campo] = round(float(rng.uniform(0, 2000)), 1)
+        classifica.update(campo, bolletta[campo])
+    _uguali(classifica, ao.rank_offers(catalogo, bolletta), n=100)
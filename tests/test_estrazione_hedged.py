@@ -0,0 +1,78 @@
+import time
+
+import pytest
+
+from utils import estrazione_hedged as hedge
+from utils import openrouter_request as orq
+from utils.extraction_cache import ExtractionCache
+
+SCHEMA = {'type': 'object', 'properties': {'totale': {'type': 'number'}}, 'required': ['totale']}
+
+
+def _chiama(comportamenti):
+    """chiama(modello, annullamento) che dorme, risponde o fallisce secondo il modello"""
+    def chiama(modello, annullamento):
+        attesa, risposta = comportamenti[modello['id']]
+        fine = time.monotonic() + attesa
+        while time.monotonic() < fine:
+            if annullamento.is_set():
+                raise hedge.Annullata()
+            time.sleep(0.01)
+        if isinstance(risposta, Exception):
+            raise risposta
+        return risposta
+    return chiama
+
+
+def test_vince_la_riserva_se_il_principale_e_lento():
+    modelli = [{'id': 'lento'}, {'id': 'veloce'}]
+    inizio = time.monotonic()
+    risultato, vincente = hedge.gara(modelli, _chiama({'lento': (2, {'totale': 1}), 'veloce': (0.1, {'totale': 2})}),
+                                     SCHEMA, ritardo=0.2)
+    assert (risultato, vincente['id']) == ({'totale': 2}, 'veloce')
+    assert time.monotonic() - inizio < 1
+
+
+def test_fallimento_lancia_subito_la_riserva():
+    modelli = [{'id': 'rotto'}, {'id': 'buono'}]
+    inizio = time.monotonic()
+    _, vincente = hedge.gara(modelli, _chiama({'rotto': (0, ValueError('json')), 'buono': (0.1, {'totale': 2})}),
+                             SCHEMA, ritardo=5)
+    assert vincente['id'] == 'buono' and time.monotonic() - inizio < 1
+
+
+def test_risposta_fuori_schema_non_vince():
+    modelli = [{'id': 'sbagliato'}, {'id': 'giusto'}]
+    _, vincente = hedge.gara(modelli, _chiama({'sbagliato': (0, {'totale': 'tre'}), 'giusto': (0.1, {'totale': 3})}),
+                             SCHEMA, ritardo=5)
+    assert vincente['id'] == 'giusto'
+
+
+def test_tutti_falliti_rilancia_l_ultimo_errore():
+    modelli = [{'id': 'a'}, {'id': 'b'}]
+    with pytest.raises(KeyError):
+        hedge.gara(modelli, _chiama({'a': (0, ValueError('a')), 'b': (0, KeyError('b'))}), SCHEMA, ritardo=5)
+
+
+def test_tutti_annullati_non_rilancia_none():
+    with pytest.raises(hedge.Annullata):
+        hedge.gara([{'id': 'a'}], _chiama({'a': (0, hedge.Annullata())}), SCHEMA, ritardo=5)
+
+
+def test_risposta_della_riserva_in_cache_sotto_la_riserva(monkeypatch, tmp_path):
+    from test_openrouter_request import VALIDO
+    monkeypatch.setattr(orq, 'extraction_cache', ExtractionCache(path=str(tmp_path / 'estrazioni.sqlite')))
+    monkeypatch.setattr(hedge, 'ABILITATO', True)
+    monkeypatch.setattr(hedge, 'RITARDO_FISSO', 0.1)
+    comportamenti = {'principale': (2, ValueError('lento')), 'riserva': (0, VALIDO)}
+    monkeypatch.setattr(orq, '_chat_request', lambda model, content, annulla=None, **kwargs:
+                        _chiama(comportamenti)(model, annulla or hedge.Annullamento()))
+    catalogo = [{'id': 'principale', 'name': 'Principale'}, {'id': 'riserva', 'name': 'Riserva'}]
+
+    risultato, vincente = orq.pdf_request(catalogo[0], b'non un pdf', riserve=catalogo, con_modello=True)
+    assert risultato == VALIDO and vincente['id'] == 'riserva'
+    # la riserva la trova in cache, il principale no
+    comportamenti['riserva'] = (0, RuntimeError('non richiamare'))
+    assert orq.pdf_request(catalogo[1], b'non un pdf') == VALIDO
+    chiave = orq.chiave_estrazione(b'non un pdf', 'principale', orq.SCHEMA_VERSION)
+    assert orq.extraction_cache.get(chiave) is None
@@ -0,0 +1,61 @@
+import threading
+
+import pytest
+
+from utils.estrazione_jobs import ANNULLATO, COMPLETATO, CodaEstrazioni, CodaPiena
+
+
+def _attendi(coda, id_lavoro):
+    lavoro = coda.stato(id_lavoro)
+    lavoro.future.result(timeout=5)
+    return lavoro
+
+
+def test_stessa_chiave_un_solo_lavoro():
+    coda = CodaEstrazioni(workers=1)
+    via = threading.Event()
+    primo = coda.sottometti(via.wait, chiave='occupa')
+    a = coda.sottometti(dict, campo=1, chiave='bolletta')
+    b = coda.sottometti(dict, campo=1, chiave='bolletta')
+    assert a == b and coda.stats()['uniti'] == 1
+    via.set()
+    assert _attendi(coda, a).stato == COMPLETATO
+    _attendi(coda, primo)
+
+
+def test_annullare_non_tocca_le_altre_sessioni():
+    coda = CodaEstrazioni(workers=1)
+    via = threading.Event()
+    coda.sottometti(via.wait, chiave='occupa')
+    a = coda.sottometti(dict, campo=1, chiave='bolletta')
+    b = coda.sottometti(dict, campo=1, chiave='bolletta')
+    assert not coda.annulla(a)  # la seconda sessione aspetta ancora
+    via.set()
+    assert _attendi(coda, b).stato == COMPLETATO and coda.risultato(b) == {'campo': 1}
+
+
+def test_annullato_se_nessuno_lo_aspetta():
+    coda = CodaEstrazioni(workers=1)
+    via = threading.Event()
+    coda.sottometti(via.wait, chiave='occupa')
+    a = coda.sottometti(dict, chiave='bolletta')
+    assert coda.annulla(a) and coda.stato(a).stato == ANNULLATO
+    via.set()
+
+
+def test_ogni_sessione_ha_la_sua_copia():
+    coda = CodaEstrazioni(workers=1)
+    id_lavoro = coda.sottometti(dict, totale=10.0)
+    _attendi(coda, id_lavoro)
+    mia = coda.risultato(id_lavoro)
+    mia['totale'] = 0
+    assert coda.risultato(id_lavoro) == {'totale': 10.0}
+
+
+def test_coda_piena():
+    coda = CodaEstrazioni(workers=1, max_coda=1)
+    via = threading.Event()
+    coda.sottometti(via.wait)
+    with pytest.raises(CodaPiena):
+        coda.sottometti(dict)
+    via.set()
@@ -0,0 +1,88 @@
+import pytest
+
+from utils import estrazione_locale as el
+
+from pdf_minimo import pdf
+
+QUADRO_SINTETICO = [
+    "Enel Energia S.p.A. - Mercato libero - P.IVA 15844561009",
+    "Bolletta per la fornitura di energia elettrica - uso domestico residente",
+    "Indirizzo di fornitura: Via Roma 1, 38122 Trento (TN)",
+    "Codice offerta: ENEL-LUCE-FLEX_23",
+    "Potenza impegnata: 3,0 kW",
+    "Totale da pagare: 84,37 euro",
+    "Spesa per la materia energia 52,10 euro",
+    "Canone di abbonamento alla televisione 9,00 euro",
+    "Accise e IVA 11,20 euro",
+    "Consumo annuo: 2.150 kWh",
+    "F1 720 kWh   F2 640 kWh   F3 790 kWh",
+]
+
+CONDIZIONI = ["Condizioni generali di fornitura, pagina informativa"] + ["Lorem ipsum dolor sit amet " * 3] * 30
+
+
+@pytest.mark.parametrize('testo, valore', [('1.234,56', 1234.56), ('1.900', 1900.0), ('12,5', 12.5),
+                                           ('12.5', 12.5), ('2150', 2150.0)])
+def test_numero_italiano(testo, valore):
+    assert el.numero_italiano(testo) == valore
+
+
+def test_campi_quadro_sintetico():
+    campi = el.campi_deterministici('\n'.join(QUADRO_SINTETICO))
+    assert campi == {
+        'annual_consume': 2150.0, 'total_price': 84.37, 'potenza_impegnata': 3.0, 'variable_cost': 52.10,
+        'f1_consume': 720.0, 'f2_consume': 640.0, 'f3_consume': 790.0, 'tv_price': 9.0, 'taxes': 11.20,
+        'offer_code': 'ENEL-LUCE-FLEX_23', 'city': 'Trento',
+        'client_type': 'Domestico residente', 'resident': True,
+    }
+
+
+def test_partita_iva_non_e_un_importo():
+    testo = '\n'.join(["Enel Energia S.p.A. - P.IVA 15844561009", "Partita IVA 12345678901",
+                       "Totale da pagare € 120,50", "Accise € 10,00", "IVA 10% € 9,00", "IVA € 9,00"])
+    assert el.campi_deterministici(testo)['taxes'] == 19.0
+
+
+def test_iva_senza_importo_non_trovata():
+    campi = el.campi_deterministici("Accise € 10,00\nP.IVA 15844561009\nIVA 22")
+    assert 'taxes' not in campi
+
+
+def test_spese_oltre_il_totale_vanno_al_modello():
+    righe = [r for r in QUADRO_SINTETICO if not r.startswith('Accise e IVA')] + ["Accise € 10,00", "IVA € 900,00"]
+    campi = el.campi_deterministici('\n'.join(righe))
+    assert campi['taxes'] > campi['total_price']
+    assert not el._coerente(campi)
+
+
+def test_fasce_incoerenti_vanno_al_modello():
+    righe = [r if not r.startswith('F1') else "F1 72 kWh F2 64 kWh F3 79 kWh" for r in QUADRO_SINTETICO]
+    assert not el._coerente(el.campi_deterministici('\n'.join(righe)))
+
+
+def test_pagine_rilevanti_escludono_le_condizioni_generali():
+    pagine = ['\n'.join(CONDIZIONI), '\n'.join(QUADRO_SINTETICO)]
+    assert el.pagine_rilevanti(pagine) == [pagine[1]]
+
+
+def test_layout_noto_completo_non_chiama_il_modello():
+    pytest.importorskip('pypdf')
+    chiamate = []
+    risultato = el.estrai(pdf([CONDIZIONI, QUADRO_SINTETICO]),
+                          lambda testo: chiamate.append('testo'), lambda: chiamate.append('pdf'))
+    assert chiamate == []
+    assert risultato['taxes'] == 11.20 and risultato['city'] == 'Trento'
+    assert set(risultato) == set(el.CAMPI)
+
+
+def test_layout_sconosciuto_invia_solo_le_pagine_rilevanti():
+    pytest.importorskip('pypdf')
+    locale = el.EstrazioneLocale(pdf([CONDIZIONI, ["Fornitore Sconosciuto Srl", "Totale da pagare 70,00 euro",
+                                                   "Consumo annuo 1.800 kWh"]]))
+    assert locale.percorso == 'llm_testo'
+    assert 'Sconosciuto' in locale.testo and 'Lorem' not in locale.testo
+
+
+def test_pdf_senza_testo_va_al_modello_col_pdf():
+    pytest.importorskip('pypdf')
+    assert el.EstrazioneLocale(pdf([[]])).percorso == 'llm_pdf'
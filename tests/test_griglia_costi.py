@@ -0,0 +1,49 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from utils import mercato_libero as ml
+from utils.xml_benchmark import xml_sintetico
+
+PATH_PARAMETRI = 'assets/offers/PO_Parametri_Mercato_Libero_E_20251121.csv'
+
+CONSUMI = np.arange(500, 3500 + 1, 500)
+POTENZE = np.arange(1.5, 6.0 + 0.25, 0.5)
+RIPARTIZIONI = [{"F1": 0.33, "F2": 0.33, "F3": 0.34}, {"F1": 0.6, "F23": 0.4}]
+
+
+@pytest.fixture(scope='module')
+def tariffe():
+    offerte = [o for o in ml.parsa_offerte_da_stringa(xml_sintetico(300, seed=5)) if o['target'] == 'Domestico']
+    return ml.CalcolatoreSpesa(ml.load_parametri(PATH_PARAMETRI), ml.PUN_DEFAULT).compila(offerte)
+
+
+@pytest.mark.parametrize('residente', [True, False])
+def test_celle_come_calcola(tariffe, residente):
+    griglia = tariffe.griglia(CONSUMI, POTENZE, RIPARTIZIONI, residente, 'Domestico')
+    for (i, consumo), (j, potenza), (r, ripartizione) in itertools.product(
+            enumerate(CONSUMI.tolist()), enumerate(POTENZE.tolist()), enumerate(RIPARTIZIONI)):
+        attese = tariffe.calcola({'consumo_annuo': consumo, 'potenza': potenza, 'residente': residente,
+                                  'target': 'Domestico', 'ripartizione': ripartizione})
+        for voce in ml.VOCI:
+            np.testing.assert_array_equal(griglia.voci[voce][i, j, r], attese[voce])
+        assert griglia.vincitore[i, j, r] == np.argmin(attese["Totale Annuo"])
+
+
+def test_voci_ridotte_e_migliori(tariffe):
+    completa = tariffe.griglia(CONSUMI, POTENZE, RIPARTIZIONI[:1], True, 'Domestico')
+    totale = tariffe.griglia(CONSUMI, POTENZE, RIPARTIZIONI[:1], True, 'Domestico', voci=("Totale Annuo",))
+    assert list(totale.voci) == ["Totale Annuo"]
+    np.testing.assert_array_equal(totale.voci["Totale Annuo"], completa.voci["Totale Annuo"])
+
+    nomi, costi = totale.migliori()
+    assert nomi.shape == costi.shape == (len(CONSUMI), len(POTENZE))
+    np.testing.assert_array_equal(costi, completa.voci["Totale Annuo"][:, :, 0].min(axis=-1))
+    assert nomi[0, 0] == tariffe.offerte[int(completa.vincitore[0, 0, 0])]['nome']
+
+
+def test_risultato_fuori_griglia(tariffe):
+    griglia = tariffe.griglia(CONSUMI, POTENZE, RIPARTIZIONI[:1], True, 'Domestico')
+    assert griglia.risultato(1234, 3.0) is None
+    assert griglia.risultato(1500, 3.0)["Totale Annuo"].shape == (len(tariffe.offerte),)
@@ -0,0 +1,32 @@
+import numpy as np
+
+from utils.griglia_risultati import GrigliaRisultati
+
+
+def _griglia():
+    return GrigliaRisultati({
+        "Offerta": ["A", "B", "C", "D", "E"],
+        "Tipo": ["Fisso", "Variabile", "Fisso", "Fisso", "Variabile"],
+        "Totale Annuo": [100.0, 80.0, 100.0, 120.0, 80.0],
+    })
+
+
+def test_parita_nello_stesso_ordine_in_entrambi_i_versi():
+    griglia = _griglia()
+    assert griglia.ordine("Totale Annuo").tolist() == [1, 4, 0, 2, 3]
+    assert griglia.ordine("Totale Annuo", crescente=False).tolist() == [3, 0, 2, 1, 4]
+
+
+def test_decrescente_su_testo():
+    griglia = _griglia()
+    assert griglia.ordine("Tipo", crescente=False).tolist() == [1, 4, 0, 2, 3]
+    assert griglia.ordine("Offerta", crescente=False).tolist() == [4, 3, 2, 1, 0]
+
+
+def test_filtri_e_pagina():
+    griglia = _griglia()
+    indici = griglia.filtra(griglia.ordine("Totale Annuo"), tipi=["Fisso"], testo="c")
+    assert indici.tolist() == [2]
+    pagina = griglia.pagina(griglia.ordine("Totale Annuo", crescente=False), 0, dimensione=2)
+    assert pagina["Offerta"].tolist() == ["D", "A"]
+    np.testing.assert_array_equal(griglia.filtra(griglia.ordine("Offerta"), tipi=["Variabile"]), [1, 4])
@@ -0,0 +1,51 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from utils import http_transport
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/lento':
+            time.sleep(1)
+        corpo = b'{}'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_pool_pieno_non_blocca(server):
+    sessione = http_transport.nuova_sessione(pool_size=1)
+    lento = threading.Thread(target=lambda: sessione.get(server + '/lento'))
+    lento.start()
+    time.sleep(0.1)
+    inizio = time.monotonic()
+    assert sessione.get(server + '/veloce').status_code == 200
+    assert time.monotonic() - inizio < 0.5
+    lento.join()
+
+
+def test_timeout_di_lettura(server):
+    sessione = http_transport.nuova_sessione(read_timeout=0.2)
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        sessione.get(server + '/lento')
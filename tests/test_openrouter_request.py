@@ -0,0 +1,43 @@
+import pytest
+
+from utils import openrouter_request as orq
+from utils.extraction_cache import ExtractionCache
+
+VALIDO = {'client_type': 'Domestico residente', 'resident': True, 'annual_consume': 2150, 'city': 'Trento',
+          'total_price': 84.37, 'tv_price': 9.0, 'potenza_impegnata': 3.0, 'taxes': 11.2, 'variable_cost': 52.1,
+          'offer_code': 'ENEL-LUCE-FLEX_23', 'f1_consume': 720, 'f2_consume': 640, 'f3_consume': 790}
+
+
+@pytest.fixture
+def cache(monkeypatch, tmp_path):
+    cache = ExtractionCache(path=str(tmp_path / 'estrazioni.sqlite'))
+    monkeypatch.setattr(orq, 'extraction_cache', cache)
+    return cache
+
+
+def _modello(monkeypatch, risposte):
+    """Il modello risponde con le risposte date, una per chiamata"""
+    chiamate = []
+
+    def chat(model, content, annulla=None, **kwargs):
+        chiamate.append(model['id'])
+        return dict(risposte[len(chiamate) - 1])
+    monkeypatch.setattr(orq, '_chat_request', chat)
+    return chiamate
+
+
+def test_risposta_senza_un_campo_non_va_in_cache(monkeypatch, cache):
+    incompleta = {k: v for k, v in VALIDO.items() if k != 'offer_code'}
+    chiamate = _modello(monkeypatch, [incompleta, VALIDO])
+    with pytest.raises(ValueError):
+        orq.pdf_request({'id': 'modello'}, b'non un pdf')
+    assert orq.pdf_request({'id': 'modello'}, b'non un pdf') == VALIDO
+    assert orq.pdf_request({'id': 'modello'}, b'non un pdf') == VALIDO
+    assert chiamate == ['modello', 'modello']
+
+
+def test_tipo_sbagliato_non_valido(monkeypatch, cache):
+    _modello(monkeypatch, [{**VALIDO, 'total_price': '84,37'}])
+    with pytest.raises(ValueError):
+        orq.pdf_request({'id': 'modello'}, b'non un pdf')
+    assert cache.stats()['voci_disco'] == 0
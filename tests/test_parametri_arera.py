@@ -0,0 +1,24 @@
+import warnings
+
+import pytest
+
+from utils import mercato_libero as ml
+
+PATH_PARAMETRI = 'assets/offers/PO_Parametri_Mercato_Libero_E_20251121.csv'
+
+
+def test_csv_del_repo_senza_avvisi():
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        parametri = ml.carica_parametri_da_csv(PATH_PARAMETRI)
+    assert parametri.mancanti == ()
+    assert parametri.ppe == ml.PARAMETRI_CALCOLO['ppe']
+    assert parametri.acc_c_nr == pytest.approx(0.0227)
+
+
+def test_obbligatorio_mancante_avvisa():
+    valori = {k: 1.0 for k in ml.PARAMETRI_CALCOLO if k not in ('sigma1', 'ppe')}
+    with pytest.warns(UserWarning, match='sigma1'):
+        parametri = ml.ParametriArera(valori)
+    assert parametri.mancanti == ('sigma1',)
+    assert parametri.sigma1 == ml.PARAMETRI_CALCOLO['sigma1'] and parametri.lambda_ == 1.0
@@ -0,0 +1,39 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from utils import mercato_libero as ml
+from utils.xml_benchmark import NS_OFFERTE, xml_sintetico
+
+# offerta con campi mancanti, vuoti e ripetuti: l'XPath prende il primo in ordine di documento
+IRREGOLARE = (
+    '<offerta><DettaglioOfferta><TIPO_CLIENTE></TIPO_CLIENTE><NOME_OFFERTA>Prima</NOME_OFFERTA></DettaglioOfferta>'
+    '<NOME_OFFERTA>Seconda</NOME_OFFERTA>'
+    '<ComponenteImpresa><MACROAREA>04</MACROAREA>'
+    '<IntervalloPrezzi><FASCIA_COMPONENTE>02</FASCIA_COMPONENTE><PREZZO>0,1</PREZZO><UNITA_MISURA>03</UNITA_MISURA></IntervalloPrezzi>'
+    '<IntervalloPrezzi><PREZZO>abc</PREZZO><UNITA_MISURA>03</UNITA_MISURA></IntervalloPrezzi>'
+    '<IntervalloPrezzi><PREZZO>12.5</PREZZO><UNITA_MISURA>02</UNITA_MISURA></IntervalloPrezzi></ComponenteImpresa>'
+    '<ComponenteImpresa><IntervalloPrezzi><PREZZO>3</PREZZO><UNITA_MISURA>01</UNITA_MISURA></IntervalloPrezzi></ComponenteImpresa>'
+    '</offerta>'
+)
+
+
+def _offerte(xml):
+    root = ET.fromstring(xml)
+    ns = root.tag.split('}')[0] + '}' if '}' in root.tag else ''
+    return root.findall(f'.//{ns}offerta'), ns
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_un_passaggio_come_xpath(seed):
+    xml = xml_sintetico(500, seed=seed)
+    for testo in (xml, xml.replace(f' xmlns="{NS_OFFERTE}"', '')):
+        offerte, ns = _offerte(testo)
+        assert offerte
+        for offerta in offerte:
+            assert ml._parsa_offerta(offerta, ns) == ml._parsa_offerta_xpath(offerta, ns)
+
+
+def test_offerta_irregolare():
+    offerte, ns = _offerte(f'<Offerte>{IRREGOLARE}</Offerte>')
+    assert ml._parsa_offerta(offerte[0], ns) == ml._parsa_offerta_xpath(offerte[0], ns)
@@ -0,0 +1,68 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+
+from utils import mercato_libero as ml
+from utils import profilo_orario as po
+from utils.xml_benchmark import xml_sintetico
+
+PATH_PARAMETRI = 'assets/offers/PO_Parametri_Mercato_Libero_E_20251121.csv'
+PATH_PUN = 'assets/offers/pun.csv'
+
+
+def _fascia(istante):
+    """Riferimento ora per ora: domeniche e festivi F3, feriali 8-19 F1, 7-23 F2 (sabato compreso)"""
+    festivi = {(1, 1), (1, 6), (4, 25), (5, 1), (6, 2), (8, 15), (11, 1), (12, 8), (12, 25), (12, 26)}
+    giorno, ora = istante.date(), istante.hour
+    if giorno.weekday() == 6 or (giorno.month, giorno.day) in festivi or giorno == po.pasqua(giorno.year) + timedelta(days=1):
+        return 2
+    if giorno.weekday() < 5 and 8 <= ora < 19:
+        return 0
+    return 1 if 7 <= ora < 23 else 2
+
+
+def test_pasqua():
+    assert po.pasqua(2024) == date(2024, 3, 31)
+    assert po.pasqua(2025) == date(2025, 4, 20)
+    assert po.pasqua(2026) == date(2026, 4, 5)
+
+
+@pytest.mark.parametrize('anno, ore', [(2024, 8784), (2025, 8760)])
+def test_classificazione_come_ora_per_ora(anno, ore):
+    profilo = po.ProfiloOrario(np.ones(ore), anno)
+    attese = [_fascia(datetime(anno, 1, 1) + timedelta(hours=i)) for i in range(ore)]
+    assert (profilo.fasce == np.array(attese)).all()
+
+
+def test_pun_mensile_da_anno_mese():
+    pun = po.carica_pun_mensile(PATH_PUN)
+    # AnnoMese 202411 -> novembre, 202501 -> gennaio (valori del CSV del repo)
+    np.testing.assert_allclose(pun[10], [0.145590, 0.137380, 0.117130])
+    np.testing.assert_allclose(pun[0], [0.158320, 0.151610, 0.128540])
+    assert len(np.unique(pun[:, 0])) == 12
+
+
+def test_pun_effettivo_somma_mese_per_mese():
+    rng = np.random.default_rng(0)
+    profilo = po.ProfiloOrario(rng.gamma(2, 0.15, 8760), 2025)
+    pun = po.carica_pun_mensile(PATH_PUN)
+    effettivo = profilo.pun_effettivo(pun)
+    assert sum(effettivo[f] * k for f, k in zip(po.FASCE_ORARIE, profilo.kwh_fasce)) == \
+        pytest.approx((pun * profilo.kwh_mensili).sum(), rel=1e-12)
+
+
+def test_profilo_orario_come_calcolo_scalare():
+    parametri = ml.load_parametri(PATH_PARAMETRI)
+    offerte = [o for o in ml.parsa_offerte_da_stringa(xml_sintetico(300)) if o['target'] == 'Domestico']
+    tariffe = ml.CalcolatoreSpesa(parametri, ml.PUN_DEFAULT).compila(offerte)
+    profilo = po.ProfiloOrario(np.random.default_rng(1).gamma(2, 0.15, 8760), 2025)
+    pun = po.carica_pun_mensile(PATH_PUN)
+
+    res = po.prezza_profilo_orario(tariffe, pun, profilo, 3.0, True, 'Domestico')
+    calcolatore = ml.CalcolatoreSpesa(parametri, profilo.pun_effettivo(pun))
+    dati = profilo.profilo(3.0, True, 'Domestico')
+    for i, offerta in enumerate(offerte):
+        assert calcolatore.calcola_dettaglio(offerta, dati)['Totale Annuo'] == res['Totale Annuo'][i]
+    # il catalogo condiviso non cambia
+    assert tariffe.calcolatore.pun is ml.PUN_DEFAULT
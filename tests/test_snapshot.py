@@ -0,0 +1,92 @@
+import mmap
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from utils import analysis_offerte as ao
+from utils import mercato_libero as ml
+from utils import snapshot
+from utils.xml_benchmark import xml_sintetico
+
+BOLLETTA = {'annual_consume': 2700, 'estimated_annual_cost': 950.0,
+            'f1_consume': 900, 'f2_consume': 850, 'f3_consume': 950}
+
+
+def _copia_placet(tmp_path):
+    path = str(tmp_path / os.path.basename(ao.PATH_PLACET))
+    shutil.copy2(ao.PATH_PLACET, path)
+    return path
+
+
+def test_snapshot_placet_come_csv(tmp_path):
+    path = _copia_placet(tmp_path)
+    dal_csv = ao.parse_arera_offers(path)
+    ao.compile_arera_offers(path)
+    dallo_snapshot = snapshot.read_frame_snapshot(path)
+    assert dallo_snapshot is not None
+    pd.testing.assert_frame_equal(dallo_snapshot, ao._read_placet_csv(path))
+
+    # stessa classifica, testi riletti dal CSV compresi
+    assert ao.rank_offers(ao.parse_arera_offers(path), BOLLETTA)[:20] == ao.rank_offers(dal_csv, BOLLETTA)[:20]
+
+
+def test_colonne_numeriche_senza_copia(tmp_path):
+    path = _copia_placet(tmp_path)
+    ao.compile_arera_offers(path)
+    colonne, manifest = snap = snapshot.read_snapshot(path)
+    df = snapshot.read_frame_snapshot(path, snap)
+    numeriche = [c for c in df.columns if manifest['columns'][c]['kind'] == 'numeric'
+                 and c not in manifest['meta']['categorical']]
+    assert {'p_fix_f', 'p_vol_f1', ao.OFFSET_COLUMN} <= set(numeriche)
+    for c in numeriche:
+        assert np.shares_memory(df[c].to_numpy(), colonne[c]), c
+
+    # anche il catalogo condiviso tra le sessioni legge dalla memory-map
+    def mappa(a):
+        while getattr(a, 'base', None) is not None:
+            a = a.base
+        return a
+    catalogo, _ = ao.load_arera_offers(path)
+    assert all(isinstance(mappa(catalogo[c].to_numpy()), mmap.mmap) for c in numeriche)
+
+
+def test_snapshot_obsoleto(tmp_path):
+    path = _copia_placet(tmp_path)
+    ao.compile_arera_offers(path)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('\n')
+    assert snapshot.read_frame_snapshot(path) is None
+
+    # stesso contenuto con mtime diverso: lo SHA-256 conferma lo snapshot
+    ao.compile_arera_offers(path)
+    os.utime(path, ns=(0, 0))
+    assert snapshot.read_frame_snapshot(path) is not None
+
+
+def test_snapshot_xml_come_parsing(tmp_path):
+    path = tmp_path / 'offerte.xml'
+    path.write_text(xml_sintetico(200, seed=4), encoding='utf-8')
+    attese = ml.carica_offerte_xml(str(path))
+    ml.compile_offerte_xml(str(path))
+    assert snapshot.read_snapshot(str(path)) is not None
+    assert ml.carica_offerte_xml(str(path)) == attese
+
+
+def test_snapshot_xml_testi_vuoti_e_mancanti(tmp_path):
+    # senza COD_OFFERTA il parser mette '' (default), con il tag vuoto None
+    xml = (xml_sintetico(10, seed=6).replace('<COD_OFFERTA>OFF000002</COD_OFFERTA>', '')
+           .replace('<COD_OFFERTA>OFF000003</COD_OFFERTA>', '<COD_OFFERTA></COD_OFFERTA>'))
+    path = tmp_path / 'offerte.xml'
+    path.write_text(xml, encoding='utf-8')
+    attese = ml.carica_offerte_xml(str(path))
+    assert attese[2]['codice'] == '' and attese[3]['codice'] is None
+    ml.compile_offerte_xml(str(path))
+    assert ml.carica_offerte_xml(str(path)) == attese
+
+    # None e '' restano distinti nello snapshot
+    colonne = {'testo': ['a', '', None, float('nan')], 'numero': np.arange(4.)}
+    snapshot.write_snapshot(str(path), colonne, text_columns=('testo',))
+    letto, _ = snapshot.read_snapshot(str(path))
+    assert snapshot.text_values(letto, 'testo').tolist() == ['a', '', None, None]
@@ -0,0 +1,37 @@
+import numpy as np
+
+from utils import storico_offerte as so
+from utils.xml_benchmark import xml_sintetico
+
+
+def _cartella(tmp_path):
+    (tmp_path / 'PO_Offerte_E_MLIBERO_20250101.xml').write_text(xml_sintetico(30, seed=1), encoding='utf-8')
+    (tmp_path / 'PO_Offerte_E_MLIBERO_20250201.xml').write_text(xml_sintetico(20, seed=2), encoding='utf-8')
+    (tmp_path / 'PO_Offerte_E_MLIBERO_20250301.xml').write_text('<offerte><offerta>', encoding='utf-8')
+    return tmp_path
+
+
+def test_file_malformato_saltato(tmp_path):
+    storico, tempi, _, errori = so.ingest(str(_cartella(tmp_path)), serial=True)
+    assert len(tempi) == 3
+    assert list(errori) == [str(tmp_path / 'PO_Offerte_E_MLIBERO_20250301.xml')]
+    assert sorted(np.unique(storico['data']).tolist()) == [20250101, 20250201]
+    assert len(storico['data']) == 50
+
+
+def test_parallelo_come_sequenziale(tmp_path):
+    cartella = str(_cartella(tmp_path))
+    sequenziale, _, _, _ = so.ingest(cartella, serial=True)
+    parallelo, _, _, errori = so.ingest(cartella, workers=2)
+    assert len(errori) == 1
+    assert sequenziale.keys() == parallelo.keys()
+    for k in sequenziale:
+        np.testing.assert_array_equal(sequenziale[k], parallelo[k])
+
+
+def test_cli_confronto(tmp_path, capsys):
+    cartella = _cartella(tmp_path)
+    assert so.main([str(cartella), '--output', str(tmp_path / 'storico.npz'), '--workers', '2', '--confronta']) == 0
+    uscita = capsys.readouterr().out
+    assert 'ERRORE' in uscita and 'speedup' in uscita
+    assert len(so.carica_storico(str(tmp_path / 'storico.npz'))['data']) == 50
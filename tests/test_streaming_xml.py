@@ -0,0 +1,44 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from utils import mercato_libero as ml
+from utils.xml_benchmark import xml_sintetico
+
+
+@pytest.fixture(scope='module')
+def xml():
+    return xml_sintetico(300, seed=7)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 4096, 1 << 16])
+def test_streaming_come_lettura_completa(tmp_path, xml, chunk_size):
+    path = tmp_path / 'offerte.xml'
+    path.write_text(xml, encoding='utf-8')
+    assert list(ml.iter_offerte_xml(str(path), chunk_size)) == ml.parsa_offerte_da_stringa(xml)
+
+
+@pytest.mark.parametrize('encoding', ['latin-1', 'utf-8'])
+def test_encoding_dichiarato(tmp_path, encoding):
+    xml = xml_sintetico(20).replace('encoding="UTF-8"', f'encoding="{encoding}"').replace('Offerta 3<', 'Offerta più è<')
+    path = tmp_path / 'offerte.xml'
+    path.write_bytes(xml.encode(encoding))
+    # blocchi di 5 byte: i caratteri multibyte UTF-8 finiscono a cavallo dei blocchi
+    offerte = list(ml.iter_offerte_xml(str(path), 5))
+    assert offerte == ml.parsa_offerte_da_stringa(xml)
+    assert offerte[3]['nome'] == 'Offerta più è'
+
+
+def test_latin1_senza_dichiarazione(tmp_path):
+    xml = xml_sintetico(5).split('\n', 1)[1].replace('Offerta 1<', 'Offerta città<')
+    path = tmp_path / 'offerte.xml'
+    path.write_bytes(xml.encode('latin-1'))
+    assert [o['nome'] for o in ml.iter_offerte_xml(str(path), 64)][1] == 'Offerta città'
+
+
+def test_xml_malformato(tmp_path, xml):
+    path = tmp_path / 'offerte.xml'
+    path.write_text(xml[:len(xml) // 2], encoding='utf-8')
+    with pytest.raises(ET.ParseError):
+        list(ml.iter_offerte_xml(str(path)))
+    assert ml.carica_offerte_xml(str(path)) == []
@@ -0,0 +1,58 @@
+import itertools
+
+import pytest
+
+from utils import mercato_libero as ml
+from utils.xml_benchmark import xml_sintetico
+
+PATH_PARAMETRI = 'assets/offers/PO_Parametri_Mercato_Libero_E_20251121.csv'
+
+RIPARTIZIONI = [{"F1": 0.33, "F2": 0.33, "F3": 0.34}, {"F1": 0.6, "F23": 0.4}, {"F0": 1.0}]
+PROFILI = [
+    {'consumo_annuo': c, 'potenza': p, 'residente': r, 'target': t, 'ripartizione': rip}
+    for c, p, r, t, rip in itertools.product((900, 1800, 2700.5), (1.5, 3.0, 6.0), (True, False),
+                                             ('Domestico', 'Altri Usi'), RIPARTIZIONI)
+]
+
+
+@pytest.fixture(scope='module')
+def calcolatore():
+    return ml.CalcolatoreSpesa(ml.load_parametri(PATH_PARAMETRI), ml.PUN_DEFAULT)
+
+
+@pytest.fixture(scope='module')
+def offerte():
+    return ml.parsa_offerte_da_stringa(xml_sintetico(400, seed=3))
+
+
+def _come_scalare(tariffe, calcolatore, offerte, profilo):
+    voci = tariffe.calcola(profilo)
+    for i, offerta in enumerate(offerte):
+        attese = calcolatore.calcola_dettaglio(offerta, profilo)
+        assert {k: float(voci[k][i]) for k in ml.VOCI} == attese, (offerta['codice'], profilo)
+
+
+@pytest.mark.parametrize('profilo', PROFILI)
+def test_compilato_come_calcolo_scalare(calcolatore, offerte, profilo):
+    _come_scalare(calcolatore.compila(offerte), calcolatore, offerte, profilo)
+
+
+def test_ricompilazione_incrementale(calcolatore, offerte):
+    chiavi = [o['codice'] for o in offerte]
+    precedente = calcolatore.compila(offerte, chiavi)
+    # metà delle offerte cambia contenuto (e chiave), l'ordine si inverte
+    modificate = [dict(o, p_fix_comm=o['p_fix_comm'] + 7) if i % 2 else o for i, o in enumerate(offerte)][::-1]
+    nuove_chiavi = [o['codice'] + ('*' if i % 2 else '') for i, o in enumerate(offerte)][::-1]
+    tariffe = calcolatore.compila(modificate, nuove_chiavi, precedente)
+    assert tariffe.compilate == len(offerte) // 2
+    for profilo in PROFILI[::7]:
+        _come_scalare(tariffe, calcolatore, modificate, profilo)
+
+
+def test_con_pun(calcolatore, offerte):
+    pun = {'F1': 0.151, 'F2': 0.137, 'F3': 0.118}
+    tariffe = calcolatore.compila(offerte)
+    altre = tariffe.con_pun(pun)
+    for profilo in PROFILI[::5]:
+        _come_scalare(altre, ml.CalcolatoreSpesa(calcolatore.p, pun), offerte, profilo)
+    assert tariffe.calcolatore.pun is ml.PUN_DEFAULT
@@ -1,4 +1,21 @@
+import csv
+import os
+from functools import lru_cache
+
+import numpy as np
 import pandas as pd
+from .catalog_registry import registry
+from .snapshot import read_frame_snapshot, write_frame_snapshot
+from .offer_index import LowerEnvelopeIndex
+from .geo_index import GeoIndex, PATH_COMUNI, load_comuni, resolve_location
+
+def _prezzo(valore):
+    """Prezzo della riga come float (NaN se mancante o non numerico)"""
+    try:
+        return float(valore) if pd.notna(valore) else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
 
 def extract_price_from_row(row, user_has_fasce=False):
     """
@@ -29,39 +46,26 @@ def extract_price_from_row(row, user_has_fasce=False):
         
         # 2. PREZZO ENERGIA (€/kWh)
         # Priorità: trioraria > bioraria > monoraria FIXME
-        
-        # Se utente ha fasce F1/F2/F3, usa prezzo triorario
+        # Una struttura si usa solo se ha tutti i prezzi finiti (come _strutture)
+        p_f1 = _prezzo(row.get('p_vol_f1'))
+        p_f2 = _prezzo(row.get('p_vol_f2', p_f1))
+        p_f3 = _prezzo(row.get('p_vol_f3', p_f2))
+        p_bf1 = _prezzo(row.get('p_vol_bf1'))
+        p_bf23 = _prezzo(row.get('p_vol_bf23', p_bf1))
+        p_mono = _prezzo(row.get('p_vol_mono'))
+        tri, bi, mono = _strutture(p_f1, p_f2, p_f3, p_bf1, p_bf23, p_mono)
+
+        # Calcola media ponderata fasce (F1:33%, F2:33%, F3:34% tipico)
+        trioraria = (p_f1 * 0.33) + (p_f2 * 0.33) + (p_f3 * 0.34)
+        # Bioraria: media ponderata (F1:46%, F2+F3:54%)
+        bioraria = (p_bf1 * 0.46) + (p_bf23 * 0.54)
+
+        # Se utente ha fasce F1/F2/F3, usa prezzo triorario; senza fasce, monoraria o media
         if user_has_fasce:
-            if pd.notna(row.get('p_vol_f1')) and pd.notna(row.get('p_vol_f2')):
-                # Calcola media ponderata fasce (F1:33%, F2:33%, F3:34% tipico)
-                p_f1 = float(row['p_vol_f1'])
-                p_f2 = float(row.get('p_vol_f2', p_f1))
-                p_f3 = float(row.get('p_vol_f3', p_f2))
-                prezzo_kwh = (p_f1 * 0.33) + (p_f2 * 0.33) + (p_f3 * 0.34)
-            elif pd.notna(row.get('p_vol_bf1')):
-                # Bioraria: media ponderata (F1:46%, F2+F3:54%)
-                p_bf1 = float(row['p_vol_bf1'])
-                p_bf23 = float(row.get('p_vol_bf23', p_bf1))
-                prezzo_kwh = (p_bf1 * 0.46) + (p_bf23 * 0.54)
-            elif pd.notna(row.get('p_vol_mono')):
-                prezzo_kwh = float(row['p_vol_mono'])
-            else:
-                prezzo_kwh = 0.12  # Default
+            ordine = [(tri, trioraria), (bi, bioraria), (mono, p_mono)]
         else:
-            # Senza fasce, usa monoraria o media
-            if pd.notna(row.get('p_vol_mono')):
-                prezzo_kwh = float(row['p_vol_mono'])
-            elif pd.notna(row.get('p_vol_bf1')):
-                p_bf1 = float(row['p_vol_bf1'])
-                p_bf23 = float(row.get('p_vol_bf23', p_bf1))
-                prezzo_kwh = (p_bf1 * 0.46) + (p_bf23 * 0.54)
-            elif pd.notna(row.get('p_vol_f1')):
-                p_f1 = float(row['p_vol_f1'])
-                p_f2 = float(row.get('p_vol_f2', p_f1))
-                p_f3 = float(row.get('p_vol_f3', p_f2))
-                prezzo_kwh = (p_f1 * 0.33) + (p_f2 * 0.33) + (p_f3 * 0.34)
-            else:
-                prezzo_kwh = 0.12  # Default
+            ordine = [(mono, p_mono), (bi, bioraria), (tri, trioraria)]
+        prezzo_kwh = next((prezzo for valida, prezzo in ordine if valida), 0.12)  # Default
         
         return prezzo_kwh, costo_fisso, is_fixed
     
@@ -69,108 +73,542 @@ def extract_price_from_row(row, user_has_fasce=False):
         return 0.12, 80.0, False  # Fallback
 
 
-def load_arera_offers():
-    """Carica offerte ARERA con cache"""
+PATH_PLACET = './assets/offers/PO_Offerte_E_PLACET_20251113.csv'
+
+
+def catalog_version(path=PATH_PLACET):
+    """Impronta (SHA-256) del catalogo caricato: cambia quando il file viene ricaricato"""
+    return registry.fingerprint(path)
+
+
+# Colonne usate dal motore di classifica; le altre del CSV non vengono caricate
+ENGINE_COLUMNS = ('denominazione', 'nome_offerta', 'tipo_cliente', 'tipo_offerta',
+                  'p_fix_f', 'p_fix_v', 'p_vol_f1', 'p_vol_f2', 'p_vol_f3',
+                  'p_vol_bf1', 'p_vol_bf23', 'p_vol_mono', 'regione', 'provincia', 'comune')
+# Testi con pochi valori distinti: categorie (codici interi + dizionario)
+CATEGORY_COLUMNS = ('denominazione', 'tipo_cliente', 'tipo_offerta', 'regione', 'provincia', 'comune')
+# Testi solo da mostrare: riletti dal CSV per le sole righe visualizzate
+DISPLAY_COLUMNS = ('cod_offerta', 'url_offerta')
+OFFSET_COLUMN = '_offset_csv'
+# Prezzi €/kWh in float32: nel CSV hanno al più 6 decimali e sotto 8 €/kWh
+# l'arrotondamento a 6 decimali riporta esattamente il float64 originale.
+# Le quote fisse (fino a centinaia di €) restano float64.
+COMPACT_PRICE_COLUMNS = ('p_vol_f1', 'p_vol_f2', 'p_vol_f3', 'p_vol_bf1', 'p_vol_bf23', 'p_vol_mono')
+PRICE_DECIMALS = 6
+
+
+def _row_offsets(path):
+    """Offset in byte dell'inizio di ogni record del CSV (righe vuote saltate come read_csv)"""
+    offsets = []
+    with open(path, 'rb') as f:
+        pos = len(f.readline())  # intestazione
+        inizio, virgolette = None, 0
+        for line in f:
+            if inizio is None:
+                if not line.strip():
+                    pos += len(line)
+                    continue
+                inizio = pos
+            # il record finisce quando le virgolette sono bilanciate (campi su più righe)
+            virgolette += line.count(b'"')
+            pos += len(line)
+            if virgolette % 2 == 0:
+                offsets.append(inizio)
+                inizio, virgolette = None, 0
+    return np.array(offsets, dtype=np.int64)
+
+
+def _compattabile(valori):
+    finiti = valori[~np.isnan(valori)]
+    return bool((np.abs(finiti) < 8).all() and np.array_equal(np.round(finiti, PRICE_DECIMALS), finiti))
+
+
+def _read_placet_csv(path):
+    """Legge e pulisce il CSV PLACET in forma compatta (solo le colonne del motore)"""
+    df = pd.read_csv(path, usecols=lambda c: c in ENGINE_COLUMNS or c in DISPLAY_COLUMNS,
+                     dtype={c: 'category' for c in CATEGORY_COLUMNS})
+
+    # Testi da mostrare: resta solo l'offset del record nel file
+    offsets = _row_offsets(path)
+    if len(offsets) == len(df):
+        df[OFFSET_COLUMN] = offsets
+        df = df.drop(columns=[c for c in DISPLAY_COLUMNS if c in df.columns])
+    
+    # Pulizia dati
+    df = df.dropna(subset=['denominazione', 'nome_offerta'])
+    
+    # Converti prezzi in float
+    # FIXME ATTENZIONE: se ci sono più colonne attive per fasce (tri, bi, mono), significa che l'offerta le supporta tutte separatamente
+    price_columns = ['p_fix_f', 'p_fix_v', 'p_vol_f1', 'p_vol_f2', 'p_vol_f3', 
+                    'p_vol_bf1', 'p_vol_bf23', 'p_vol_mono']
+    for col in price_columns:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+            if col in COMPACT_PRICE_COLUMNS and _compattabile(df[col].to_numpy(dtype=float)):
+                df[col] = df[col].astype(np.float32)
+    return df
+
+
+def parse_arera_offers(path=PATH_PLACET):
+    """Catalogo PLACET dallo snapshot binario se valido, altrimenti dal CSV (senza cache)"""
+    df = read_frame_snapshot(path)
+    if df is None:
+        df = _read_placet_csv(path)
+    # sorgente da cui rileggere i testi da mostrare (vedi display_value)
+    df.attrs['source'] = (os.path.abspath(path), os.stat(path).st_mtime_ns)
+    return df
+
+
+def footprint(df) -> float:
+    """Memoria occupata dal catalogo in byte per offerta"""
+    return float(df.memory_usage(deep=True).sum()) / max(1, len(df))
+
+
+@lru_cache(maxsize=4096)
+def _display_row(path, mtime_ns, offset):
+    with open(path, encoding='utf-8', newline='') as f:
+        intestazione = next(csv.reader(f))
+        f.seek(offset)
+        return dict(zip(intestazione, next(csv.reader(f))))
+
+
+def display_value(df, riga, col):
+    """
+    Valore di una colonna di testo per la riga (posizione nel DataFrame).
+    Le DISPLAY_COLUMNS non sono in memoria: si rilegge il record dal CSV
+    (solo per le righe effettivamente mostrate). None se la colonna non esiste.
+    """
+    if col in df.columns:
+        return df[col].iloc[riga]
+    if col not in DISPLAY_COLUMNS or OFFSET_COLUMN not in df.columns or 'source' not in df.attrs:
+        return None
+    path, mtime_ns = df.attrs['source']
+    valore = _display_row(path, mtime_ns, int(df[OFFSET_COLUMN].iloc[riga])).get(col, '')
+    return valore if valore != '' else np.nan
+
+
+def compile_arera_offers(path=PATH_PLACET):
+    """Compila il CSV PLACET in uno snapshot binario (vedi utils.snapshot)"""
+    return write_frame_snapshot(path, _read_placet_csv(path))
+
+
+def load_arera_offers(path=PATH_PLACET):
+    """
+    Carica offerte ARERA dal registro condiviso: il CSV viene parsato una volta
+    per processo e ricaricato solo se il file cambia. Il DataFrame è condiviso
+    tra le sessioni, va trattato in sola lettura.
+    """
     try:
         #FIXME per diverse versioni del file CSV
-        df = pd.read_csv('./assets/offers/PO_Offerte_E_PLACET_20251113.csv')
-        
-        # Pulizia dati
-        df = df.dropna(subset=['denominazione', 'nome_offerta'])
-        
-        # Converti prezzi in float
-        # FIXME ATTENZIONE: se ci sono più colonne attive per fasce (tri, bi, mono), significa che l'offerta le supporta tutte separatamente
-        price_columns = ['p_fix_f', 'p_fix_v', 'p_vol_f1', 'p_vol_f2', 'p_vol_f3', 
-                        'p_vol_bf1', 'p_vol_bf23', 'p_vol_mono']
-        for col in price_columns:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-        
-        return df, None
+        df = registry.get(path, parse_arera_offers)
+        return df.copy(deep=False), None
     except FileNotFoundError:
         return None, "File CSV offerte non trovato!"
     except Exception as e:
         return None, f"Errore caricamento: {str(e)}"
 
 
-def find_best_offers(df:pd.DataFrame | None, my_bill_data, top_n=10) -> list:
+def _price_column(df, col, fallback=None):
+    """Colonna prezzi come array float; se manca usa la colonna di fallback (come row.get)"""
+    if col in df.columns:
+        if df[col].dtype == np.float32:
+            # prezzo compattato: i decimali del CSV si ricostruiscono esattamente
+            return np.round(df[col].to_numpy(dtype=float), PRICE_DECIMALS)
+        return pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float)
+    if fallback is not None:
+        return fallback
+    return np.full(len(df), np.nan)
+
+
+def _band_columns(df):
+    p_f1 = _price_column(df, 'p_vol_f1')
+    p_f2 = _price_column(df, 'p_vol_f2', p_f1)
+    p_f3 = _price_column(df, 'p_vol_f3', p_f2)
+    p_bf1 = _price_column(df, 'p_vol_bf1')
+    p_bf23 = _price_column(df, 'p_vol_bf23', p_bf1)
+    p_mono = _price_column(df, 'p_vol_mono')
+    return p_f1, p_f2, p_f3, p_bf1, p_bf23, p_mono
+
+
+def _strutture(p_f1, p_f2, p_f3, p_bf1, p_bf23, p_mono):
+    """Offerte con tutti i prezzi finiti per la struttura trioraria, bioraria e monoraria"""
+    return (np.isfinite(p_f1) & np.isfinite(p_f2) & np.isfinite(p_f3),
+            np.isfinite(p_bf1) & np.isfinite(p_bf23),
+            np.isfinite(p_mono))
+
+
+def band_price_matrix(df):
     """
-    Trova migliori offerte dal CSV ARERA
-    Usa colonne reali: denominazione, nome_offerta, p_fix_*, p_vol_*
+    Prezzo €/kWh di ogni offerta in ciascuna fascia F1/F2/F3, matrice (n, 3).
+    Per ogni offerta si sceglie la struttura che applica (trioraria > bioraria > monoraria,
+    come extract_price_from_row con fasce) e la si espande sulle tre fasce:
+    il prezzo per qualsiasi ripartizione dei consumi è poi un solo prodotto matrice-vettore.
+    Una struttura si usa solo se ha tutti i prezzi (es. F1 e F2 senza F3 passa alla bioraria).
     """
+    p_f1, p_f2, p_f3, p_bf1, p_bf23, p_mono = _band_columns(df)
+    trioraria = np.column_stack([p_f1, p_f2, p_f3])
+    bioraria = np.column_stack([p_bf1, p_bf23, p_bf23])
+    monoraria = np.column_stack([p_mono, p_mono, p_mono])
 
-    if df is None or df.empty:
-        return []
-    
-    consumi_annui = my_bill_data['annual_consume']
-    
-    # Usa totale bolletta se disponibile, altrimenti stima
-#    if my_bill_data.get('totale_bolletta'):
-#        spesa_mensile = my_bill_data['totale_bolletta']
-#        spesa_attuale = spesa_mensile * 12
-#    else:
-#        spesa_attuale = my_bill_data.get('spesa_annua', 600)
-#    
-    # Check se utente ha fasce orarie (per calcolo più preciso)
-#    user_has_fasce = all([ #TODO
-#        my_bill_data.get('consumo_f1'),
-#        my_bill_data.get('consumo_f2'),
-#        my_bill_data.get('consumo_f3')
-#    ])
-
-    user_has_fasce = False
+    struttura = np.select(list(_strutture(p_f1, p_f2, p_f3, p_bf1, p_bf23, p_mono)), [0, 1, 2], default=3)
+    matrice = np.full((len(df), 3), 0.12)  # Default
+    for k, prezzi in enumerate((trioraria, bioraria, monoraria)):
+        matrice[struttura == k] = prezzi[struttura == k]
+    return matrice
+
+
+BAND_FIELDS = ('f1_consume', 'f2_consume', 'f3_consume')
+
+
+def band_consumption(my_bill_data):
+    """Consumi F1/F2/F3 della bolletta come vettore (None se non disponibili)"""
+    try:
+        consumi = np.array([float(my_bill_data.get(k) or 0) for k in BAND_FIELDS])
+    except (TypeError, ValueError):
+        return None
+    if (consumi < 0).any() or consumi.sum() <= 0:
+        return None
+    return consumi
+
+
+def band_weighted_price(bande, consumi_fasce):
+    """Prezzo medio €/kWh pesato sui consumi per fascia: (bande @ consumi) / consumo totale"""
+    return (bande @ consumi_fasce) / consumi_fasce.sum()
+
+
+def extract_prices(df, user_has_fasce=False, consumi_fasce=None):
+    """
+    Versione colonnare di extract_price_from_row: calcola prezzo kWh, costo fisso
+    e tipo prezzo per tutte le righe insieme, con le stesse regole di fallback.
+    Con `consumi_fasce` (consumi F1/F2/F3 dell'utente) il prezzo è pesato sui consumi
+    reali invece che sui pesi fissi 33/33/34 e 46/54.
+    Restituisce tre array (prezzo_kwh, costo_fisso, is_fixed).
+    """
+    n = len(df)
+    if 'tipo_offerta' in df.columns:
+        tipo_offerta = df['tipo_offerta'].astype(str).str.lower()
+        is_fixed = tipo_offerta.str.contains('fiss', regex=False, na=False).to_numpy(dtype=bool)
+    else:
+        is_fixed = np.zeros(n, dtype=bool)
+
+    # 1. QUOTA FISSA (costo annuale)
+    p_fix_f = _price_column(df, 'p_fix_f')
+    p_fix_v = _price_column(df, 'p_fix_v')
+    costo_fisso = np.where(is_fixed & ~np.isnan(p_fix_f), p_fix_f,
+                           np.where(~np.isnan(p_fix_v), p_fix_v, 80.0))
+
+    # 2. PREZZO ENERGIA (€/kWh)
+    if consumi_fasce is not None:
+        return band_weighted_price(band_price_matrix(df), consumi_fasce), costo_fisso, is_fixed
+
+    p_f1, p_f2, p_f3, p_bf1, p_bf23, p_mono = _band_columns(df)
+
+    trioraria = (p_f1 * 0.33) + (p_f2 * 0.33) + (p_f3 * 0.34)
+    bioraria = (p_bf1 * 0.46) + (p_bf23 * 0.54)
+
+    tri, bi, mono = _strutture(p_f1, p_f2, p_f3, p_bf1, p_bf23, p_mono)
+    if user_has_fasce:
+        condizioni = [tri, bi, mono]
+        scelte = [trioraria, bioraria, p_mono]
+    else:
+        condizioni = [mono, bi, tri]
+        scelte = [p_mono, bioraria, trioraria]
+    prezzo_kwh = np.select(condizioni, scelte, default=0.12)
+
+    return prezzo_kwh, costo_fisso, is_fixed
+
+
+def _righe_valide(df):
+    """Righe con fornitore e nome offerta presenti"""
+    validi = np.ones(len(df), dtype=bool)
+    for col in ('denominazione', 'nome_offerta'):
+        if col in df.columns:
+            validi &= (df[col].notna() & (df[col].astype(str) != 'nan')).to_numpy(dtype=bool)
+    return validi
+
+
+def _prezzabili(righe, prezzo_kwh, costo_fisso, is_fixed, *altri):
+    """Toglie le offerte con prezzo o quota fissa non finiti (non vanno in classifica)"""
+    finiti = np.isfinite(prezzo_kwh) & np.isfinite(costo_fisso)
+    if finiti.all():
+        return (righe, prezzo_kwh, costo_fisso, is_fixed) + altri
+    return tuple(a[finiti] for a in (righe, prezzo_kwh, costo_fisso, is_fixed) + altri)
+
+
+def load_geo_index(path=PATH_PLACET):
+    """Indice geografico costruito una volta per caricamento del catalogo"""
+    return registry.get(path, lambda p: GeoIndex(registry.get(p, parse_arera_offers)), namespace='geo')
+
+
+def offers_in_area(city, path=PATH_PLACET):
+    """Posizioni delle offerte attivabili nella città della bolletta (nazionali + locali)"""
+    comuni = registry.get(PATH_COMUNI, load_comuni, namespace='comuni') if os.path.exists(PATH_COMUNI) else {}
+    return load_geo_index(path).candidates(**resolve_location(city, comuni))
+
+
+def best_consumption_ranges(df, index) -> list:
+    """Per ogni offerta dell'inviluppo, l'intervallo di consumo annuo in cui è la più economica"""
+    return [{
+        'fornitore': str(df['denominazione'].iloc[riga]),
+        'offerta': str(df['nome_offerta'].iloc[riga]),
+        'da_kwh': da,
+        'a_kwh': a,
+    } for riga, da, a in index.ranges()]
+
+
+TEXT_COLUMNS = ('denominazione', 'nome_offerta', 'tipo_offerta', 'cod_offerta', 'url_offerta')
+
+
+def offer_dict(df, riga, prezzo_kwh, costo_fisso, is_fixed, costo_energia_anno, spesa_attuale, testi=None) -> dict:
+    """
+    Dizionario di un'offerta in classifica (riga = posizione nel DataFrame).
+    `testi` (colonna -> array) evita gli accessi .iloc quando si costruiscono molti dizionari.
+    """
+    costo_totale_anno = costo_energia_anno + costo_fisso
+    r = float(spesa_attuale - costo_totale_anno)
+    risparmio_pct = (r / spesa_attuale * 100) if spesa_attuale > 0 else 0
     
-    results = []
+    # Score (0-100) basato su risparmio
+    score = 50 + (r / 10)
+    score = max(0, min(100, score))
+
+    def testo(col, default):
+        if testi is not None and col in testi:
+            return str(testi[col][riga])
+        valore = display_value(df, riga, col)
+        return str(valore) if valore is not None else default
     
-    # Analizza tutte le offerte
-    for idx, row in df.iterrows():
-        try:
-            # Estrai dati offerta
-            fornitore = str(row.get('denominazione', 'N/A'))
-            offerta = str(row.get('nome_offerta', 'N/A'))
-            tipo_offerta = str(row.get('tipo_offerta', 'N/A'))
-            cod_offerta = str(row.get('cod_offerta', ''))
-            url_offerta = str(row.get('url_offerta', ''))
-            
-            # Skip se dati mancanti
-            if fornitore == 'nan' or offerta == 'nan':
-                continue
-            
-            # Estrai prezzi usando colonne reali
-            prezzo_kwh, costo_fisso, is_fixed = extract_price_from_row(row, user_has_fasce)
-            
-            # Calcola costo totale
-            costo_energia_anno = consumi_annui * prezzo_kwh
-            costo_totale_anno = costo_energia_anno + costo_fisso
-            
-            # Calcola risparmio
-            risparmio = my_bill_data['estimated_annual_cost'] - costo_totale_anno
-            risparmio_pct = (risparmio / my_bill_data['estimated_annual_cost'] * 100) if my_bill_data['estimated_annual_cost'] > 0 else 0
-            
-            # Score (0-100) basato su risparmio
-            score = 50 + (risparmio / 10)
-            score = max(0, min(100, score))
-            
-            results.append({
-                'fornitore': fornitore,
-                'offerta': offerta,
-                'tipo_offerta': tipo_offerta,
-                'tipo_prezzo': 'Fisso' if is_fixed else 'Variabile',
-                'prezzo_kwh': round(prezzo_kwh, 4),
-                'costo_fisso_anno': round(costo_fisso, 2),
-                'costo_energia_anno': round(costo_energia_anno, 2),
-                'costo_totale_anno': round(costo_totale_anno, 2),
-                'risparmio_euro': round(risparmio, 2),
-                'risparmio_pct': round(risparmio_pct, 1),
-                'score': round(score, 1),
-                'consigliata': risparmio > 100,
-                'cod_offerta': cod_offerta,
-                'url_offerta': url_offerta
-            })
-        
-        except Exception as e:
-            continue
+    return {
+        'fornitore': testo('denominazione', 'N/A'),
+        'offerta': testo('nome_offerta', 'N/A'),
+        'tipo_offerta': testo('tipo_offerta', 'N/A'),
+        'tipo_prezzo': 'Fisso' if is_fixed else 'Variabile',
+        'prezzo_kwh': round(float(prezzo_kwh), 4),
+        'costo_fisso_anno': round(float(costo_fisso), 2),
+        'costo_energia_anno': round(float(costo_energia_anno), 2),
+        'costo_totale_anno': round(float(costo_totale_anno), 2),
+        'risparmio_euro': round(r, 2),
+        'risparmio_pct': round(risparmio_pct, 1),
+        'score': round(score, 1),
+        'consigliata': r > 100,
+        'cod_offerta': testo('cod_offerta', ''),
+        'url_offerta': testo('url_offerta', '')
+    }
+
+
+class OfferRanking:
+    """
+    Classifica delle offerte per risparmio decrescente, calcolata per colonne.
+    L'ordinamento è parziale (argpartition) e si estende solo quando servono
+    più righe; i dizionari delle offerte vengono costruiti solo per le righe lette.
+    Supporta len(), indici e slice come una lista, più page() e stats().
+    """
+
+    def __init__(self, df, righe, prezzo_kwh, costo_fisso, is_fixed, consumi_annui, spesa_attuale):
+        # righe: posizioni nel DataFrame; gli array prezzi sono allineati a righe
+        self._df = df
+        self._righe = righe
+        self._prezzo_kwh = prezzo_kwh
+        self._costo_fisso = costo_fisso
+        self._is_fixed = is_fixed
+        self._spesa_attuale = spesa_attuale
+
+        # Calcola costo totale e risparmio
+        self._costo_energia = consumi_annui * self._prezzo_kwh
+        self._costo_totale = self._costo_energia + self._costo_fisso
+        self._risparmio = spesa_attuale - self._costo_totale
+        # Chiave di ordinamento: risparmio arrotondato, parità in ordine di catalogo
+        self._chiave = -np.round(self._risparmio, 2)
+        self._ordinate = np.empty(0, dtype=np.intp)
+        self._indice = None
+
+    def __len__(self):
+        return len(self._righe)
+
+    def _prefisso(self, k):
+        """Posizioni delle prime k offerte in classifica (ordinamento stabile)"""
+        n = len(self)
+        k = min(k, n)
+        if k <= len(self._ordinate):
+            return self._ordinate[:k]
+        if k >= n:
+            sel = np.arange(n)
+        else:
+            # Selezione parziale: tutte le chiavi sotto la soglia più le parità in ordine
+            soglia = self._chiave[np.argpartition(self._chiave, k - 1)[:k]].max()
+            sotto = np.flatnonzero(self._chiave < soglia)
+            pari = np.flatnonzero(self._chiave == soglia)[:k - len(sotto)]
+            sel = np.sort(np.concatenate([sotto, pari]))
+        self._ordinate = sel[np.argsort(self._chiave[sel], kind='stable')]
+        return self._ordinate
+
+    def _offerta(self, pos):
+        return offer_dict(self._df, self._righe[pos], self._prezzo_kwh[pos], self._costo_fisso[pos],
+                          self._is_fixed[pos], self._costo_energia[pos], self._spesa_attuale)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if start >= stop and step > 0:
+                return []
+            ordinate = self._prefisso(max(start, stop) + (1 if step < 0 else 0))
+            return [self._offerta(ordinate[i]) for i in range(start, stop, step)]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError('offerta fuori classifica')
+        return self._offerta(self._prefisso(item + 1)[item])
+
+    def page(self, numero, dimensione=10) -> list:
+        """Offerte della pagina `numero` (da 0)"""
+        return self[numero * dimensione:(numero + 1) * dimensione]
+
+    def n_pages(self, dimensione=10) -> int:
+        return -(-len(self) // dimensione)
+
+    def offer_index(self, livelli=10) -> LowerEnvelopeIndex:
+        """
+        Indice dell'inviluppo inferiore dei costi annui (consumo * prezzo_kwh + costo_fisso)
+        sulle stesse offerte e con gli stessi prezzi della classifica (zona, fasce della bolletta):
+        migliore offerta e top-k per qualsiasi consumo in tempo logaritmico.
+        Le righe dell'indice sono posizioni nel DataFrame.
+        """
+        if self._indice is None:
+            self._indice = LowerEnvelopeIndex(self._prezzo_kwh, self._costo_fisso, self._righe, livelli=livelli)
+        return self._indice
+
+    def stats(self) -> dict:
+        """Statistiche aggregate su tutta la classifica, in un solo passaggio per colonne"""
+        risparmio = -self._chiave
+        # le offerte senza prezzo finito non entrano nei valori aggregati
+        risparmio = risparmio[np.isfinite(risparmio)]
+        if len(risparmio) == 0:
+            return {'count': len(self), 'max_saving': 0.0, 'avg_saving': 0.0, 'recommended': 0,
+                    'fixed': int(np.count_nonzero(self._is_fixed))}
+        return {
+            'count': len(self),
+            'max_saving': float(risparmio.max()),
+            'avg_saving': float(risparmio.mean()),
+            'recommended': int(np.count_nonzero(self._risparmio > 100)),
+            'fixed': int(np.count_nonzero(self._is_fixed)),
+        }
+
+
+class IncrementalRanking(OfferRanking):
+    """
+    Classifica di sessione aggiornabile campo per campo.
+    Tiene i coefficienti di ogni offerta (matrice prezzi per fascia, prezzo senza fasce,
+    quota fissa) e il prodotto prezzi x consumi per fascia: la modifica di un input
+    aggiorna i costi con un solo prodotto matrice (n, 3) x vettore e l'ordine precedente
+    viene riparato con un ordinamento adattivo (timsort, quasi lineare su input quasi ordinato).
+    Il prodotto si ricalcola intero, non per differenza: costa lo stesso e dà esattamente
+    i valori di rank_offers (anche sugli arrotondamenti al mezzo centesimo).
+    """
+
+    def __init__(self, df, my_bill_data, candidate=None):
+        validi = _righe_valide(df)
+        if candidate is not None:
+            zona = np.zeros(len(df), dtype=bool)
+            zona[candidate] = True
+            validi &= zona
+        righe = np.flatnonzero(validi)
+        offerte = df if len(righe) == len(df) else df.iloc[righe]
+
+        self.candidate = candidate
+        prezzo_mono, costo_fisso, is_fixed = extract_prices(offerte)
+        bande = band_price_matrix(offerte)
+        prezzo_mono = np.where(np.isfinite(bande).all(axis=1), prezzo_mono, np.nan)
+        righe, self._prezzo_mono, costo_fisso, is_fixed, self._bande = _prezzabili(
+            righe, prezzo_mono, costo_fisso, is_fixed, bande)
+        self._consumi_fasce = np.array([float(my_bill_data.get(k) or 0) for k in BAND_FIELDS])
+        self._consumo_annuo = float(my_bill_data['annual_consume'])
+        self._prodotto = self._bande @ self._consumi_fasce
+
+        super().__init__(df, righe, self._prezzo_effettivo(), costo_fisso, is_fixed,
+                         self._consumo_annuo, float(my_bill_data['estimated_annual_cost']))
+        self._ordinate = np.lexsort((np.arange(len(righe)), self._chiave))
+
+    def _prezzo_effettivo(self):
+        # stesse regole di band_consumption / band_weighted_price
+        totale = self._consumi_fasce.sum()
+        if (self._consumi_fasce < 0).any() or totale <= 0:
+            return self._prezzo_mono
+        return self._prodotto / totale
+
+    def _riordina(self):
+        self._prezzo_kwh = self._prezzo_effettivo()
+        self._indice = None
+        self._costo_energia = self._consumo_annuo * self._prezzo_kwh
+        self._costo_totale = self._costo_energia + self._costo_fisso
+        self._risparmio = self._spesa_attuale - self._costo_totale
+        self._chiave = -np.round(self._risparmio, 2)
+
+        ordinate = self._ordinate[np.argsort(self._chiave[self._ordinate], kind='stable')]
+        # Parità: come nell'ordinamento completo vanno in ordine di catalogo
+        chiavi = self._chiave[ordinate]
+        if ((chiavi[1:] == chiavi[:-1]) & (ordinate[1:] < ordinate[:-1])).any():
+            ordinate = np.lexsort((np.arange(len(self)), self._chiave))
+        self._ordinate = ordinate
+
+    def update(self, campo, valore) -> bool:
+        """Applica la modifica di un campo della bolletta; False se il campo non incide sulla classifica"""
+        if campo not in BAND_FIELDS + ('annual_consume', 'estimated_annual_cost'):
+            return False
+        valore = float(valore or 0)
+        if campo in BAND_FIELDS:
+            self._consumi_fasce[BAND_FIELDS.index(campo)] = valore
+            self._prodotto = self._bande @ self._consumi_fasce
+        elif campo == 'annual_consume':
+            self._consumo_annuo = valore
+        else:
+            self._spesa_attuale = valore
+        self._riordina()
+        return True
+
+    def _valore(self, campo):
+        if campo in BAND_FIELDS:
+            return self._consumi_fasce[BAND_FIELDS.index(campo)]
+        return self._consumo_annuo if campo == 'annual_consume' else self._spesa_attuale
+
+    def sync(self, my_bill_data) -> int:
+        """Allinea lo stato alla bolletta aggiornando solo i campi cambiati; restituisce quanti"""
+        cambiati = 0
+        for campo in BAND_FIELDS + ('annual_consume', 'estimated_annual_cost'):
+            if float(my_bill_data.get(campo) or 0) != self._valore(campo):
+                self.update(campo, my_bill_data.get(campo))
+                cambiati += 1
+        return cambiati
+
+
+def rank_offers(df:pd.DataFrame | None, my_bill_data, candidate=None) -> OfferRanking:
+    """
+    Classifica di tutte le offerte del CSV ARERA per la bolletta dell'utente.
+    Usa colonne reali: denominazione, nome_offerta, p_fix_*, p_vol_*
+    `candidate` (posizioni, es. da GeoIndex.candidates) limita le righe prima del calcolo prezzi.
+    """
+    if df is None or df.empty:
+        df = pd.DataFrame()
+        vuoto = np.empty(0)
+        return OfferRanking(df, np.empty(0, dtype=np.intp), vuoto, vuoto, vuoto.astype(bool), 0, 0)
     
-    # Ordina per risparmio
-    results = sorted(results, key=lambda x: x['risparmio_euro'], reverse=True)
-    return results[:top_n]
+    # Se la bolletta ha i consumi per fascia, prezzo pesato sui consumi reali F1/F2/F3
+    consumi_fasce = band_consumption(my_bill_data)
+
+    # Skip se dati mancanti o fuori zona, poi estrai prezzi solo per le righe rimaste
+    validi = _righe_valide(df)
+    if candidate is not None:
+        zona = np.zeros(len(df), dtype=bool)
+        zona[candidate] = True
+        validi &= zona
+    righe = np.flatnonzero(validi)
+    prezzo_kwh, costo_fisso, is_fixed = extract_prices(df if len(righe) == len(df) else df.iloc[righe], consumi_fasce=consumi_fasce)
+    righe, prezzo_kwh, costo_fisso, is_fixed = _prezzabili(righe, prezzo_kwh, costo_fisso, is_fixed)
+    return OfferRanking(df, righe, prezzo_kwh, costo_fisso, is_fixed,
+                        my_bill_data['annual_consume'], my_bill_data['estimated_annual_cost'])
+
+
+def find_best_offers(df:pd.DataFrame | None, my_bill_data, top_n=10) -> list:
+    """
+    Trova migliori offerte dal CSV ARERA (le prime top_n di rank_offers)
+    """
+    return rank_offers(df, my_bill_data)[:top_n]
@@ -0,0 +1,136 @@
+"""
+Punteggio in batch di molti profili cliente contro tutto il catalogo PLACET.
+
+I profili (stesso formato di `pdf_content`: annual_consume, f1/f2/f3_consume,
+client_type, resident, estimated_annual_cost, più un `id` facoltativo) vengono
+valutati a blocchi come un'unica matrice N x M di costi, con le stesse regole
+di prezzo di rank_offers: prezzo pesato sulle quote F1/F2/F3 reali quando il
+profilo ha i consumi per fascia, regole di extract_price_from_row altrimenti.
+
+Uso: python -m utils.batch_scoring profili.jsonl risultati.jsonl [--top-k 10] [--chunk-size N]
+"""
+import argparse
+import json
+import sys
+from itertools import islice
+
+import numpy as np
+
+from . import analysis_offerte as ao
+
+
+def _is_business(profilo):
+    return 'business' in str(profilo.get('client_type', '')).lower()
+
+
+class BatchScorer:
+    """Prezzi del catalogo calcolati una volta, poi riusati per ogni blocco di profili"""
+
+    def __init__(self, df):
+        self.df = df
+        self.testi = {c: df[c].to_numpy(dtype=object) for c in ao.TEXT_COLUMNS if c in df.columns}
+        self.righe = np.flatnonzero(ao._righe_valide(df))
+        offerte = df.iloc[self.righe]
+        # Prezzo senza fasce e matrice prezzi per fascia (M x 3)
+        self.prezzo, self.costo_fisso, self.is_fixed = ao.extract_prices(offerte)
+        self.bande = ao.band_price_matrix(offerte)
+        if 'tipo_cliente' in offerte.columns:
+            self.business = offerte['tipo_cliente'].astype(str).str.lower().str.startswith('non').to_numpy(dtype=bool)
+        else:
+            self.business = None
+
+    def score(self, profili, top_k=10) -> list:
+        """Le top_k offerte per ogni profilo del blocco (lista di liste di dizionari)"""
+        consumi = np.array([float(p['annual_consume']) for p in profili])
+        spese = np.array([float(p['estimated_annual_cost']) for p in profili])
+        consumi_fasce = [ao.band_consumption(p) for p in profili]
+        fasce = np.array([c is not None for c in consumi_fasce])
+        consumi_fasce = np.array([c if c is not None else np.ones(3) for c in consumi_fasce])
+
+        # Matrice N x M: prezzo €/kWh per profilo (consumi per fascia x prezzi per fascia),
+        # costo = consumo * prezzo + fisso
+        prezzi_fasce = (consumi_fasce @ self.bande.T) / consumi_fasce.sum(axis=1)[:, None]
+        prezzi = np.where(fasce[:, None], prezzi_fasce, self.prezzo)
+        costo_energia = consumi[:, None] * prezzi
+        risparmio = spese[:, None] - (costo_energia + self.costo_fisso)
+
+        chiave = -np.round(risparmio, 2)
+        if self.business is not None:
+            # Solo offerte per la tipologia di cliente del profilo
+            business = np.array([_is_business(p) for p in profili])
+            chiave[business[:, None] != self.business] = np.inf
+
+        # prezzi non finiti: l'offerta non entra in classifica (come _prezzabili in rank_offers)
+        chiave[np.isnan(chiave)] = np.inf
+
+        k = min(top_k, chiave.shape[1])
+        if k == 0:
+            return [[] for _ in profili]
+        # Selezione parziale come OfferRanking._prefisso: tutte le chiavi sotto la k-esima
+        # più le parità con la k-esima in ordine di catalogo (argpartition le sceglie a caso)
+        soglia = np.partition(chiave, k - 1, axis=1)[:, k - 1:k]
+        sotto = chiave < soglia
+        pari = chiave == soglia
+        scelte = sotto | (pari & (np.cumsum(pari, axis=1) <= k - sotto.sum(axis=1, keepdims=True)))
+        top = np.nonzero(scelte)[1].reshape(len(profili), k)
+        # ordine per risparmio, parità in ordine di catalogo
+        top = np.take_along_axis(top, np.argsort(np.take_along_axis(chiave, top, axis=1), axis=1, kind='stable'), axis=1)
+
+        risultati = []
+        for i, posizioni in enumerate(top):
+            risultati.append([
+                ao.offer_dict(self.df, self.righe[j], prezzi[i, j], self.costo_fisso[j],
+                              self.is_fixed[j], costo_energia[i, j], spese[i], self.testi)
+                for j in posizioni if np.isfinite(chiave[i, j])
+            ])
+        return risultati
+
+
+# Celle della matrice profili x offerte per blocco (~32 MB per matrice float64)
+CELLE_PER_BLOCCO = 4_000_000
+
+
+def score_profiles(df, profili, top_k=10, chunk_size=None):
+    """
+    Generatore di (profilo, top_k offerte) a blocchi di chunk_size profili: memoria O(chunk_size * M).
+    Senza chunk_size il blocco è dimensionato sul numero di offerte.
+    """
+    scorer = BatchScorer(df)
+    if chunk_size is None:
+        chunk_size = max(1, CELLE_PER_BLOCCO // max(1, len(scorer.righe)))
+    profili = iter(profili)
+    while True:
+        blocco = list(islice(profili, chunk_size))
+        if not blocco:
+            return
+        yield from zip(blocco, scorer.score(blocco, top_k))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classifica offerte PLACET per profili cliente in JSONL")
+    parser.add_argument('input', help="profili JSONL ('-' per stdin)")
+    parser.add_argument('output', help="risultati JSONL ('-' per stdout)")
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--chunk-size', type=int, default=None)
+    parser.add_argument('--catalog', default=ao.PATH_PLACET)
+    args = parser.parse_args(argv)
+
+    df, error = ao.load_arera_offers(args.catalog)
+    if df is None:
+        print(error, file=sys.stderr)
+        return 1
+
+    src = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+    dst = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        profili = (json.loads(riga) for riga in src if riga.strip())
+        for n, (profilo, offerte) in enumerate(score_profiles(df, profili, args.top_k, args.chunk_size)):
+            dst.write(json.dumps({'id': profilo.get('id', n), 'offerte': offerte}, ensure_ascii=False) + '\n')
+    finally:
+        if src is not sys.stdin: src.close()
+        if dst is not sys.stdout: dst.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+import hashlib
+import os
+import threading
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """SHA-256 del contenuto del file, letto a blocchi"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class _Entry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = None
+        self.mtime_ns = None
+        self.size = None
+        self.sha256 = None
+
+
+class CatalogRegistry:
+    """
+    Registro di processo per i cataloghi letti da file.
+    Ogni file viene parsato una sola volta per tutto il server e condiviso tra
+    le sessioni; viene ricaricato solo se cambia mtime/dimensione E contenuto (SHA-256).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._stats = {'hits': 0, 'misses': 0, 'reloads': 0}
+
+    def _entry(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = _Entry()
+            return self._entries[key]
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, path, loader, namespace='', incremental=False):
+        """
+        Restituisce il valore caricato da `loader(path)`, condiviso tra tutte le sessioni.
+        Il valore è in sola lettura: chi lo usa non deve modificarlo sul posto.
+        Con `incremental` il loader riceve anche il valore precedente (None al primo
+        caricamento), per ricostruire solo ciò che è cambiato: loader(path, precedente).
+        """
+        path = os.path.abspath(path)
+        entry = self._entry((namespace, path))
+        st = os.stat(path)
+
+        # Fast path senza lock: file invariato
+        if entry.value is not None and entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+            self._count('hits')
+            return entry.value
+
+        with entry.lock:
+            st = os.stat(path)
+            if entry.value is not None and entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+                # un'altra sessione l'ha appena caricato
+                self._count('hits')
+                return entry.value
+
+            digest = file_sha256(path)
+            if entry.value is not None and digest == entry.sha256:
+                # toccato ma con lo stesso contenuto: niente nuovo parsing
+                entry.mtime_ns, entry.size = st.st_mtime_ns, st.st_size
+                self._count('hits')
+                return entry.value
+
+            self._count('reloads' if entry.value is not None else 'misses')
+            entry.value = loader(path, entry.value) if incremental else loader(path)
+            entry.mtime_ns, entry.size, entry.sha256 = st.st_mtime_ns, st.st_size, digest
+            return entry.value
+
+    def fingerprint(self, path, namespace=''):
+        """SHA-256 del file attualmente caricato (None se non ancora caricato)"""
+        with self._lock:
+            entry = self._entries.get((namespace, os.path.abspath(path)))
+        return entry.sha256 if entry is not None else None
+
+    def invalidate(self, path=None):
+        """Dimentica uno o tutti i cataloghi caricati"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                path = os.path.abspath(path)
+                for key in [k for k in self._entries if k[1] == path]:
+                    del self._entries[key]
+
+    def stats(self) -> dict:
+        """Contatori hit/miss/reload e numero di cataloghi in memoria"""
+        with self._lock:
+            return {**self._stats, 'entries': len(self._entries)}
+
+
+# Unico registro condiviso da tutte le sessioni del processo
+registry = CatalogRegistry()
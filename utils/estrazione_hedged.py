@@ -0,0 +1,211 @@
+"""
+Estrazione "hedged" su più modelli: vince la prima risposta valida.
+
+La chiamata parte sul modello scelto dall'utente; se entro un ritardo basato sul p95
+delle sue latenze osservate non è arrivata una risposta valida (o la chiamata è già
+fallita), parte in parallelo un modello di riserva del catalogo. La prima risposta
+che rispetta lo schema JSON vince, le altre chiamate vengono annullate chiudendo la
+connessione in streaming (OpenRouter interrompe la generazione).
+
+Configurazione da variabili d'ambiente:
+  HEDGE_ENABLED        0 per disattivare (default 1)
+  HEDGE_MODELS         id dei modelli di riserva separati da virgola (default: il catalogo)
+  HEDGE_MAX            modelli di riserva lanciati al massimo (default 1)
+  HEDGE_DELAY          ritardo fisso in secondi (default: p95 del modello principale)
+  HEDGE_DELAY_DEFAULT  ritardo finché non ci sono abbastanza latenze osservate (default 15)
+  HEDGE_DELAY_MIN / HEDGE_DELAY_MAX  limiti del ritardo basato sul p95 (default 2 / 60)
+"""
+import os
+import queue
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .estrazione_jobs import WORKERS
+
+ABILITATO = os.environ.get('HEDGE_ENABLED', '1') != '0'
+MODELLI = [m.strip() for m in os.environ.get('HEDGE_MODELS', '').split(',') if m.strip()]
+MAX_RISERVE = int(os.environ.get('HEDGE_MAX', 1))
+RITARDO_FISSO = float(os.environ['HEDGE_DELAY']) if os.environ.get('HEDGE_DELAY') else None
+RITARDO_DEFAULT = float(os.environ.get('HEDGE_DELAY_DEFAULT', 15))
+RITARDO_MIN = float(os.environ.get('HEDGE_DELAY_MIN', 2))
+RITARDO_MAX = float(os.environ.get('HEDGE_DELAY_MAX', 60))
+CAMPIONI_MIN = 5
+
+# Le gare girano dentro i lavori della coda di estrazione (al massimo WORKERS alla volta):
+# un thread per la chiamata principale e per ogni riserva di ciascun lavoro in esecuzione
+_executor = ThreadPoolExecutor(max_workers=WORKERS * (1 + MAX_RISERVE), thread_name_prefix='hedge')
+
+
+class Annullata(Exception):
+    """Chiamata interrotta perché un altro modello ha già risposto"""
+
+
+def _interrompi(risposta):
+    """
+    Chiude il socket di una risposta in streaming letta da un altro thread: shutdown()
+    sblocca subito la lettura in corso (close() aspetterebbe il lock del lettore).
+    """
+    sock = getattr(getattr(risposta.raw, 'connection', None), 'sock', None)
+    try:
+        if sock is not None:
+            sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class Annullamento:
+    """Segnale di annullamento di una chiamata: interrompe anche le risposte in streaming registrate"""
+
+    def __init__(self):
+        self._evento = threading.Event()
+        self._lock = threading.Lock()
+        self._risposte = []
+
+    def is_set(self) -> bool:
+        return self._evento.is_set()
+
+    def registra(self, risposta):
+        with self._lock:
+            self._risposte.append(risposta)
+        if self.is_set():
+            _interrompi(risposta)
+
+    def annulla(self):
+        self._evento.set()
+        with self._lock:
+            risposte = list(self._risposte)
+        for risposta in risposte:
+            _interrompi(risposta)
+
+
+# --- Validazione sullo schema ---
+
+_TIPI = {'string': str, 'boolean': bool, 'number': (int, float)}
+
+
+def valida(risultato, schema) -> dict:
+    """Il risultato se rispetta lo schema (campi richiesti e tipi), altrimenti ValueError"""
+    if not isinstance(risultato, dict):
+        raise ValueError("la risposta non è un oggetto JSON")
+    for campo in schema['required']:
+        if campo not in risultato:
+            raise ValueError(f"campo mancante: {campo}")
+        tipo = schema['properties'][campo]['type']
+        valore = risultato[campo]
+        if not isinstance(valore, _TIPI[tipo]) or (tipo == 'number' and isinstance(valore, bool)):
+            raise ValueError(f"tipo non valido per {campo}: {valore!r}")
+    return {campo: risultato[campo] for campo in schema['properties'] if campo in risultato}
+
+
+# --- Latenze osservate per modello ---
+
+class LatenzeModelli:
+    def __init__(self, finestra=200):
+        self.finestra = finestra
+        self._lock = threading.Lock()
+        self._modelli = {}
+
+    def _voce(self, model_id):
+        return self._modelli.setdefault(model_id, {'latenze': [], 'richieste': 0, 'errori': 0, 'vinte': 0, 'annullate': 0})
+
+    def registra(self, model_id, secondi=None, esito='ok'):
+        with self._lock:
+            voce = self._voce(model_id)
+            voce['richieste'] += 1
+            if esito == 'ok':
+                voce['latenze'] = (voce['latenze'] + [secondi])[-self.finestra:]
+            elif esito == 'errore':
+                voce['errori'] += 1
+            else:
+                voce['annullate'] += 1
+
+    def vinta(self, model_id):
+        with self._lock:
+            self._voce(model_id)['vinte'] += 1
+
+    def p95(self, model_id):
+        """p95 delle latenze riuscite (None con meno di CAMPIONI_MIN campioni)"""
+        with self._lock:
+            latenze = sorted(self._modelli.get(model_id, {}).get('latenze', []))
+        if len(latenze) < CAMPIONI_MIN:
+            return None
+        return latenze[min(len(latenze) - 1, int(len(latenze) * 0.95))]
+
+    def ritardo(self, model_id) -> float:
+        """Attesa prima di lanciare una riserva"""
+        if RITARDO_FISSO is not None:
+            return RITARDO_FISSO
+        p95 = self.p95(model_id)
+        return RITARDO_DEFAULT if p95 is None else min(max(p95, RITARDO_MIN), RITARDO_MAX)
+
+    def stats(self) -> dict:
+        with self._lock:
+            modelli = {k: dict(v) for k, v in self._modelli.items()}
+        return {k: {'richieste': v['richieste'], 'errori': v['errori'], 'vinte': v['vinte'],
+                    'annullate': v['annullate'], 'p95': self.p95(k)} for k, v in modelli.items()}
+
+
+latenze = LatenzeModelli()
+
+
+def riserve(model, catalogo):
+    """Modelli di riserva: HEDGE_MODELS o il catalogo, senza il principale, i più veloci (p95) per primi"""
+    per_id = {m['id']: m for m in catalogo or []}
+    candidati = [per_id.get(i, {'id': i, 'name': i}) for i in MODELLI] if MODELLI else list(per_id.values())
+    candidati = [m for m in candidati if m['id'] != model['id']]
+    candidati.sort(key=lambda m: latenze.p95(m['id']) or float('inf'))
+    return candidati[:MAX_RISERVE]
+
+
+def gara(modelli, chiama, schema, ritardo=None):
+    """
+    Esegue chiama(modello, annullamento) sul primo modello e, dopo `ritardo` secondi senza
+    risposta valida (o subito dopo un fallimento), sul successivo. Restituisce
+    (risultato valido, modello vincente); se falliscono tutti rilancia l'ultimo errore.
+    """
+    esiti = queue.Queue()
+    annullamenti = []
+
+    def corri(modello, annullamento):
+        inizio = time.perf_counter()
+        try:
+            risultato, errore = valida(chiama(modello, annullamento), schema), None
+        except Exception as e:
+            risultato, errore = None, e
+        if annullamento.is_set():
+            latenze.registra(modello['id'], esito='annullata')
+        else:
+            latenze.registra(modello['id'], time.perf_counter() - inizio, 'ok' if errore is None else 'errore')
+        esiti.put((modello, risultato, errore))
+
+    def avvia():
+        annullamento = Annullamento()
+        annullamenti.append(annullamento)
+        _executor.submit(corri, modelli[len(annullamenti) - 1], annullamento)
+        return time.monotonic() + (ritardo if ritardo is not None else latenze.ritardo(modelli[0]['id']))
+
+    scadenza = avvia()
+    in_volo, ultimo_errore = 1, None
+    while True:
+        resta = len(annullamenti) < len(modelli)
+        try:
+            modello, risultato, errore = esiti.get(timeout=max(0.0, scadenza - time.monotonic()) if resta else None)
+        except queue.Empty:
+            scadenza = avvia()  # nessuna risposta entro il ritardo: parte la riserva
+            in_volo += 1
+            continue
+        in_volo -= 1
+        if errore is None:
+            for annullamento in annullamenti:
+                annullamento.annulla()  # i perdenti vengono interrotti
+            latenze.vinta(modello['id'])
+            return risultato, modello
+        if not isinstance(errore, Annullata):
+            ultimo_errore = errore
+        if resta:
+            scadenza = avvia()  # fallita: la riserva parte subito
+            in_volo += 1
+        elif in_volo == 0:
+            raise ultimo_errore if ultimo_errore is not None else Annullata("tutte le chiamate sono state annullate")
@@ -0,0 +1,164 @@
+"""
+Coda di lavori in background per l'estrazione delle bollette PDF.
+
+upload_bill non chiama più pdf_request nel thread dello script (bloccato per tutta la
+latenza del modello e annullato da un rerun): sottomette un lavoro a un pool limitato
+di worker e la sessione riceve un id, che la pagina interroga da un frammento
+aggiornato periodicamente. Controllo di ammissione:
+  - al massimo `MAX_CODA` lavori tra in coda e in esecuzione nel processo, oltre il
+    limite la sottomissione fallisce con CodaPiena invece di accumulare thread;
+  - lo stesso contenuto già in lavorazione (stessa `chiave`) non crea un nuovo lavoro:
+    la sessione si iscrive a quello esistente;
+  - un nuovo caricamento della stessa sessione ritira la sua iscrizione al lavoro
+    precedente, che viene annullato solo se non è ancora partito e nessun'altra
+    sessione lo aspetta.
+Ogni sessione riceve una copia propria del risultato (risultato()), da modificare liberamente.
+
+Configurazione da variabili d'ambiente: ESTRAZIONI_WORKERS (default 4),
+ESTRAZIONI_MAX_CODA (default 32).
+"""
+import copy
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+WORKERS = int(os.environ.get('ESTRAZIONI_WORKERS', 4))
+MAX_CODA = int(os.environ.get('ESTRAZIONI_MAX_CODA', 32))
+TTL_COMPLETATI = 15 * 60  # secondi dopo cui un lavoro finito e non letto viene dimenticato
+
+IN_CODA, IN_CORSO, COMPLETATO, ERRORE, ANNULLATO = 'in coda', 'in corso', 'completato', 'errore', 'annullato'
+
+
+class CodaPiena(RuntimeError):
+    """Troppi lavori attivi: la richiesta va ripetuta più tardi"""
+
+
+class Lavoro:
+    def __init__(self, chiave):
+        self.id = uuid.uuid4().hex
+        self.chiave = chiave
+        self.stato = IN_CODA
+        self.risultato = None
+        self.errore = None
+        self.creato = time.time()
+        self.iniziato = None
+        self.finito = None
+        self.future = None
+        self.iscritti = 1  # sessioni che aspettano il risultato
+
+    @property
+    def concluso(self) -> bool:
+        return self.stato in (COMPLETATO, ERRORE, ANNULLATO)
+
+
+class CodaEstrazioni:
+    """Pool limitato di worker con id dei lavori, stato interrogabile e controllo di ammissione"""
+
+    def __init__(self, workers=WORKERS, max_coda=MAX_CODA):
+        self.max_coda = max_coda
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='estrazione')
+        self._lock = threading.Lock()
+        self._lavori = {}
+        self._attivi = {}  # chiave -> id del lavoro non ancora concluso
+        self._stats = {'sottomessi': 0, 'uniti': 0, 'rifiutati': 0, 'completati': 0, 'errori': 0, 'annullati': 0}
+
+    def _esegui(self, lavoro, funzione, args, kwargs):
+        with self._lock:
+            if lavoro.stato != IN_CODA:
+                return
+            lavoro.stato, lavoro.iniziato = IN_CORSO, time.time()
+        try:
+            risultato, errore = funzione(*args, **kwargs), None
+        except Exception as e:
+            risultato, errore = None, e
+        with self._lock:
+            lavoro.risultato, lavoro.errore = risultato, errore
+            lavoro.stato = COMPLETATO if errore is None else ERRORE
+            lavoro.finito = time.time()
+            self._stats['completati' if errore is None else 'errori'] += 1
+            self._attivi.pop(lavoro.chiave, None)
+
+    def _pulisci(self, ora):
+        for id_ in [i for i, l in self._lavori.items() if l.concluso and ora - l.finito > TTL_COMPLETATI]:
+            del self._lavori[id_]
+
+    def attivi(self) -> int:
+        with self._lock:
+            return sum(not l.concluso for l in self._lavori.values())
+
+    def sottometti(self, funzione, *args, chiave=None, **kwargs) -> str:
+        """
+        Accoda funzione(*args, **kwargs) e restituisce l'id del lavoro.
+        Se un lavoro con la stessa `chiave` è ancora attivo restituisce il suo id.
+        Solleva CodaPiena oltre `max_coda` lavori attivi.
+        """
+        with self._lock:
+            ora = time.time()
+            self._pulisci(ora)
+            if chiave is not None and chiave in self._attivi:
+                self._stats['uniti'] += 1
+                id_lavoro = self._attivi[chiave]
+                self._lavori[id_lavoro].iscritti += 1
+                return id_lavoro
+            if sum(not l.concluso for l in self._lavori.values()) >= self.max_coda:
+                self._stats['rifiutati'] += 1
+                raise CodaPiena(f"{self.max_coda} analisi già in corso")
+            lavoro = Lavoro(chiave)
+            self._lavori[lavoro.id] = lavoro
+            if chiave is not None:
+                self._attivi[chiave] = lavoro.id
+            self._stats['sottomessi'] += 1
+        lavoro.future = self._executor.submit(self._esegui, lavoro, funzione, args, kwargs)
+        return lavoro.id
+
+    def stato(self, id_lavoro):
+        """Il Lavoro con questo id (None se sconosciuto o già dimenticato)"""
+        with self._lock:
+            return self._lavori.get(id_lavoro)
+
+    def risultato(self, id_lavoro):
+        """Copia del risultato per una sessione (il lavoro può essere condiviso con altre)"""
+        with self._lock:
+            lavoro = self._lavori.get(id_lavoro)
+            return copy.deepcopy(lavoro.risultato) if lavoro is not None else None
+
+    def posizione(self, id_lavoro) -> int:
+        """Lavori in coda prima di questo (0 se è in esecuzione o concluso)"""
+        with self._lock:
+            lavoro = self._lavori.get(id_lavoro)
+            if lavoro is None or lavoro.stato != IN_CODA:
+                return 0
+            return sum(l.stato == IN_CODA and l.creato < lavoro.creato for l in self._lavori.values())
+
+    def annulla(self, id_lavoro) -> bool:
+        """
+        Ritira l'iscrizione di una sessione al lavoro. Il lavoro viene annullato solo se
+        nessun'altra sessione lo aspetta e non è ancora partito (quelli in esecuzione
+        terminano comunque); True se è stato annullato.
+        """
+        with self._lock:
+            lavoro = self._lavori.get(id_lavoro)
+            if lavoro is None or lavoro.concluso:
+                return False
+            lavoro.iscritti = max(0, lavoro.iscritti - 1)
+            if lavoro.iscritti > 0 or lavoro.stato != IN_CODA:
+                return False
+            lavoro.stato, lavoro.finito = ANNULLATO, time.time()
+            self._attivi.pop(lavoro.chiave, None)
+            self._stats['annullati'] += 1
+        if lavoro.future is not None:
+            lavoro.future.cancel()
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            s['in_coda'] = sum(l.stato == IN_CODA for l in self._lavori.values())
+            s['in_corso'] = sum(l.stato == IN_CORSO for l in self._lavori.values())
+        return s
+
+
+# Unica coda condivisa da tutte le sessioni del processo
+coda_estrazioni = CodaEstrazioni()
@@ -0,0 +1,250 @@
+"""
+Estrazione locale del testo delle bollette PDF, prima della chiamata al modello.
+
+Tre percorsi, dal più veloce:
+  - deterministico: se la bolletta è di un fornitore riconosciuto, i 13 campi dello
+    schema vengono letti con espressioni regolari sulle voci del quadro sintetico
+    (Bolletta 2.0 ARERA: "Totale da pagare", "Consumo annuo", "Potenza impegnata",
+    "Codice offerta", ...) e il modello non viene chiamato;
+  - llm_testo: al modello va solo il testo delle pagine che contengono i campi cercati,
+    invece del PDF in base64 (+33%) con il plugin file-parser;
+  - llm_pdf: PDF senza testo estraibile (scansioni) o pypdf non installato, come prima.
+
+Il percorso deterministico risponde solo se trova tutti i campi e i consumi per fascia
+sono coerenti col consumo annuo; altrimenti si passa al modello. Copertura dei campi e
+latenze per percorso sono in `statistiche()`.
+"""
+import io
+import re
+import threading
+import time
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # dipendenza opzionale: senza pypdf si usa solo il percorso llm_pdf
+    PdfReader = None
+
+PARSER_VERSION = 2
+MAX_CARATTERI = 20000  # testo massimo inviato al modello
+
+CAMPI = ("client_type", "resident", "annual_consume", "city", "total_price", "tv_price", "potenza_impegnata",
+         "taxes", "variable_cost", "offer_code", "f1_consume", "f2_consume", "f3_consume")
+
+_NUMERO = r'(\d{1,3}(?:\.\d{3})+(?:,\d+)?|\d+(?:[.,]\d+)?)'
+_EURO = r'(?:€|euro|eur)?\s*'
+# Importo in euro: col simbolo/valuta davanti o con la virgola dei decimali (non un codice o un'aliquota)
+_IMPORTO = r'(?:(?:€|euro|eur)\s*' + _NUMERO + r'|(\d{1,3}(?:\.\d{3})*,\d{1,2}|\d+,\d{1,2}))'
+# "IVA" ma non "P.IVA" / "Partita IVA" dell'intestazione
+_IVA = r'(?<!p\.)(?<!p\.\s)(?<!partita\s)\biva\b'
+
+# Voci del quadro sintetico, cercate nell'ordine: il primo riscontro vince
+VOCI = {
+    'annual_consume': (rf'consumo\s+annuo[^\d\n]{{0,40}}{_NUMERO}\s*kwh',),
+    'total_price': (rf'totale\s+da\s+pagare[^\d\n]{{0,20}}{_EURO}{_NUMERO}',
+                    rf'totale\s+bolletta[^\d\n]{{0,20}}{_EURO}{_NUMERO}'),
+    'tv_price': (rf'canone\s+(?:di\s+abbonamento\s+)?(?:alla\s+)?(?:televisione|tv|rai)[^\d\n]{{0,40}}{_EURO}{_NUMERO}',),
+    'potenza_impegnata': (rf'potenza\s+impegnata[^\d\n]{{0,20}}{_NUMERO}\s*kw',),
+    'accise': (rf'(?:totale\s+)?(?:imposte|accise)(?!\s+e\s+iva)[^\d\n€]{{0,20}}{_IMPORTO}',),
+    'iva': (rf'{_IVA}[^\d\n€]{{0,30}}{_IMPORTO}',),
+    'taxes': (rf'accise\s+e\s+iva[^\d\n]{{0,20}}{_EURO}{_NUMERO}',),
+    'variable_cost': (rf'quota\s+(?:per\s+)?consumi[^\d\n]{{0,20}}{_EURO}{_NUMERO}',
+                      rf'spesa\s+per\s+la\s+materia\s+energia[^\d\n]{{0,20}}{_EURO}{_NUMERO}'),
+    'offer_code': (r'codice\s+offerta\s*:?\s*([A-Z0-9][A-Z0-9_\-/.]{3,})',),
+    'f1_consume': (rf'\bF1\b[^\d\n]{{0,20}}{_NUMERO}\s*kwh',),
+    'f2_consume': (rf'\bF2\b[^\d\n]{{0,20}}{_NUMERO}\s*kwh',),
+    'f3_consume': (rf'\bF3\b[^\d\n]{{0,20}}{_NUMERO}\s*kwh',),
+}
+_COMUNE = re.compile(r'fornitura[^\n]{0,80}?\b\d{5}\s+([A-Za-zÀ-ÿ\' ]+?)\s*\(([A-Z]{2})\)', re.IGNORECASE)
+
+# Fornitori con bollette riconosciute: nome -> espressione che li identifica nel testo
+LAYOUT_NOTI = {
+    'Enel Energia': r'enel\s+energia',
+    'Edison Energia': r'edison\s+energia',
+    'A2A Energia': r'a2a\s+energia',
+    'Hera Comm': r'hera\s+comm',
+    'Iren Mercato': r'iren\s+mercato',
+    'Eni Plenitude': r'plenitude|eni\s+gas\s+e\s+luce',
+    'Acea Energia': r'acea\s+energia',
+    'Sorgenia': r'sorgenia',
+    'Dolomiti Energia': r'dolomiti\s+energia',
+}
+
+# Parole che indicano una pagina con campi utili
+_PAROLE_CHIAVE = re.compile(r'kwh|potenza\s+impegnata|codice\s+offerta|totale\s+da\s+pagare|canone|accise|'
+                            r'\biva\b|fornitura|consumo\s+annuo|\bF[123]\b', re.IGNORECASE)
+
+
+def numero_italiano(testo) -> float:
+    """'1.234,56' -> 1234.56, '1.900' -> 1900, '12,5' -> 12.5, '12.5' -> 12.5"""
+    if ',' in testo:
+        return float(testo.replace('.', '').replace(',', '.'))
+    if re.fullmatch(r'\d{1,3}(?:\.\d{3})+', testo):
+        return float(testo.replace('.', ''))
+    return float(testo)
+
+
+def testo_pagine(data):
+    """Testo di ogni pagina del PDF (None se pypdf manca o il PDF non è leggibile)"""
+    if PdfReader is None:
+        return None
+    try:
+        return [pagina.extract_text() or '' for pagina in PdfReader(io.BytesIO(data)).pages]
+    except Exception:
+        return None
+
+
+def pagine_rilevanti(pagine, minimo=2):
+    """
+    Solo le pagine con almeno `minimo` voci utili diverse, nell'ordine originale
+    (una parola isolata come "fornitura" compare anche nelle condizioni generali)
+    """
+    return [p for p in pagine if len({m.lower() for m in _PAROLE_CHIAVE.findall(p)}) >= minimo]
+
+
+def riconosci_layout(testo):
+    for nome, pattern in LAYOUT_NOTI.items():
+        if re.search(pattern, testo, re.IGNORECASE):
+            return nome
+    return None
+
+
+def _cerca(voce, testo):
+    for pattern in VOCI[voce]:
+        m = re.search(pattern, testo, re.IGNORECASE)
+        if m:
+            return next(g for g in m.groups() if g is not None)
+    return None
+
+
+def campi_deterministici(testo) -> dict:
+    """Campi dello schema trovati nel testo (quelli non trovati mancano dal dizionario)"""
+    campi = {}
+    for voce in ('annual_consume', 'total_price', 'potenza_impegnata', 'variable_cost',
+                 'f1_consume', 'f2_consume', 'f3_consume'):
+        valore = _cerca(voce, testo)
+        if valore is not None:
+            campi[voce] = numero_italiano(valore)
+
+    # il canone TV non c'è in tutte le bollette: se la voce manca vale 0
+    valore = _cerca('tv_price', testo)
+    campi['tv_price'] = numero_italiano(valore) if valore is not None else 0.0
+
+    valore = _cerca('taxes', testo)
+    if valore is not None:
+        campi['taxes'] = numero_italiano(valore)
+    else:
+        accise, iva = _cerca('accise', testo), _cerca('iva', testo)
+        if accise is not None and iva is not None:
+            campi['taxes'] = round(numero_italiano(accise) + numero_italiano(iva), 2)
+
+    codice = _cerca('offer_code', testo)
+    if codice is not None:
+        campi['offer_code'] = codice
+
+    m = _COMUNE.search(testo)
+    if m:
+        campi['city'] = m.group(1).strip().title()
+
+    minuscolo = testo.lower()
+    if 'altri usi' in minuscolo or 'non domestico' in minuscolo or 'business' in minuscolo:
+        campi['client_type'], campi['resident'] = 'Business', False
+    elif 'non residente' in minuscolo:
+        campi['client_type'], campi['resident'] = 'Domestico non residente', False
+    elif 'residente' in minuscolo:
+        campi['client_type'], campi['resident'] = 'Domestico residente', True
+    return campi
+
+
+def _coerente(campi) -> bool:
+    """Consumi per fascia che tornano col consumo annuo e voci di spesa non oltre il totale"""
+    fasce = campi['f1_consume'] + campi['f2_consume'] + campi['f3_consume']
+    if not (campi['annual_consume'] > 0 and abs(fasce - campi['annual_consume']) <= 0.05 * campi['annual_consume']):
+        return False
+    totale = campi['total_price']
+    return totale > 0 and all(0 <= campi[c] <= totale for c in ('taxes', 'variable_cost', 'tv_price'))
+
+
+class EstrazioneLocale:
+    """Esito della fase locale: testo da inviare al modello o, per i layout noti, i campi già pronti"""
+
+    def __init__(self, data):
+        self.pagine = testo_pagine(data)
+        self.layout = None
+        self.campi = {}
+        self.testo = ''
+        if not self.pagine or not any(p.strip() for p in self.pagine):
+            return
+        rilevanti = pagine_rilevanti(self.pagine) or self.pagine
+        self.testo = '\n\n'.join(rilevanti)[:MAX_CARATTERI]
+        self.layout = riconosci_layout('\n'.join(self.pagine))
+        if self.layout is not None:
+            self.campi = campi_deterministici('\n'.join(self.pagine))
+
+    @property
+    def copertura(self) -> float:
+        """Frazione dei 13 campi trovati dal parser deterministico"""
+        return sum(c in self.campi for c in CAMPI) / len(CAMPI)
+
+    @property
+    def completa(self) -> bool:
+        return self.layout is not None and self.copertura == 1.0 and _coerente(self.campi)
+
+    @property
+    def percorso(self) -> str:
+        if self.completa:
+            return 'deterministico'
+        return 'llm_testo' if self.testo else 'llm_pdf'
+
+    def risultato(self) -> dict:
+        return {c: self.campi[c] for c in CAMPI}
+
+
+# --- Statistiche per percorso ---
+
+_lock = threading.Lock()
+_statistiche = {}
+
+
+def registra(percorso, secondi, layout=None, copertura=None):
+    with _lock:
+        s = _statistiche.setdefault(percorso, {'richieste': 0, 'secondi': []})
+        s['richieste'] += 1
+        s['secondi'] = (s['secondi'] + [secondi])[-500:]
+        if layout is not None:
+            per_layout = _statistiche.setdefault('layout', {}).setdefault(layout, {'bollette': 0, 'complete': 0, 'copertura': 0.0})
+            per_layout['bollette'] += 1
+            per_layout['complete'] += copertura == 1.0
+            per_layout['copertura'] += copertura
+
+
+def statistiche() -> dict:
+    """Per percorso: richieste, latenza mediana e p95 (s); per layout: bollette, complete e copertura media"""
+    with _lock:
+        risultato = {}
+        for percorso, s in _statistiche.items():
+            if percorso == 'layout':
+                risultato['layout'] = {nome: {'bollette': v['bollette'], 'complete': v['complete'],
+                                              'copertura': v['copertura'] / v['bollette']} for nome, v in s.items()}
+                continue
+            tempi = sorted(s['secondi'])
+            risultato[percorso] = {'richieste': s['richieste'], 'p50': tempi[len(tempi) // 2],
+                                   'p95': tempi[min(len(tempi) - 1, int(len(tempi) * 0.95))]}
+        return risultato
+
+
+def estrai(data, chiama_modello_testo, chiama_modello_pdf) -> dict:
+    """
+    Campi della bolletta dal percorso più veloce disponibile.
+    chiama_modello_testo(testo) e chiama_modello_pdf() sono le chiamate al modello.
+    """
+    inizio = time.perf_counter()
+    locale = EstrazioneLocale(data)
+    percorso = locale.percorso
+    if percorso == 'deterministico':
+        risultato = locale.risultato()
+    elif percorso == 'llm_testo':
+        risultato = chiama_modello_testo(locale.testo)
+    else:
+        risultato = chiama_modello_pdf()
+    registra(percorso, time.perf_counter() - inizio, locale.layout, locale.copertura if locale.layout else None)
+    return risultato
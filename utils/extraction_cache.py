@@ -0,0 +1,164 @@
+"""
+Cache delle estrazioni dalle bollette PDF, indirizzata per contenuto.
+
+La chiave è SHA-256(byte del PDF) + id del modello + versione dello schema di
+estrazione: ricaricare la stessa bolletta, anche da un'altra sessione, restituisce il
+JSON già estratto senza chiamare OpenRouter. Due livelli:
+  - memoria: LRU di processo con le ultime `max_memoria` estrazioni;
+  - disco: SQLite con evizione per età (`max_giorni`) e per dimensione (`max_bytes`,
+    prima le voci usate meno di recente).
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_PATH = os.path.join(PROJECT_ROOT, '.cache', 'estrazioni_pdf.sqlite')
+
+
+def chiave_estrazione(data, model_id, schema_version, **opzioni) -> str:
+    """Chiave di cache: contenuto del PDF, modello, versione dello schema ed eventuali opzioni della richiesta"""
+    h = hashlib.sha256(data)
+    h.update(b'\0' + str(model_id).encode('utf-8'))
+    h.update(b'\0' + str(schema_version).encode('utf-8'))
+    if opzioni:
+        h.update(b'\0' + json.dumps(opzioni, sort_keys=True, default=str).encode('utf-8'))
+    return h.hexdigest()
+
+
+class ExtractionCache:
+    """Cache a due livelli (LRU in memoria + SQLite su disco) dei risultati di pdf_request"""
+
+    def __init__(self, path=DEFAULT_PATH, max_memoria=128, max_bytes=64 << 20, max_giorni=90):
+        self.path = path
+        self.max_memoria = max_memoria
+        self.max_bytes = max_bytes
+        self.max_secondi = max_giorni * 86400
+        self._lock = threading.Lock()
+        self._memoria = OrderedDict()
+        self._stats = {'hit_memoria': 0, 'hit_disco': 0, 'miss': 0, 'scritture': 0, 'evizioni': 0}
+        self._db = None
+
+    def _conn(self):
+        # connessione unica condivisa tra i thread delle sessioni, serializzata da self._lock
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute('''CREATE TABLE IF NOT EXISTS estrazioni (
+                                    chiave TEXT PRIMARY KEY, valore TEXT NOT NULL, bytes INTEGER NOT NULL,
+                                    creato REAL NOT NULL, usato REAL NOT NULL)''')
+            self._db.execute('CREATE INDEX IF NOT EXISTS estrazioni_usato ON estrazioni (usato)')
+            self._db.commit()
+        return self._db
+
+    def _in_memoria(self, chiave, valore, creato):
+        self._memoria[chiave] = (valore, creato)
+        self._memoria.move_to_end(chiave)
+        while len(self._memoria) > self.max_memoria:
+            self._memoria.popitem(last=False)
+
+    def get(self, chiave):
+        """JSON estratto per `chiave` (una copia), None se assente o scaduto"""
+        with self._lock:
+            ora = time.time()
+            if chiave in self._memoria:
+                valore, creato = self._memoria[chiave]
+                if ora - creato <= self.max_secondi:
+                    self._memoria.move_to_end(chiave)
+                    self._stats['hit_memoria'] += 1
+                    return json.loads(valore)
+                del self._memoria[chiave]
+
+            try:
+                db = self._conn()
+                riga = db.execute('SELECT valore, creato FROM estrazioni WHERE chiave = ?', (chiave,)).fetchone()
+                if riga is not None and ora - riga[1] > self.max_secondi:
+                    db.execute('DELETE FROM estrazioni WHERE chiave = ?', (chiave,))
+                    db.commit()
+                    self._stats['evizioni'] += 1
+                    riga = None
+                if riga is not None:
+                    db.execute('UPDATE estrazioni SET usato = ? WHERE chiave = ?', (ora, chiave))
+                    db.commit()
+            except sqlite3.Error:
+                riga = None
+
+            if riga is None:
+                self._stats['miss'] += 1
+                return None
+            self._stats['hit_disco'] += 1
+            self._in_memoria(chiave, riga[0], riga[1])
+            return json.loads(riga[0])
+
+    def put(self, chiave, valore):
+        """Salva il JSON estratto in memoria e su disco, poi applica l'evizione"""
+        testo = json.dumps(valore, ensure_ascii=False)
+        with self._lock:
+            ora = time.time()
+            self._in_memoria(chiave, testo, ora)
+            self._stats['scritture'] += 1
+            try:
+                db = self._conn()
+                db.execute('INSERT OR REPLACE INTO estrazioni VALUES (?, ?, ?, ?, ?)',
+                           (chiave, testo, len(testo.encode('utf-8')), ora, ora))
+                self._evizione(db, ora)
+                db.commit()
+            except sqlite3.Error:
+                pass  # il livello su disco è best effort: resta la memoria
+
+    def _evizione(self, db, ora):
+        scadute = db.execute('DELETE FROM estrazioni WHERE creato < ?', (ora - self.max_secondi,)).rowcount
+        totale = db.execute('SELECT COALESCE(SUM(bytes), 0) FROM estrazioni').fetchone()[0]
+        if totale > self.max_bytes:
+            eccesso = totale - self.max_bytes
+            liberati = 0
+            vecchie = []
+            for chiave, n in db.execute('SELECT chiave, bytes FROM estrazioni ORDER BY usato'):
+                if liberati >= eccesso:
+                    break
+                vecchie.append((chiave,))
+                liberati += n
+            db.executemany('DELETE FROM estrazioni WHERE chiave = ?', vecchie)
+            scadute += len(vecchie)
+        self._stats['evizioni'] += scadute
+
+    def get_or_compute(self, chiave, calcola):
+        """Risultato in cache o, se manca, `calcola()` salvato per le richieste successive"""
+        valore = self.get(chiave)
+        if valore is None:
+            valore = calcola()
+            self.put(chiave, valore)
+        return valore
+
+    def clear(self):
+        with self._lock:
+            self._memoria.clear()
+            try:
+                db = self._conn()
+                db.execute('DELETE FROM estrazioni')
+                db.commit()
+            except sqlite3.Error:
+                pass
+
+    def stats(self) -> dict:
+        """Contatori hit/miss, hit rate e occupazione dei due livelli"""
+        with self._lock:
+            s = dict(self._stats)
+            try:
+                voci, byte = self._conn().execute(
+                    'SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM estrazioni').fetchone()
+            except sqlite3.Error:
+                voci, byte = 0, 0
+            s['voci_memoria'] = len(self._memoria)
+            s['bytes_memoria'] = sum(len(v.encode('utf-8')) for v, _ in self._memoria.values())
+        richieste = s['hit_memoria'] + s['hit_disco'] + s['miss']
+        s.update(voci_disco=voci, bytes_disco=byte, hit_rate=(s['hit_memoria'] + s['hit_disco']) / richieste if richieste else 0.0)
+        return s
+
+
+# Unica cache condivisa da tutte le sessioni del processo
+extraction_cache = ExtractionCache()
@@ -0,0 +1,100 @@
+import os
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# Elenco comuni ISTAT (opzionale): serve a tradurre la città della bolletta in codici
+PATH_COMUNI = './assets/geo/Elenco-comuni-italiani.csv'
+
+# Colonne geografiche PLACET e larghezza dei codici ISTAT corrispondenti
+LIVELLI = {'regione': 2, 'provincia': 3, 'comune': 6}
+
+
+def normalizza(valore, larghezza=None):
+    """Nome o codice normalizzato: minuscolo, senza accenti e spazi doppi; codici con zeri iniziali"""
+    if valore is None or (isinstance(valore, float) and np.isnan(valore)):
+        return None
+    testo = str(valore).strip()
+    if larghezza and testo.isdigit():
+        return testo.zfill(larghezza)
+    testo = unicodedata.normalize('NFKD', testo).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(testo.lower().replace("'", ' ').split()) or None
+
+
+class GeoIndex:
+    """
+    Indice geografico del catalogo PLACET: per ogni regione/provincia/comune
+    (normalizzati) una bitmap delle righe in cui l'offerta è attivabile.
+    Le righe senza alcun dato geografico valgono su tutto il territorio nazionale.
+    """
+
+    def __init__(self, df):
+        self.n = len(df)
+        ristrette = np.zeros(self.n, dtype=bool)
+        self._bitmap = {livello: {} for livello in LIVELLI}
+
+        for livello, larghezza in LIVELLI.items():
+            if livello not in df.columns:
+                continue
+            colonna = pd.Series(df[livello].to_numpy(dtype=object), index=np.arange(self.n))
+            ristrette |= colonna.notna().to_numpy()
+            token = colonna.dropna().astype(str).str.split(';').explode()
+            token = token.map(lambda t: normalizza(t, larghezza)).dropna()
+            for chiave, righe in token.groupby(token).groups.items():
+                self._bitmap[livello][chiave] = self._pack(np.asarray(righe))
+
+        self._nazionali = np.packbits(~ristrette)
+
+    def _pack(self, righe):
+        maschera = np.zeros(self.n, dtype=bool)
+        maschera[righe] = True
+        return np.packbits(maschera)
+
+    def candidates(self, comune=None, provincia=None, regione=None):
+        """
+        Posizioni delle righe attivabili nella località indicata: offerte nazionali
+        più quelle che elencano il comune, la provincia o la regione dell'utente.
+        Senza località note restano solo le offerte nazionali.
+        """
+        comune = normalizza(comune, LIVELLI['comune'])
+        if provincia is None and comune and comune.isdigit():
+            provincia = comune[:3]  # codice comune ISTAT = provincia + progressivo
+
+        bitmap = self._nazionali.copy()
+        for livello, valore in (('comune', comune), ('provincia', provincia), ('regione', regione)):
+            chiave = normalizza(valore, LIVELLI[livello])
+            if chiave in self._bitmap[livello]:
+                np.bitwise_or(bitmap, self._bitmap[livello][chiave], out=bitmap)
+        return np.flatnonzero(np.unpackbits(bitmap, count=self.n))
+
+
+def load_comuni(path=PATH_COMUNI):
+    """Tabella ISTAT nome comune -> codici {comune, provincia, regione} (vuota se il file manca)"""
+    if not os.path.exists(path):
+        return {}
+    df = pd.read_csv(path, sep=';', encoding='latin-1', dtype=str)
+    colonne = {c.lower(): c for c in df.columns}
+
+    def colonna(*parole):
+        return next(c for low, c in colonne.items() if all(p in low for p in parole))
+
+    col_nome = colonna('denominazione in italiano')
+    col_comune = colonna('alfanumerico')
+    col_provincia = colonna('sovracomunale')
+    col_regione = colonna('codice regione')
+    return {
+        normalizza(nome): {
+            'comune': normalizza(comune, LIVELLI['comune']),
+            'provincia': normalizza(provincia, LIVELLI['provincia']),
+            'regione': normalizza(regione, LIVELLI['regione']),
+        }
+        for nome, comune, provincia, regione in zip(df[col_nome], df[col_comune], df[col_provincia], df[col_regione])
+    }
+
+
+def resolve_location(city, comuni) -> dict:
+    """Codici ISTAT della città della bolletta; se non è in tabella si usa il nome così com'è"""
+    if not city:
+        return {}
+    return comuni.get(normalizza(city), {'comune': city})
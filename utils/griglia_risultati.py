@@ -0,0 +1,100 @@
+"""
+Griglia dei risultati del comparatore tenuta lato server in forma colonnare.
+
+I costi restano array numpy (uno per voce, un elemento per offerta); filtro per
+tipo o per nome, ordinamento e paginazione lavorano sugli indici e al browser
+arriva solo la pagina visibile, senza Styler. Cambiare pagina, ordinamento o
+filtro rilegge le colonne già calcolate: i prezzi non vengono ricalcolati.
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+RIGHE_PER_PAGINA = 25
+
+
+class GrigliaRisultati:
+    """
+    Colonne dei risultati (dizionario nome -> sequenza, tutte della stessa lunghezza).
+    `nome` e `tipo` indicano le colonne usate dai filtri.
+    """
+
+    def __init__(self, colonne, nome="Offerta", tipo="Tipo"):
+        self.colonne = {k: np.asarray(v) for k, v in colonne.items()}
+        self.nome, self.tipo = nome, tipo
+        self.righe = len(self.colonne[nome])
+        self._nomi_minuscoli = None
+        self._ordini = {}
+
+    def tipi(self) -> list:
+        """Valori distinti della colonna tipo, per il filtro"""
+        return sorted(set(self.colonne[self.tipo].tolist()))
+
+    def ordine(self, colonna, crescente=True) -> np.ndarray:
+        """Indici delle righe ordinate per `colonna` (calcolati una volta per colonna e verso)"""
+        chiave = (colonna, crescente)
+        if chiave not in self._ordini:
+            valori = self.colonne[colonna]
+            if not crescente:
+                # decrescente stabile: a parità resta l'ordine originale (non ordine[::-1])
+                if valori.dtype.kind in 'fiub':
+                    valori = -valori.astype(float)
+                else:
+                    valori = -np.unique(valori, return_inverse=True)[1]
+            self._ordini[chiave] = np.argsort(valori, kind='stable')
+        return self._ordini[chiave]
+
+    def filtra(self, ordine, tipi=None, testo='') -> np.ndarray:
+        """Restringe gli indici alle righe del tipo scelto e col nome che contiene `testo`"""
+        maschera = np.ones(self.righe, dtype=bool)
+        if tipi:
+            maschera &= np.isin(self.colonne[self.tipo], list(tipi))
+        if testo:
+            if self._nomi_minuscoli is None:
+                self._nomi_minuscoli = np.char.lower(self.colonne[self.nome].astype(str))
+            maschera &= np.char.find(self._nomi_minuscoli, testo.lower()) >= 0
+        return ordine[maschera[ordine]]
+
+    def pagina(self, indici, numero, dimensione=RIGHE_PER_PAGINA) -> pd.DataFrame:
+        """DataFrame delle sole righe della pagina `numero` (da 0)"""
+        scelte = indici[numero * dimensione:(numero + 1) * dimensione]
+        return pd.DataFrame({k: v[scelte] for k, v in self.colonne.items()})
+
+    def riga(self, i) -> dict:
+        return {k: v[i].item() if hasattr(v[i], 'item') else v[i] for k, v in self.colonne.items()}
+
+
+@st.fragment
+def mostra_griglia(griglia, key, ordina_per="Totale Annuo", formato="%.2f"):
+    """
+    Tabella paginata con filtro e ordinamento. Gira come frammento: le interazioni
+    rieseguono solo questa funzione, non il calcolo dei prezzi della pagina.
+    """
+    numeriche = [k for k, v in griglia.colonne.items() if v.dtype.kind in 'fiu']
+
+    c1, c2, c3, c4 = st.columns([3, 2, 2, 1])
+    testo = c1.text_input("Cerca offerta", key=f"{key}_testo", placeholder="nome contiene...")
+    tipi = c2.multiselect("Tipo", griglia.tipi(), key=f"{key}_tipi")
+    colonna = c3.selectbox("Ordina per", list(griglia.colonne), key=f"{key}_ordina",
+                           index=list(griglia.colonne).index(ordina_per) if ordina_per in griglia.colonne else 0)
+    crescente = c4.toggle("Crescente", value=True, key=f"{key}_crescente")
+
+    indici = griglia.filtra(griglia.ordine(colonna, crescente), tipi, testo)
+    pagine = max(1, -(-len(indici) // RIGHE_PER_PAGINA))
+
+    # un nuovo filtro o ordinamento riparte dalla prima pagina
+    stato = (testo, tuple(tipi), colonna, crescente)
+    if st.session_state.get(f"{key}_stato") != stato:
+        st.session_state[f"{key}_stato"] = stato
+        st.session_state[f"{key}_pagina"] = 1
+    st.session_state[f"{key}_pagina"] = min(st.session_state.get(f"{key}_pagina", 1), pagine)
+
+    st.dataframe(
+        griglia.pagina(indici, st.session_state[f"{key}_pagina"] - 1),
+        use_container_width=True,
+        hide_index=True,
+        column_config={k: st.column_config.NumberColumn(format=formato) for k in numeriche},
+    )
+    p1, p2 = st.columns([1, 3])
+    p1.number_input("Pagina", min_value=1, max_value=pagine, step=1, key=f"{key}_pagina")
+    p2.caption(f"{len(indici)} offerte su {griglia.righe} · pagina {st.session_state[f'{key}_pagina']} di {pagine}")
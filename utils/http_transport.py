@@ -0,0 +1,158 @@
+"""
+Trasporto HTTP condiviso da tutto il processo per le chiamate a OpenRouter.
+
+Una sola requests.Session (pdf_request, elenco dei modelli) e un solo client OpenRouter
+(chat), entrambi con pool di connessioni keep-alive: le sessioni Streamlit riusano le
+connessioni TCP+TLS già aperte invece di rifare l'handshake a ogni richiesta. Restano
+aperte al massimo `HTTP_POOL_SIZE` connessioni per host: le richieste in più (es. molti
+stream SSE delle estrazioni in parallelo) non aspettano il pool, usano una connessione
+in più che viene chiusa a fine risposta. Ogni richiesta ha timeout di connessione e di
+lettura (TIMEOUT), anche tra un pezzo e l'altro di una risposta in streaming.
+
+Configurazione da variabili d'ambiente:
+  HTTP_POOL_SIZE        connessioni per host (default 16)
+  HTTP_CONNECT_TIMEOUT  secondi per aprire la connessione (default 5)
+  HTTP_READ_TIMEOUT     secondi di attesa della risposta (default 120, l'estrazione
+                        dei PDF può essere lenta)
+  OPENROUTER_BASE_URL   endpoint delle API (default https://openrouter.ai/api/v1),
+                        es. un server locale di prova
+
+Uso: python -m utils.http_transport [--richieste 200] confronta, su un server HTTP
+locale, le connessioni aperte con il trasporto condiviso e con requests.get.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from requests.adapters import HTTPAdapter
+
+POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 16))
+CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 120))
+OPENROUTER_BASE_URL = os.environ.get('OPENROUTER_BASE_URL', 'https://openrouter.ai/api/v1').rstrip('/')
+
+TIMEOUT = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+_lock = threading.Lock()
+_sessione = None
+_openrouter = None
+
+
+class _SessioneConTimeout(requests.Session):
+    """Session con timeout di default su ogni richiesta (requests non ne ha)"""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def nuova_sessione(pool_size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT):
+    """
+    Session con pool keep-alive di `pool_size` connessioni per host. Il pool non blocca:
+    un'attesa senza limite di una connessione libera bloccherebbe la sessione Streamlit
+    finché uno stream lungo non finisce.
+    """
+    sessione = _SessioneConTimeout((connect_timeout, read_timeout))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=False)
+    sessione.mount('https://', adapter)
+    sessione.mount('http://', adapter)
+    return sessione
+
+
+def sessione() -> requests.Session:
+    """Session condivisa dal processo (thread-safe per richieste concorrenti)"""
+    global _sessione
+    if _sessione is None:
+        with _lock:
+            if _sessione is None:
+                _sessione = nuova_sessione()
+    return _sessione
+
+
+def openrouter_client(api_key):
+    """Client OpenRouter condiviso, sopra un httpx.Client con lo stesso pool e gli stessi timeout"""
+    global _openrouter
+    if _openrouter is None:
+        with _lock:
+            if _openrouter is None:
+                import httpx
+                from openrouter import OpenRouter
+                http = httpx.Client(
+                    limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+                    timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+                )
+                _openrouter = OpenRouter(api_key=api_key, server_url=OPENROUTER_BASE_URL, client=http,
+                                         timeout_ms=int(READ_TIMEOUT * 1000))
+    return _openrouter
+
+
+# --- Verifica su server locale ---
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def do_GET(self):
+        corpo = b'{"data": []}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+class _ServerContaConnessioni(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.connessioni = 0
+
+    def process_request(self, request, client_address):
+        self.connessioni += 1
+        super().process_request(request, client_address)
+
+
+def _misura(get, url, richieste, thread):
+    def lavoro(n):
+        for _ in range(n):
+            get(url).raise_for_status()
+    inizio = time.perf_counter()
+    workers = [threading.Thread(target=lavoro, args=(richieste // thread,)) for _ in range(thread)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return time.perf_counter() - inizio
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Connessioni aperte: trasporto condiviso contro requests.get")
+    parser.add_argument('--richieste', type=int, default=200)
+    parser.add_argument('--thread', type=int, default=8, help="sessioni concorrenti simulate")
+    args = parser.parse_args(argv)
+
+    for nome, get in (("requests.get", lambda url: requests.get(url, timeout=TIMEOUT)),
+                      ("trasporto condiviso", lambda url: sessione().get(url, timeout=TIMEOUT))):
+        server = _ServerContaConnessioni()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        secondi = _misura(get, f'http://127.0.0.1:{server.server_address[1]}/api/v1/models/user',
+                          args.richieste, args.thread)
+        server.shutdown()
+        server.server_close()
+        print(f"{nome:>20}: {args.richieste} richieste, {server.connessioni} connessioni, {secondi:.2f} s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,963 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import xml.etree.ElementTree as ET
+import codecs
+import copy
+import hashlib
+import mmap
+import os
+import re
+import time
+import warnings
+from functools import lru_cache
+from .catalog_registry import registry
+from .snapshot import read_snapshot, text_values, write_snapshot
+
+# --- 1. FUNZIONI HELPER & PARSING ---
+
+def _get_text(elem, xpath, default=None):
+    if elem is None: return default
+    found = elem.find(xpath)
+    return found.text if found is not None else default
+
+def _safe_float(val):
+    if not val: return 0.0
+    if isinstance(val, (float, int)): return float(val)
+    try:
+        return float(str(val).replace(',', '.').replace(' ', '').strip())
+    except (ValueError, TypeError):
+        return 0.0
+
+def _map_fascia(code):
+    if code == "01": return "F1"
+    if code == "02": return "F2"
+    if code == "03": return "F3"
+    if code == "91": return "F23"
+    return "F0"
+
+def carica_pun_da_csv(filepath):
+    try:
+        df = pd.read_csv(filepath, sep=';', encoding='utf-8')
+        df.columns = [c.strip().upper() for c in df.columns]
+        col_f1 = next(c for c in df.columns if 'F1' in c)
+        col_f2 = next(c for c in df.columns if 'F2' in c)
+        col_f3 = next(c for c in df.columns if 'F3' in c)
+        pun_medio = {
+            'F1': df[col_f1].mean(),
+            'F2': df[col_f2].mean(),
+            'F3': df[col_f3].mean()
+        }
+        pun_medio['F23'] = (pun_medio['F2'] + pun_medio['F3']) / 2
+        pun_medio['F0'] = (pun_medio['F1'] + pun_medio['F2'] + pun_medio['F3']) / 3
+        return pun_medio
+    except Exception as e:
+        # Fallback silenzioso o loggato
+        return {'F1': 0.12, 'F2': 0.11, 'F3': 0.10, 'F23': 0.105, 'F0': 0.11}
+
+# Parametri ARERA usati dal calcolo, con il valore usato se mancano dal CSV
+PARAMETRI_CALCOLO = {
+    'lambda': 0.10, 'ppe': 0.0, 'pcv_c': 0.0, 'dispbt_d': 0.0, 'dispbt_nd': 0.0, 'cdispd': 0.0,
+    'sigma1': 0.0, 'sigma2': 0.0, 'sigma3': 0.0, 'uc3': 0.0, 'uc6s_d': 0.0, 'uc6p_d': 0.0,
+    'asos_dr': 0.0, 'arim_dr': 0.0, 'asos_dnr_f': 0.0, 'arim_dnr_f': 0.0,
+    'asos_dnr_v': 0.0, 'arim_dnr_v': 0.0,
+    'acc_c_r_l': 0.0227, 'acc_a_l_l': 0.0227, 'acc_c_nr': 0.0227,
+}
+# Parametri che il CSV ARERA può legittimamente non avere (es. ppe, la perequazione,
+# assente quando è nulla): prendono il default senza avvisi
+PARAMETRI_OPZIONALI = frozenset({'ppe'})
+
+def _valore_numerico(val):
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return float('nan')
+
+class ParametriArera:
+    """
+    Parametri ARERA tipizzati, costruiti una volta per file.
+    I parametri del calcolo sono attributi float (`lambda` diventa `lambda_`), così
+    CalcolatoreSpesa e TariffeCompilate li leggono senza lookup per stringa né conversioni.
+    Quelli mancanti o non numerici prendono il default; in `mancanti` (con un avviso)
+    finiscono solo quelli obbligatori, non i PARAMETRI_OPZIONALI.
+    Tutti i valori del CSV restano in `valori` (get() come un dizionario).
+    """
+
+    def __init__(self, valori):
+        self.valori = dict(valori)
+        numeri = {k: _valore_numerico(self.valori.get(k)) for k in PARAMETRI_CALCOLO}
+        for k, default in PARAMETRI_CALCOLO.items():
+            setattr(self, 'lambda_' if k == 'lambda' else k, numeri[k] if np.isfinite(numeri[k]) else default)
+        self.mancanti = tuple(k for k, v in numeri.items() if not np.isfinite(v) and k not in PARAMETRI_OPZIONALI)
+        if self.mancanti:
+            warnings.warn(f"Parametri ARERA mancanti, uso i valori di default: {', '.join(self.mancanti)}")
+
+    def get(self, key, default=None):
+        return self.valori.get(key, default)
+
+    def __len__(self):
+        return len(self.valori)
+
+def carica_parametri_da_df(df):
+    try:
+        df.columns = [c.strip().lower() for c in df.columns]
+        col_nome = next(c for c in df.columns if 'parametro' in c)
+        col_val = next(c for c in df.columns if 'valore' in c)
+        # conversione di colonna come _safe_float; i valori non numerici restano NaN (mancanti)
+        valori = pd.to_numeric(df[col_val].astype(str).str.replace(',', '.').str.replace(' ', ''), errors='coerce')
+        return ParametriArera(zip(df[col_nome].astype(str).str.strip(), valori.tolist()))
+    except Exception as e:
+        st.error(f"Errore struttura CSV Parametri: {e}")
+        return ParametriArera({})
+
+def carica_parametri_da_csv(filepath):
+    df = pd.read_csv(filepath, encoding='utf-8')
+    if len(df.columns) < 2: df = pd.read_csv(filepath, sep=';', encoding='utf-8')
+    return carica_parametri_da_df(df)
+
+def parsa_offerte_da_stringa(xml_string):
+    xml_string = xml_string.strip()
+    try:
+        tree = ET.ElementTree(ET.fromstring(xml_string))
+    except ET.ParseError:
+        return []
+
+    root = tree.getroot()
+    ns = ""
+    if '}' in root.tag:
+        ns = root.tag.split('}')[0] + "}"
+
+    iter_offerte = root.findall(f".//{ns}offerta") if root.tag != f"{ns}offerta" else [root]
+    return [_parsa_offerta(offerta, ns) for offerta in iter_offerte]
+
+def _parsa_offerta_xpath(offerta, ns):
+    """Versione di riferimento di _parsa_offerta, con una ricerca .// per ogni campo"""
+    nome = _get_text(offerta, f".//{ns}NOME_OFFERTA", "Sconosciuto")
+    codice = _get_text(offerta, f".//{ns}COD_OFFERTA", "")
+    tipo_code = _get_text(offerta, f".//{ns}DettaglioOfferta/{ns}TIPO_CLIENTE", "01")
+    tipo_cliente_label = "Domestico" if tipo_code == "01" else "Business"
+
+    idx_node = offerta.find(f".//{ns}RiferimentiPrezzoEnergia/{ns}IDX_PREZZO_ENERGIA")
+    is_variable = True if (idx_node is not None and idx_node.text and idx_node.text.strip()) else False
+    tipo_prezzo_label = "Variabile" if is_variable else "Fisso"
+
+    dati = {
+        'nome': nome, 'codice': codice, 'target': tipo_cliente_label,
+        'tipo_prezzo': tipo_prezzo_label,
+        'p_fix_comm': 0.0, 'p_vol_comm': {}, 
+        'p_fix_fer': 0.0, 'p_vol_fer': {}, 
+        'p_vol_qe': {}, 'spread': {}, 'p_pot_qe': 0.0
+    }
+
+    for comp in offerta.findall(f".//{ns}ComponenteImpresa"):
+        macro = _get_text(comp, f".//{ns}MACROAREA")
+        if not macro: continue
+
+        for intervallo in comp.findall(f".//{ns}IntervalloPrezzi"):
+            p_text = _get_text(intervallo, f".//{ns}PREZZO")
+            prezzo = _safe_float(p_text)
+            u_mis = _get_text(intervallo, f".//{ns}UNITA_MISURA")
+
+            if macro == "01": # Comm. Fissa
+                 dati['p_fix_comm'] += prezzo if prezzo > 20 else prezzo * 12
+            elif macro == "02": # Comm. Variabile
+                 if u_mis == "03":
+                    fascia = _map_fascia(_get_text(intervallo, f".//{ns}FASCIA_COMPONENTE"))
+                    dati['p_vol_comm'][fascia] = prezzo
+            elif macro == "04": # Energia
+                if u_mis == "03":
+                    fascia = _map_fascia(_get_text(intervallo, f".//{ns}FASCIA_COMPONENTE", "00"))
+                    if is_variable: dati['spread'][fascia] = prezzo
+                    else: dati['p_vol_qe'][fascia] = prezzo
+                elif u_mis == "02": dati['p_pot_qe'] += prezzo
+            elif macro == "06": # FER
+                 if u_mis == "01": dati['p_fix_fer'] += prezzo if prezzo > 20 else prezzo * 12
+                 elif u_mis == "03":
+                    fascia = _map_fascia(_get_text(intervallo, f".//{ns}FASCIA_COMPONENTE", "00"))
+                    dati['p_vol_fer'][fascia] = prezzo
+
+    return dati
+
+# --- PARSING IN UN SOLO PASSAGGIO ---
+
+_ASSENTE = object()
+
+def _primo(chiave):
+    """Gestore: testo della prima occorrenza del tag (come elem.find('.//TAG'))"""
+    def gestore(stato, elem, padre):
+        if chiave not in stato.campi: stato.campi[chiave] = elem.text
+    return gestore
+
+def _primo_sotto(chiave, tag_padre):
+    """Gestore: prima occorrenza del tag come figlio di `tag_padre` (come find('.//PADRE/TAG'))"""
+    def gestore(stato, elem, padre):
+        if padre.tag == tag_padre and chiave not in stato.campi: stato.campi[chiave] = elem
+    return gestore
+
+def _apri_componente(stato, elem, padre):
+    comp = {'MACROAREA': _ASSENTE, 'intervalli': []}
+    stato.componenti.append(comp)
+    stato.comp_aperte.append(comp)
+    return stato.comp_aperte.pop
+
+def _macroarea(stato, elem, padre):
+    for comp in stato.comp_aperte:
+        if comp['MACROAREA'] is _ASSENTE: comp['MACROAREA'] = elem.text
+
+def _apri_intervallo(stato, elem, padre):
+    intervallo = {}
+    for comp in stato.comp_aperte:
+        comp['intervalli'].append(intervallo)
+    stato.int_aperti.append(intervallo)
+    return stato.int_aperti.pop
+
+def _campo_intervallo(chiave):
+    def gestore(stato, elem, padre):
+        for intervallo in stato.int_aperti:
+            intervallo.setdefault(chiave, elem.text)
+    return gestore
+
+@lru_cache(maxsize=None)
+def _tabella_tag(ns):
+    """Tabella tag -> gestore per il namespace del file"""
+    return {
+        f"{ns}NOME_OFFERTA": _primo('nome'),
+        f"{ns}COD_OFFERTA": _primo('codice'),
+        f"{ns}TIPO_CLIENTE": _primo_sotto('tipo_cliente', f"{ns}DettaglioOfferta"),
+        f"{ns}IDX_PREZZO_ENERGIA": _primo_sotto('idx', f"{ns}RiferimentiPrezzoEnergia"),
+        f"{ns}ComponenteImpresa": _apri_componente,
+        f"{ns}MACROAREA": _macroarea,
+        f"{ns}IntervalloPrezzi": _apri_intervallo,
+        f"{ns}PREZZO": _campo_intervallo('PREZZO'),
+        f"{ns}UNITA_MISURA": _campo_intervallo('UNITA_MISURA'),
+        f"{ns}FASCIA_COMPONENTE": _campo_intervallo('FASCIA_COMPONENTE'),
+    }
+
+class _StatoOfferta:
+    __slots__ = ('campi', 'componenti', 'comp_aperte', 'int_aperti')
+
+    def __init__(self):
+        self.campi = {}
+        self.componenti = []   # in ordine di documento, ognuna con i propri IntervalloPrezzi
+        self.comp_aperte = []
+        self.int_aperti = []
+
+def _visita(elem, tabella, stato):
+    for figlio in elem:
+        gestore = tabella.get(figlio.tag)
+        chiudi = gestore(stato, figlio, elem) if gestore is not None else None
+        if len(figlio): _visita(figlio, tabella, stato)
+        if chiudi is not None: chiudi()
+
+def _parsa_offerta(offerta, ns):
+    """
+    Dizionario `dati` di un elemento <offerta>, identico a _parsa_offerta_xpath.
+    Il sottoalbero viene visitato una sola volta smistando i tag con _tabella_tag;
+    i prezzi si applicano a fine visita, quando MACROAREA e tipo prezzo sono noti.
+    """
+    stato = _StatoOfferta()
+    _visita(offerta, _tabella_tag(ns), stato)
+    campi = stato.campi
+
+    tipo_node = campi.get('tipo_cliente')
+    tipo_code = tipo_node.text if tipo_node is not None else "01"
+    tipo_cliente_label = "Domestico" if tipo_code == "01" else "Business"
+
+    idx_node = campi.get('idx')
+    is_variable = True if (idx_node is not None and idx_node.text and idx_node.text.strip()) else False
+
+    dati = {
+        'nome': campi.get('nome', "Sconosciuto"), 'codice': campi.get('codice', ""),
+        'target': tipo_cliente_label,
+        'tipo_prezzo': "Variabile" if is_variable else "Fisso",
+        'p_fix_comm': 0.0, 'p_vol_comm': {}, 
+        'p_fix_fer': 0.0, 'p_vol_fer': {}, 
+        'p_vol_qe': {}, 'spread': {}, 'p_pot_qe': 0.0
+    }
+
+    for comp in stato.componenti:
+        macro = comp['MACROAREA']
+        if macro is _ASSENTE or not macro: continue  # come _get_text(comp, MACROAREA) -> None
+
+        for intervallo in comp['intervalli']:
+            prezzo = _safe_float(intervallo.get('PREZZO'))
+            u_mis = intervallo.get('UNITA_MISURA')
+
+            if macro == "01": # Comm. Fissa
+                dati['p_fix_comm'] += prezzo if prezzo > 20 else prezzo * 12
+            elif macro == "02": # Comm. Variabile
+                if u_mis == "03":
+                    dati['p_vol_comm'][_map_fascia(intervallo.get('FASCIA_COMPONENTE'))] = prezzo
+            elif macro == "04": # Energia
+                if u_mis == "03":
+                    fascia = _map_fascia(intervallo.get('FASCIA_COMPONENTE', "00"))
+                    if is_variable: dati['spread'][fascia] = prezzo
+                    else: dati['p_vol_qe'][fascia] = prezzo
+                elif u_mis == "02": dati['p_pot_qe'] += prezzo
+            elif macro == "06": # FER
+                if u_mis == "01": dati['p_fix_fer'] += prezzo if prezzo > 20 else prezzo * 12
+                elif u_mis == "03":
+                    dati['p_vol_fer'][_map_fascia(intervallo.get('FASCIA_COMPONENTE', "00"))] = prezzo
+
+    return dati
+
+# --- LETTURA IN STREAMING ---
+
+_DICHIARAZIONE_XML = re.compile(rb'\s*<\?xml[^>]*?encoding\s*=\s*["\']([A-Za-z0-9._-]+)["\']')
+
+def _encoding_xml(inizio):
+    """Encoding dai primi byte del file: BOM o dichiarazione XML, altrimenti UTF-8"""
+    if inizio.startswith(codecs.BOM_UTF8): return 'utf-8-sig'
+    if inizio.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)): return 'utf-16'
+    m = _DICHIARAZIONE_XML.match(inizio)
+    if m:
+        try: return codecs.lookup(m.group(1).decode('ascii')).name
+        except LookupError: pass
+    return 'utf-8'
+
+def iter_offerte_xml(path, chunk_size=1 << 16):
+    """
+    Generatore dei dizionari `dati` letti in streaming dall'XML Mercato Libero.
+    Il file viene letto e decodificato a blocchi (encoding dalla dichiarazione XML);
+    ogni <offerta> viene convertita appena si chiude e poi staccata dall'albero,
+    quindi la memoria resta limitata a un'offerta alla volta.
+    Solleva ET.ParseError se l'XML è malformato.
+    """
+    with open(path, 'rb') as f:
+        blocco = f.read(chunk_size)
+        encoding = _encoding_xml(blocco[:1024])
+        decoder = codecs.getincrementaldecoder(encoding)()
+        parser = ET.XMLPullParser(events=('start', 'end'))
+        ns = None
+        aperti = []   # elementi aperti: il genitore da cui staccare l'offerta letta
+        in_offerta = 0
+
+        while True:
+            fine = not blocco
+            try:
+                testo = decoder.decode(blocco, final=fine)
+            except UnicodeDecodeError:
+                if encoding != 'utf-8': raise
+                # Come la lettura completa: file non UTF-8 senza dichiarazione -> latin-1
+                encoding, pendenti = 'latin-1', decoder.getstate()[0]
+                decoder = codecs.getincrementaldecoder(encoding)()
+                testo = decoder.decode(pendenti + blocco, final=fine)
+            if fine:
+                parser.close()
+            else:
+                parser.feed(testo)
+
+            for evento, elem in parser.read_events():
+                if evento == 'start':
+                    if ns is None:
+                        ns = elem.tag.split('}')[0] + "}" if '}' in elem.tag else ""
+                    if elem.tag == f"{ns}offerta": in_offerta += 1
+                    aperti.append(elem)
+                    continue
+                aperti.pop()
+                if elem.tag != f"{ns}offerta": continue
+                in_offerta -= 1
+                if in_offerta: continue
+                yield _parsa_offerta(elem, ns)
+                if aperti: aperti[-1].remove(elem)
+                elem.clear()
+
+            if fine: break
+            blocco = f.read(chunk_size)
+
+# --- FORMATO COLONNARE / SNAPSHOT ---
+
+FASCE = ('F0', 'F1', 'F2', 'F3', 'F23')
+CAMPI_TESTO = ('nome', 'codice', 'target', 'tipo_prezzo')
+CAMPI_FISSI = ('p_fix_comm', 'p_fix_fer', 'p_pot_qe')
+CAMPI_FASCE = ('p_vol_comm', 'p_vol_fer', 'p_vol_qe', 'spread')
+
+def offerte_to_columns(lista_offerte):
+    """
+    Converte la lista di dizionari `dati` in colonne numpy.
+    I prezzi per fascia diventano matrici (n, len(FASCE)) con NaN dove la fascia manca;
+    `<campo>_first` conserva la prima fascia inserita (usata da calcola_dettaglio).
+    """
+    n = len(lista_offerte)
+    cols = {k: [o[k] for o in lista_offerte] for k in CAMPI_TESTO}
+    for k in CAMPI_FISSI:
+        cols[k] = np.array([o[k] for o in lista_offerte], dtype=float)
+    for k in CAMPI_FASCE:
+        valori = np.full((n, len(FASCE)), np.nan)
+        first = np.full(n, -1, dtype=np.int8)
+        for i, o in enumerate(lista_offerte):
+            for j, (fascia, prezzo) in enumerate(o[k].items()):
+                valori[i, FASCE.index(fascia)] = prezzo
+                if j == 0: first[i] = FASCE.index(fascia)
+        cols[k] = valori
+        cols[k + '_first'] = first
+    return cols
+
+def columns_to_offerte(cols):
+    """
+    Inverso di offerte_to_columns: ricostruisce i dizionari `dati` (in memoria, come il parsing).
+    I testi mancanti sono None solo se marcati in `<campo>.missing` (vedi snapshot.text_values).
+    """
+    n = len(cols['p_fix_comm'])
+    testo = {k: [None if v is None else str(v) for v in text_values(cols, k)] for k in CAMPI_TESTO}
+    fissi = {k: np.asarray(cols[k]).tolist() for k in CAMPI_FISSI}
+    fasce = {}
+    for k in CAMPI_FASCE:
+        valori = np.asarray(cols[k])
+        first = np.asarray(cols[k + '_first'])
+        righe = []
+        for i in range(n):
+            d = {}
+            if first[i] >= 0:
+                d[FASCE[first[i]]] = float(valori[i, first[i]])
+            for j in np.flatnonzero(~np.isnan(valori[i])):
+                if j != first[i]: d[FASCE[j]] = float(valori[i, j])
+            righe.append(d)
+        fasce[k] = righe
+
+    lista_offerte = []
+    for i in range(n):
+        dati = {k: testo[k][i] for k in CAMPI_TESTO}
+        dati.update({k: fissi[k][i] for k in CAMPI_FISSI})
+        dati.update({k: fasce[k][i] for k in CAMPI_FASCE})
+        lista_offerte.append(dati)
+    return lista_offerte
+
+def _parsa_file_xml(path):
+    try:
+        return list(iter_offerte_xml(path))
+    except ET.ParseError:
+        return []
+
+def carica_offerte_xml(path):
+    """Offerte dallo snapshot binario se valido (niente parsing), altrimenti parsando l'XML"""
+    snap = read_snapshot(path)
+    if snap is not None:
+        return columns_to_offerte(snap[0])
+    return _parsa_file_xml(path)
+
+def compile_offerte_xml(path):
+    """Compila l'XML Mercato Libero in uno snapshot binario (vedi utils.snapshot)"""
+    return write_snapshot(path, offerte_to_columns(_parsa_file_xml(path)), text_columns=CAMPI_TESTO)
+
+# --- ARCHIVIO INCREMENTALE ---
+# Da uno snapshot mensile al successivo la maggior parte delle offerte non cambia:
+# ogni <offerta> ha un'impronta (hash dei suoi byte nel file) e all'arrivo di un nuovo
+# file si parsano solo le offerte con impronta nuova; le altre riusano i `dati` già letti.
+
+_OFFERTA_XML = re.compile(rb'<((?:[\w.-]+:)?)offerta[\s>].*?</\1offerta\s*>', re.S)
+_COD_OFFERTA_XML = re.compile(rb'<(?:[\w.-]+:)?COD_OFFERTA\s*>([^<]*)<')
+_TAG_APERTURA = re.compile(rb'<(?![?!/])([^\s>/]+)[^>]*>')
+
+def _impronta(blocco):
+    return hashlib.blake2b(blocco, digest_size=16).digest()
+
+class ArchivioOfferte:
+    """
+    Offerte di un file XML con l'impronta e il codice di ciascuna, più il resoconto
+    dell'ultimo aggiornamento: {'aggiunte', 'rimosse', 'modificate', 'invariate', 'parsate', 'secondi'}.
+    Senza impronte (file non scomponibile) il prossimo aggiornamento riparsa tutto.
+    """
+
+    def __init__(self, offerte, impronte, codici, resoconto):
+        self.offerte = offerte
+        self.impronte = impronte
+        self.codici = codici
+        self.resoconto = resoconto
+
+def _resoconto(precedente, impronte, codici):
+    """Conteggi aggiunte/rimosse/modificate/invariate rispetto alle offerte precedenti (impronta -> codice)"""
+    presenti = set(impronte)
+    nuove = [c for k, c in zip(impronte, codici) if k not in precedente]
+    vecchie = [c for k, c in precedente.items() if k not in presenti]
+    codici_nuovi, codici_vecchi = set(nuove), set(vecchie)
+    modificate = sum(1 for c in nuove if c in codici_vecchi)
+    return {
+        'aggiunte': len(nuove) - modificate,
+        'rimosse': sum(1 for c in vecchie if c not in codici_nuovi),
+        'modificate': modificate,
+        'invariate': len(impronte) - len(nuove),
+    }
+
+def _scansiona_offerte(mappa):
+    """
+    Impronta, codice e posizione (inizio, fine) di ogni <offerta> del file in memory-map,
+    senza albero XML e senza copiarne i byte, più apertura e chiusura della radice per parsare
+    ogni blocco da solo con namespace ed encoding originali.
+    None se il file non si presta (UTF-16, radice <offerta>, nessuna offerta).
+    """
+    if mappa[:2] in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE):
+        return None
+    radice = _TAG_APERTURA.search(mappa)
+    if radice is None or radice.group(1).split(b':')[-1] == b'offerta':
+        return None
+    voci = []
+    with memoryview(mappa) as vista:
+        for m in _OFFERTA_XML.finditer(mappa, radice.end()):
+            inizio, fine = m.span()
+            codice = _COD_OFFERTA_XML.search(mappa, inizio, fine)
+            voci.append((_impronta(vista[inizio:fine]),
+                         codice.group(1).decode('utf-8', 'replace').strip() if codice else '', inizio, fine))
+    if not voci:
+        return None
+    return mappa[:radice.end()], b'</' + radice.group(1) + b'>', voci
+
+def _parsa_blocchi(mappa, apertura, chiusura, voci, noti):
+    """
+    `dati` di ogni offerta: quelle con impronta in `noti` vengono riusate, le altre parsate
+    copiando dalla memory-map solo il loro blocco. (offerte, parsate), None se un blocco non si parsa da solo.
+    """
+    offerte, parsate = [], 0
+    try:
+        for impronta, _, inizio, fine in voci:
+            if impronta not in noti:
+                radice = ET.fromstring(apertura + mappa[inizio:fine] + chiusura)
+                ns = radice.tag.split('}')[0] + "}" if '}' in radice.tag else ""
+                noti[impronta] = _parsa_offerta(radice[0], ns)
+                parsate += 1
+            offerte.append(noti[impronta])
+    except ET.ParseError:
+        return None  # es. latin-1 senza dichiarazione: parsing completo
+    return offerte, parsate
+
+def _offerte_da_snapshot(path):
+    snap = read_snapshot(path)
+    return columns_to_offerte(snap[0]) if snap is not None else None
+
+def aggiorna_offerte_xml(path, precedente=None):
+    """
+    ArchivioOfferte del file XML. Con `precedente` (archivio di uno snapshot precedente) solo
+    le offerte aggiunte o modificate vengono parsate in `dati`, le altre vengono riusate:
+    il risultato è identico a un parsing completo e il costo segue il numero di modifiche.
+    Oltre ai `dati` restano in memoria solo impronta, codice e posizione di ogni offerta.
+    """
+    inizio = time.perf_counter()
+    noti = {}
+    if precedente is not None:
+        noti = {k: o for k, o in zip(precedente.impronte, precedente.offerte) if k is not None}
+
+    letto = None
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mappa:
+                scomposto = _scansiona_offerte(mappa)
+                if scomposto is not None:
+                    apertura, chiusura, voci = scomposto
+                    impronte = [v[0] for v in voci]
+                    codici = [v[1] for v in voci]
+                    if precedente is None:
+                        # primo caricamento: `dati` dallo snapshot binario, se valido e allineato
+                        snapshot = _offerte_da_snapshot(path)
+                        if snapshot is not None and len(snapshot) == len(voci):
+                            noti = dict(zip(impronte, snapshot))
+                    letto = _parsa_blocchi(mappa, apertura, chiusura, voci, noti)
+
+    if letto is None:
+        offerte = _parsa_file_xml(path)
+        impronte, codici, parsate = [None] * len(offerte), [o['codice'] for o in offerte], len(offerte)
+    else:
+        offerte, parsate = letto
+
+    if precedente is not None:
+        resoconto = _resoconto(dict(zip(precedente.impronte, precedente.codici)), impronte, codici)
+    else:
+        resoconto = {'aggiunte': len(offerte), 'rimosse': 0, 'modificate': 0, 'invariate': 0}
+    resoconto.update(parsate=parsate, secondi=time.perf_counter() - inizio)
+    return ArchivioOfferte(offerte, impronte, codici, resoconto)
+
+# --- DATI CONDIVISI TRA LE SESSIONI ---
+# Offerte, parametri e PUN vengono letti una volta per processo dal registro dei
+# cataloghi e ricaricati solo se il file cambia (mtime/dimensione + SHA-256).
+# I valori restituiti sono condivisi: vanno trattati in sola lettura.
+
+PUN_DEFAULT = {'F1': 0.12, 'F2': 0.11, 'F3': 0.10}
+
+def load_archivio_xml(path):
+    """ArchivioOfferte del file, aggiornato in modo incrementale quando il file cambia"""
+    return registry.get(path, aggiorna_offerte_xml, namespace='mlibero', incremental=True)
+
+def load_offerte_xml(path):
+    return load_archivio_xml(path).offerte
+
+def load_parametri(path):
+    return registry.get(path, carica_parametri_da_csv, namespace='parametri')
+
+def load_pun(path):
+    """PUN medio per fascia (PUN_DEFAULT se il file non c'è)"""
+    if not os.path.exists(path):
+        return PUN_DEFAULT
+    return registry.get(path, carica_pun_da_csv, namespace='pun')
+
+def load_tariffe(path_xml, path_parametri, path_pun, target):
+    """
+    Tariffe compilate (CalcolatoreSpesa.compila) delle offerte per `target`, condivise tra le sessioni.
+    La versione dipende da tutti e tre i file: se uno cambia si ricompila.
+    """
+    parametri = load_parametri(path_parametri)
+    pun = load_pun(path_pun)
+    versione = (registry.fingerprint(path_parametri, 'parametri'), registry.fingerprint(path_pun, 'pun'))
+
+    def compila(path, precedente):
+        # solo le offerte nuove o modificate vengono ricompilate (chiave = impronta)
+        archivio = load_archivio_xml(path)
+        scelte = [i for i, o in enumerate(archivio.offerte) if o['target'] == target]
+        return CalcolatoreSpesa(parametri, pun).compila([archivio.offerte[i] for i in scelte],
+                                                        [archivio.impronte[i] for i in scelte], precedente)
+
+    return registry.get(path_xml, compila, namespace=f'tariffe:{target}:{versione[0]}:{versione[1]}',
+                        incremental=True)
+
+# --- 2. CLASSE CALCOLO ---
+
+class CalcolatoreSpesa:
+    def __init__(self, parametri_csv, pun_medio):
+        if not isinstance(parametri_csv, ParametriArera):
+            parametri_csv = ParametriArera(parametri_csv)
+        self.p = parametri_csv
+        self.pun = pun_medio
+
+    def calcola_dettaglio(self, dati_offerta, profilo):
+        consumo_tot = profilo['consumo_annuo']
+        potenza = profilo['potenza']
+        consumi_fasce = {k: consumo_tot * v for k, v in profilo['ripartizione'].items()}
+
+        c_energia = 0.0
+        
+        if dati_offerta['tipo_prezzo'] == "Fisso":
+            prezzi = dati_offerta['p_vol_qe']
+            if len(prezzi) == 1 or 'F0' in prezzi:
+                c_energia += list(prezzi.values())[0] * consumo_tot
+            else:
+                for f, kwh in consumi_fasce.items():
+                    p = prezzi.get(f, prezzi.get('F0', prezzi.get('F1', 0.15)))
+                    c_energia += p * kwh
+        elif dati_offerta['tipo_prezzo'] == 'Variabile':
+            spreads = dati_offerta['spread']
+            lambda_val = self.p.lambda_
+            for f, kwh in consumi_fasce.items():
+                pun_f = self.pun.get(f, self.pun.get('F0', 0.12))
+                spread_f = spreads.get(f, spreads.get('F0', spreads.get('F1', 0.0)))
+                prezzo_finito = (pun_f * (1 + lambda_val)) + spread_f
+                c_energia += prezzo_finito * kwh
+
+        prezzi_fer = dati_offerta['p_vol_fer']
+        if prezzi_fer:
+            if len(prezzi_fer) == 1 or 'F0' in prezzi_fer:
+                 c_energia += list(prezzi_fer.values())[0] * consumo_tot
+            else:
+                for f, kwh in consumi_fasce.items():
+                    p = prezzi_fer.get(f, prezzi_fer.get('F0', 0.0))
+                    c_energia += p * kwh
+
+        spesa_materia_energia = (
+            dati_offerta['p_fix_fer'] + (dati_offerta['p_pot_qe'] * potenza) + 
+            c_energia + (self.p.ppe * consumo_tot)
+        )
+
+        key_dispbt = 'dispbt_d' if profilo['residente'] and profilo['target'] == 'Domestico' else 'dispbt_nd'
+        dispbt = getattr(self.p, key_dispbt)
+        
+        comm_var_tot = 0.0
+        prezzi_comm = dati_offerta['p_vol_comm']
+        if prezzi_comm:
+             if len(prezzi_comm) == 1 or 'F0' in prezzi_comm:
+                 comm_var_tot += list(prezzi_comm.values())[0] * consumo_tot
+             else:
+                 for f, kwh in consumi_fasce.items():
+                     comm_var_tot += prezzi_comm.get(f, 0.0) * kwh
+
+        spesa_comm = dati_offerta['p_fix_comm'] + comm_var_tot + self.p.pcv_c + dispbt
+        spesa_disp = self.p.cdispd * (1 + self.p.lambda_) * consumo_tot
+        
+        s_rete = (self.p.sigma1 + 
+                  (self.p.sigma2 + self.p.uc6s_d) * potenza + 
+                  (self.p.sigma3 + self.p.uc3 + self.p.uc6p_d) * consumo_tot)
+        
+        if profilo['target'] == 'Domestico' and profilo['residente']:
+             s_oneri = (self.p.asos_dr + self.p.arim_dr) * consumo_tot
+        else:
+             s_oneri = (self.p.asos_dnr_f + self.p.arim_dnr_f + 
+                        (self.p.asos_dnr_v + self.p.arim_dnr_v) * consumo_tot)
+
+        accise = 0.0
+        if profilo['target'] == 'Domestico' and profilo['residente'] and potenza <= 3:
+            if consumo_tot > 1800:
+                 accise = self.p.acc_c_r_l * (consumo_tot - 1800)
+        elif profilo['target'] != 'Domestico':
+             accise = self.p.acc_a_l_l * consumo_tot
+        else:
+             accise = self.p.acc_c_nr * consumo_tot
+
+        imponibile = spesa_materia_energia + spesa_comm + spesa_disp + s_rete + s_oneri + accise
+        totale_con_iva = imponibile * 1.10
+        
+        return {
+            "Totale Mensile": round(totale_con_iva / 12, 2),
+            "Totale Annuo": round(totale_con_iva, 2),
+            "Materia Energia": round(spesa_materia_energia, 2),
+            "Fisso Vendita": round(dati_offerta['p_fix_comm'], 2),
+            "Imposte": round(accise + (imponibile * 0.10), 2)
+        }
+
+    # --- Percorso compilato (vettoriale) ---
+
+    def _termini_profilo(self, profilo):
+        """Termini di calcola_dettaglio che dipendono solo dal profilo e dai parametri ARERA"""
+        consumo_tot = profilo['consumo_annuo']
+        potenza = profilo['potenza']
+
+        key_dispbt = 'dispbt_d' if profilo['residente'] and profilo['target'] == 'Domestico' else 'dispbt_nd'
+        spesa_disp = self.p.cdispd * (1 + self.p.lambda_) * consumo_tot
+        s_rete = (self.p.sigma1 + 
+                  (self.p.sigma2 + self.p.uc6s_d) * potenza + 
+                  (self.p.sigma3 + self.p.uc3 + self.p.uc6p_d) * consumo_tot)
+
+        if profilo['target'] == 'Domestico' and profilo['residente']:
+             s_oneri = (self.p.asos_dr + self.p.arim_dr) * consumo_tot
+        else:
+             s_oneri = (self.p.asos_dnr_f + self.p.arim_dnr_f + 
+                        (self.p.asos_dnr_v + self.p.arim_dnr_v) * consumo_tot)
+
+        accise = 0.0
+        if profilo['target'] == 'Domestico' and profilo['residente'] and potenza <= 3:
+            if consumo_tot > 1800:
+                 accise = self.p.acc_c_r_l * (consumo_tot - 1800)
+        elif profilo['target'] != 'Domestico':
+             accise = self.p.acc_a_l_l * consumo_tot
+        else:
+             accise = self.p.acc_c_nr * consumo_tot
+
+        return {
+            'ppe': self.p.ppe, 'pcv_c': self.p.pcv_c,
+            'dispbt': getattr(self.p, key_dispbt), 'spesa_disp': spesa_disp,
+            's_rete': s_rete, 's_oneri': s_oneri, 'accise': accise,
+        }
+
+    def compila(self, lista_offerte, chiavi=None, precedente=None):
+        """Coefficienti per offerta del catalogo, valutabili su qualsiasi profilo (vedi TariffeCompilate)"""
+        return TariffeCompilate(self, lista_offerte, chiavi, precedente)
+
+
+VOCI = ("Totale Mensile", "Totale Annuo", "Materia Energia", "Fisso Vendita", "Imposte")
+
+def _centesimi(valori):
+    # np.round differisce da round() di Python solo vicino al mezzo centesimo:
+    # lì si usa round() sul valore esatto, come nel calcolo scalare
+    arrotondati = np.round(valori, 2)
+    dubbi = np.abs(np.abs(valori * 100) % 1 - 0.5) < 1e-6
+    arrotondati[dubbi] = [round(v, 2) for v in valori[dubbi].tolist()]
+    return arrotondati
+
+def _prezzo_unico(prezzi):
+    """Prezzo applicato a tutto il consumo (una sola fascia o F0), come in calcola_dettaglio"""
+    if len(prezzi) == 1 or 'F0' in prezzi:
+        return list(prezzi.values())[0]
+    return None
+
+class _QuotaKwh:
+    """Quota €/kWh di una componente: prezzo unico sul consumo totale o prezzo per fascia"""
+
+    def __init__(self, n):
+        self.piatta = np.zeros(n, dtype=bool)
+        self.unico = np.zeros(n)
+        self.fasce = np.zeros((n, len(FASCE)))
+
+    def imposta(self, i, prezzi, per_fascia, vuoti=False):
+        """Coefficienti dell'offerta i; senza prezzi la quota vale 0 (o i default per fascia se `vuoti`)"""
+        if not prezzi and not vuoti:
+            return
+        unico = _prezzo_unico(prezzi) if prezzi else None
+        if unico is not None:
+            self.piatta[i], self.unico[i] = True, unico
+        else:
+            self.fasce[i] = [per_fascia(f) for f in FASCE]
+
+    def copia(self, righe, sorgente, righe_sorgente):
+        """Coefficienti già compilati presi da un'altra quota"""
+        self.piatta[righe] = sorgente.piatta[righe_sorgente]
+        self.unico[righe] = sorgente.unico[righe_sorgente]
+        self.fasce[righe] = sorgente.fasce[righe_sorgente]
+
+    def somma(self, base, consumo_tot, consumi_fasce):
+        """base + costo della quota, sommando fascia per fascia nello stesso ordine del calcolo scalare"""
+        per_fascia = base
+        for j, kwh in consumi_fasce:
+            per_fascia = per_fascia + self.fasce[:, j] * kwh
+        return np.where(self.piatta, base + self.unico * consumo_tot, per_fascia)
+
+def _prezzi_variabili(offerta, pun, lambda_val):
+    """Prezzi €/kWh per fascia di un'offerta variabile: PUN * (1 + lambda) + spread"""
+    spreads = offerta['spread']
+    return [(pun.get(f, pun.get('F0', 0.12)) * (1 + lambda_val)) + spreads.get(f, spreads.get('F0', spreads.get('F1', 0.0)))
+            for f in FASCE]
+
+class TariffeCompilate:
+    """
+    Versione compilata di CalcolatoreSpesa.calcola_dettaglio per un intero elenco di offerte.
+    Offerte, parametri ARERA e PUN diventano array di coefficienti per offerta (quote fisse,
+    quota per kW, prezzi €/kWh per fascia o unici); calcola(profilo) valuta tutto il catalogo
+    con poche operazioni vettoriali, negli stessi passaggi aritmetici del calcolo scalare,
+    che resta il riferimento.
+    """
+
+    def __init__(self, calcolatore, lista_offerte, chiavi=None, precedente=None):
+        """
+        `chiavi` (facoltative) identificano il contenuto di ogni offerta, ad esempio le impronte
+        di ArchivioOfferte: le offerte con chiave già presente in `precedente` (compilato con
+        gli stessi parametri e PUN) riusano i coefficienti invece di essere ricompilate.
+        """
+        self.calcolatore = calcolatore
+        self.offerte = lista_offerte
+        self.chiavi = list(chiavi) if chiavi is not None else None
+        n = len(lista_offerte)
+        self.p_fix_comm = np.zeros(n)
+        self.p_fix_fer = np.zeros(n)
+        self.p_pot_qe = np.zeros(n)
+        self.energia, self.fer, self.comm = _QuotaKwh(n), _QuotaKwh(n), _QuotaKwh(n)
+
+        da_compilare = range(n)
+        if self.chiavi is not None and precedente is not None and precedente.chiavi is not None:
+            indice = {k: i for i, k in enumerate(precedente.chiavi) if k is not None}
+            riuso = [(i, indice[k]) for i, k in enumerate(self.chiavi) if k in indice]
+            if riuso:
+                nuove, vecchie = (np.array(x) for x in zip(*riuso))
+                for nome in ('p_fix_comm', 'p_fix_fer', 'p_pot_qe'):
+                    getattr(self, nome)[nuove] = getattr(precedente, nome)[vecchie]
+                for quota, vecchia in ((self.energia, precedente.energia), (self.fer, precedente.fer),
+                                       (self.comm, precedente.comm)):
+                    quota.copia(nuove, vecchia, vecchie)
+                riusate = np.zeros(n, dtype=bool)
+                riusate[nuove] = True
+                da_compilare = np.flatnonzero(~riusate).tolist()
+        self.compilate = len(da_compilare)
+        self.variabili = [i for i, o in enumerate(lista_offerte) if o['tipo_prezzo'] == 'Variabile']
+
+        pun = calcolatore.pun
+        lambda_val = calcolatore.p.lambda_
+        for i in da_compilare:
+            o = lista_offerte[i]
+            self.p_fix_comm[i], self.p_fix_fer[i], self.p_pot_qe[i] = o['p_fix_comm'], o['p_fix_fer'], o['p_pot_qe']
+            if o['tipo_prezzo'] == "Fisso":
+                p = o['p_vol_qe']
+                self.energia.imposta(i, p, lambda f: p.get(f, p.get('F0', p.get('F1', 0.15))), vuoti=True)
+            elif o['tipo_prezzo'] == 'Variabile':
+                self.energia.fasce[i] = _prezzi_variabili(o, pun, lambda_val)
+            p = o['p_vol_fer']
+            self.fer.imposta(i, p, lambda f: p.get(f, p.get('F0', 0.0)))
+            p = o['p_vol_comm']
+            self.comm.imposta(i, p, lambda f: p.get(f, 0.0))
+
+    def con_pun(self, pun):
+        """
+        Stesse tariffe con un altro PUN per fascia: si ricalcolano solo i prezzi energia delle
+        offerte variabili, il resto dei coefficienti è condiviso (in sola lettura) con self.
+        """
+        copia = copy.copy(self)
+        copia.calcolatore = CalcolatoreSpesa(self.calcolatore.p, pun)
+        copia.energia = copy.copy(self.energia)
+        copia.energia.fasce = self.energia.fasce.copy()
+        for i in self.variabili:
+            copia.energia.fasce[i] = _prezzi_variabili(self.offerte[i], pun, self.calcolatore.p.lambda_)
+        return copia
+
+    def _voci(self, consumo_tot, potenza, ripartizione, t):
+        """
+        Voci non arrotondate di calcola_dettaglio. consumo_tot, potenza e i termini `t`
+        possono essere scalari o array con l'ultimo asse di lunghezza 1 (griglie di profili):
+        l'asse delle offerte è sempre l'ultimo.
+        """
+        consumi_fasce = [(FASCE.index(k), consumo_tot * v) for k, v in ripartizione.items()]
+        zero = np.zeros(len(self.offerte))
+
+        c_energia = self.fer.somma(self.energia.somma(zero, consumo_tot, consumi_fasce), consumo_tot, consumi_fasce)
+        spesa_materia_energia = self.p_fix_fer + (self.p_pot_qe * potenza) + c_energia + (t['ppe'] * consumo_tot)
+
+        comm_var_tot = self.comm.somma(zero, consumo_tot, consumi_fasce)
+        spesa_comm = self.p_fix_comm + comm_var_tot + t['pcv_c'] + t['dispbt']
+
+        imponibile = spesa_materia_energia + spesa_comm + t['spesa_disp'] + t['s_rete'] + t['s_oneri'] + t['accise']
+        totale_con_iva = imponibile * 1.10
+
+        return {
+            "Totale Mensile": totale_con_iva / 12,
+            "Totale Annuo": totale_con_iva,
+            "Materia Energia": spesa_materia_energia,
+            "Fisso Vendita": np.broadcast_to(self.p_fix_comm, imponibile.shape),
+            "Imposte": t['accise'] + (imponibile * 0.10),
+        }
+
+    def calcola(self, profilo) -> dict:
+        """Stesse voci di calcola_dettaglio, come array allineati all'elenco di offerte"""
+        t = self.calcolatore._termini_profilo(profilo)
+        voci = self._voci(profilo['consumo_annuo'], profilo['potenza'], profilo['ripartizione'], t)
+        return {k: _centesimi(v) for k, v in voci.items()}
+
+    def griglia(self, consumi, potenze, ripartizioni, residente, target, voci=VOCI):
+        """
+        Valuta tutto il catalogo su una griglia di profili (consumo annuo x potenza x ripartizione
+        per fascia): per ogni consumo tutte le potenze e tutte le offerte in un solo calcolo
+        vettoriale. Ogni cella è identica a calcola() sul profilo corrispondente.
+        `voci` limita i cubi calcolati (per le mappe basta "Totale Annuo"). Vedi GrigliaCosti.
+        """
+        consumi = np.asarray(consumi, dtype=float)
+        potenze = np.asarray(potenze, dtype=float)
+        # termini del profilo (soglie accise, oneri...) per ogni coppia consumo/potenza
+        termini = [[self.calcolatore._termini_profilo({'consumo_annuo': c, 'potenza': p, 'residente': residente,
+                                                       'target': target})
+                    for p in potenze.tolist()] for c in consumi.tolist()]
+        t = {k: np.array([[cella[k] for cella in riga] for riga in termini])[..., None] for k in termini[0][0]}
+
+        # assi: consumo, potenza, ripartizione, offerta; una riga di consumo alla volta
+        # così i temporanei restano piccoli (potenze x offerte) e vengono riusati
+        ripartizioni = list(ripartizioni)
+        cubi = {k: np.empty((len(consumi), len(potenze), len(ripartizioni), len(self.offerte))) for k in voci}
+        for r, ripartizione in enumerate(ripartizioni):
+            for i, consumo in enumerate(consumi.tolist()):
+                valori = self._voci(consumo, potenze[:, None], ripartizione, {k: v[i] for k, v in t.items()})
+                for k in voci:
+                    cubi[k][i, :, r] = _centesimi(valori[k])
+        return GrigliaCosti(self, consumi, potenze, ripartizioni, cubi)
+
+
+class GrigliaCosti:
+    """
+    Cubo dei costi (consumo x potenza x ripartizione x offerta) prodotto da TariffeCompilate.griglia.
+    `voci` contiene un cubo per voce di calcola_dettaglio; `vincitore` è, per ogni cella,
+    l'indice dell'offerta con il Totale Annuo più basso (parità: la prima in elenco).
+    """
+
+    def __init__(self, tariffe, consumi, potenze, ripartizioni, voci):
+        self.tariffe = tariffe
+        self.consumi = consumi
+        self.potenze = potenze
+        self.ripartizioni = ripartizioni
+        self.voci = voci
+        totale = voci.get("Totale Annuo")
+        self.vincitore = None
+        if totale is not None and totale.shape[-1]:
+            self.vincitore = np.argmin(totale, axis=-1)
+
+    def _indice(self, asse, valore):
+        posizioni = np.flatnonzero(asse == valore)
+        return int(posizioni[0]) if len(posizioni) else None
+
+    def cella(self, consumo, potenza, ripartizione=0):
+        """Indici (consumo, potenza, ripartizione) della cella, None se il profilo non è in griglia"""
+        i, j = self._indice(self.consumi, consumo), self._indice(self.potenze, potenza)
+        if i is None or j is None:
+            return None
+        return i, j, ripartizione
+
+    def risultato(self, consumo, potenza, ripartizione=0):
+        """Voci di tutte le offerte per un profilo della griglia (come calcola), None se fuori griglia"""
+        cella = self.cella(consumo, potenza, ripartizione)
+        if cella is None:
+            return None
+        return {k: v[cella] for k, v in self.voci.items()}
+
+    def migliori(self, ripartizione=0):
+        """Tabella consumo x potenza con l'offerta più economica di ogni cella e il suo Totale Annuo"""
+        vincitore = self.vincitore[:, :, ripartizione]
+        totale = np.take_along_axis(self.voci["Totale Annuo"][:, :, ripartizione], vincitore[..., None], axis=-1)[..., 0]
+        nomi = np.array([o['nome'] for o in self.tariffe.offerte], dtype=object)
+        return nomi[vincitore], totale
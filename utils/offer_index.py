@@ -0,0 +1,103 @@
+from bisect import bisect_left
+import math
+
+import numpy as np
+
+
+class LowerEnvelopeIndex:
+    """
+    Indice sull'inviluppo inferiore di rette costo(x) = x * pendenza + intercetta, con x >= 0.
+
+    Per le offerte x è il consumo annuo, la pendenza il prezzo €/kWh e l'intercetta
+    la quota fissa: la retta più bassa in x è l'offerta più economica per quel consumo.
+    Il livello 0 è l'inviluppo di tutte le rette; il livello j quello delle rette non
+    presenti nei livelli precedenti. Le prime k offerte per qualsiasi x stanno nei
+    primi k livelli, quindi best/top-k costano O(log n) per livello.
+    """
+
+    def __init__(self, pendenze, intercette, righe=None, livelli=10):
+        pendenze = np.asarray(pendenze, dtype=float)
+        intercette = np.asarray(intercette, dtype=float)
+        righe = np.arange(len(pendenze)) if righe is None else np.asarray(righe)
+
+        validi = np.isfinite(pendenze) & np.isfinite(intercette)
+        self._pendenze = pendenze[validi]
+        self._intercette = intercette[validi]
+        self._righe = righe[validi]
+
+        # Ordine: pendenza decrescente, intercetta crescente, posizione originale
+        ordine = np.lexsort((np.arange(len(self._pendenze)), self._intercette, -self._pendenze))
+        self._p = self._pendenze.tolist()
+        self._c = self._intercette.tolist()
+        self.livelli = []
+        for _ in range(livelli):
+            if len(ordine) == 0:
+                break
+            hull, breakpoints = self._inviluppo(ordine)
+            self.livelli.append((hull, breakpoints))
+            ordine = ordine[~np.isin(ordine, hull)]
+        self._residue = len(ordine)
+
+    def _incrocio(self, i, j):
+        """x in cui le rette i e j (pendenza di i > pendenza di j) si incontrano"""
+        return (self._c[j] - self._c[i]) / (self._p[i] - self._p[j])
+
+    def _inviluppo(self, ordine):
+        """Inviluppo inferiore su x >= 0 (convex hull trick) delle rette in `ordine`"""
+        hull = []
+        for i in ordine.tolist():
+            if hull and self._p[hull[-1]] == self._p[i]:
+                continue  # stessa pendenza: tenuta quella con intercetta minore
+            while len(hull) >= 2 and self._incrocio(hull[-2], i) <= self._incrocio(hull[-2], hull[-1]):
+                hull.pop()
+            hull.append(i)
+
+        # Scarta le rette che sono minime solo per x < 0
+        while len(hull) >= 2 and self._incrocio(hull[0], hull[1]) <= 0:
+            hull.pop(0)
+        breakpoints = [self._incrocio(hull[k], hull[k + 1]) for k in range(len(hull) - 1)]
+        return hull, breakpoints
+
+    def _valore(self, i, x):
+        return self._p[i] * x + self._c[i]
+
+    def best(self, x):
+        """Riga della retta più bassa in x (None se l'indice è vuoto)"""
+        if not self.livelli:
+            return None
+        hull, breakpoints = self.livelli[0]
+        return self._righe[hull[bisect_left(breakpoints, x)]]
+
+    def top_k(self, x, k):
+        """Le k righe più economiche in x, in ordine di costo crescente"""
+        if k > len(self.livelli) and self._residue:
+            raise ValueError(f"Indice costruito con {len(self.livelli)} livelli, richiesti {k}")
+
+        candidati = []
+        for hull, breakpoints in self.livelli[:k]:
+            # Lungo un inviluppo i costi in x sono unimodali attorno alla retta attiva:
+            # le k migliori del livello sono contigue e si trovano con due puntatori
+            attiva = bisect_left(breakpoints, x)
+            sx, dx = attiva - 1, attiva + 1
+            presi = [hull[attiva]]
+            while len(presi) < k and (sx >= 0 or dx < len(hull)):
+                v_sx = self._valore(hull[sx], x) if sx >= 0 else math.inf
+                v_dx = self._valore(hull[dx], x) if dx < len(hull) else math.inf
+                if v_sx <= v_dx:
+                    presi.append(hull[sx])
+                    sx -= 1
+                else:
+                    presi.append(hull[dx])
+                    dx += 1
+            candidati.extend(presi)
+
+        candidati.sort(key=lambda i: (self._valore(i, x), i))
+        return [self._righe[i] for i in candidati[:k]]
+
+    def ranges(self):
+        """Intervalli di x in cui ogni retta dell'inviluppo è la migliore: [(riga, da, a)]"""
+        if not self.livelli:
+            return []
+        hull, breakpoints = self.livelli[0]
+        limiti = [0.0] + list(breakpoints) + [math.inf]
+        return [(self._righe[i], limiti[k], limiti[k + 1]) for k, i in enumerate(hull)]
@@ -1,141 +1,235 @@
 from streamlit import secrets
-import requests
 import base64
+import hashlib
 import json
 
+from . import estrazione_hedged as hedge
+from .estrazione_locale import PARSER_VERSION, estrai
+from .extraction_cache import chiave_estrazione, extraction_cache
+from .http_transport import OPENROUTER_BASE_URL, TIMEOUT, sessione
 
-def pdf_request(model, data, **kwargs) -> dict:
-    ''' Placeholder until the Python OpenRouter SDK implements the pdf reading functionality natively.'''
-
-    fields_to_extract = [
-        "Tipologia di cliente",
-        "residente",
-        "Consumo annuo",
-        "Comune di fornitura",
-        "Prezzo bolletta totale",
-        "Importo canone televisione per uso privato",
-        "Potenza impegnata",
-        "Accise e IVA",
-        "Quota per consumi",
-        "Codice offerta",
-        "Consumo Annuo F1",
-        "Consumo Annuo F2",
-        "Consumo Annuo F3",
-    ] #also change json_schema in reqeust
-    
-    response = requests.post(
-        url='https://openrouter.ai/api/v1/chat/completions', 
-        headers={
-            "Authorization": f"Bearer {secrets['OPENROUTER_API_KEY']}",
-            "Content-Type": "application/json"
-        }, 
-        json={
-            'model': model['id'],
-            'messages': [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Create a summary of the information about this electricity bill, in syntactically correct json format."+
-                            "You must include ONLY these fields: "+ ", ".join(fields_to_extract)+
-                            "Do NOT include units. Name the fields EXACTLY as the request."+
-                            "Numbers must be treated as number. If there is a decimal number, separate with a dot"+
-                            "The kind of client MUST be either 'Domestico' or 'Business', and there must be a boolean value"+
-                            "that indicates if a client is 'residente' or not"
-                        },
-                        {
-                            "type": "file",
-                            "file": {
-                                "filename": "document.pdf",
-                                "file_data": f"data:application/pdf;base64,{base64.b64encode(data).decode('utf-8')}"
-                            }
-                        },
-                    ]
-                }
-            ],
-            'stream': False,
-            'response_format': {
-                'type': 'json_schema',
-                "json_schema": {
-                    "name": "Bill analysis",
-                    "strict": True,
-                    "schema": {
-                        "type": "object",
-                        "properties": {
-                            "client_type": {
-                                "type": "string",
-                                "description":  "Either 'Domestico residente' or 'Domestico non residente' or 'Business'"
-                            },
-                            "resident": {
-                                "type": "boolean",
-                                "description": "Client is resident in city of bill"
-                            },
-                            "annual_consume": {
-                                "type": "number",
-                                "description": "Consumo annuo"
-                            },
-                            "city": {
-                                "type": "string",
-                                "description": "città di fornitura"
-                            },
-                            "total_price": {
-                                "type": "number",
-                                "description": "Raw price of the bill"
-                            },
-                            "tv_price": {
-                                "type": "number",
-                                "description": "Price of canone tv"
-                            },
-                            "potenza_impegnata": {
-                                "type": "number",
-                                "description": "Potenza impeganta"
-                            },
-                            "taxes": {
-                                "type": "number",
-                                "description": "Accise & IVA"
-                            },
-                            "variable_cost": {
-                                "type": "number",
-                                "description": "Quota per consumi della bolletta"
-                            },
-                            "offer_code": {
-                                "type": "string",
-                                "description": "Codice offerta"
-                            },
-                            "f1_consume": {
-                                "type": "number",
-                                "description": "Consumo annuo kWh nella fascia F1"
-                            },
-                            "f2_consume": {
-                                "type": "number",
-                                "description": "Consumo annuo kWh nella fascia F2"
-                            },
-                            "f3_consume": {
-                                "type": "number",
-                                "description": "Consumo annuo kWh nella fascia F3"
-                            }
-                        },
-                        "required": ["client_type", "resident","annual_consume", "city",
-                                    "total_price","tv_price", "potenza_impegnata",
-                                    "taxes","variable_cost","offer_code",
-                                    "f1_consume", "f2_consume", "f3_consume"
-                                    ],
-                        "additionalProperties": False
-                    }
-                }
+
+FIELDS_TO_EXTRACT = [
+    "Tipologia di cliente",
+    "residente",
+    "Consumo annuo",
+    "Comune di fornitura",
+    "Prezzo bolletta totale",
+    "Importo canone televisione per uso privato",
+    "Potenza impegnata",
+    "Accise e IVA",
+    "Quota per consumi",
+    "Codice offerta",
+    "Consumo Annuo F1",
+    "Consumo Annuo F2",
+    "Consumo Annuo F3",
+] #also change BILL_SCHEMA
+
+PROMPT = ("Create a summary of the information about this electricity bill, in syntactically correct json format."+
+          "You must include ONLY these fields: "+ ", ".join(FIELDS_TO_EXTRACT)+
+          "Do NOT include units. Name the fields EXACTLY as the request."+
+          "Numbers must be treated as number. If there is a decimal number, separate with a dot"+
+          "The kind of client MUST be either 'Domestico' or 'Business', and there must be a boolean value"+
+          "that indicates if a client is 'residente' or not")
+
+BILL_SCHEMA = {
+    "name": "Bill analysis",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "client_type": {
+                "type": "string",
+                "description":  "Either 'Domestico residente' or 'Domestico non residente' or 'Business'"
             },
-            'plugins': [
-                {
-                    "id": "file-parser",
-                    "pdf": {
-                        "engine": "pdf-text",
-                    },
-                },
-            ],
-            **kwargs
-        }
-    ).json()
+            "resident": {
+                "type": "boolean",
+                "description": "Client is resident in city of bill"
+            },
+            "annual_consume": {
+                "type": "number",
+                "description": "Consumo annuo"
+            },
+            "city": {
+                "type": "string",
+                "description": "città di fornitura"
+            },
+            "total_price": {
+                "type": "number",
+                "description": "Raw price of the bill"
+            },
+            "tv_price": {
+                "type": "number",
+                "description": "Price of canone tv"
+            },
+            "potenza_impegnata": {
+                "type": "number",
+                "description": "Potenza impeganta"
+            },
+            "taxes": {
+                "type": "number",
+                "description": "Accise & IVA"
+            },
+            "variable_cost": {
+                "type": "number",
+                "description": "Quota per consumi della bolletta"
+            },
+            "offer_code": {
+                "type": "string",
+                "description": "Codice offerta"
+            },
+            "f1_consume": {
+                "type": "number",
+                "description": "Consumo annuo kWh nella fascia F1"
+            },
+            "f2_consume": {
+                "type": "number",
+                "description": "Consumo annuo kWh nella fascia F2"
+            },
+            "f3_consume": {
+                "type": "number",
+                "description": "Consumo annuo kWh nella fascia F3"
+            }
+        },
+        "required": ["client_type", "resident","annual_consume", "city",
+                    "total_price","tv_price", "potenza_impegnata",
+                    "taxes","variable_cost","offer_code",
+                    "f1_consume", "f2_consume", "f3_consume"
+                    ],
+        "additionalProperties": False
+    }
+}
+
+# Versione dello schema di estrazione per la cache: cambia da sola se cambiano prompt, schema o parser locali
+SCHEMA_VERSION = hashlib.sha256(json.dumps([PROMPT, BILL_SCHEMA, PARSER_VERSION], sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def pdf_request(model, data, use_cache=True, riserve=None, con_modello=False, **kwargs) -> dict:
+    ''' Placeholder until the Python OpenRouter SDK implements the pdf reading functionality natively.
+    Results are cached by PDF content, model and schema version (see utils.extraction_cache):
+    the same bill is sent to OpenRouter only once.
+    The text is extracted locally first (see utils.estrazione_locale): known layouts skip the
+    model, the others send only the relevant pages as text.
+    With `riserve` (the model catalog) the request is hedged (see utils.estrazione_hedged): a backup
+    model starts if `model` is slow or fails, and the first answer valid against the schema wins.
+    A backup's answer is cached under the backup's id; with `con_modello` the result is
+    (answer, model that produced it).
+    Only answers that match BILL_SCHEMA are returned and cached: otherwise ValueError.'''
+    risultato = None
+    if use_cache:
+        risultato = extraction_cache.get(chiave_estrazione(data, model['id'], SCHEMA_VERSION, **kwargs))
+    vincente = model
+    if risultato is None:
+        risultato, vincente = _estrai(model, data, riserve, **kwargs)
+        if use_cache:
+            extraction_cache.put(chiave_estrazione(data, vincente['id'], SCHEMA_VERSION, **kwargs), risultato)
+    return (risultato, vincente) if con_modello else risultato
+
+
+def _estrai(model, data, riserve=None, **kwargs):
+    ''' (answer valid against BILL_SCHEMA, model that produced it)'''
+    modelli = [model] + (hedge.riserve(model, riserve) if hedge.ABILITATO and riserve else [])
+    vincente = model
+
+    def chiama(richiesta):
+        nonlocal vincente
+        if len(modelli) == 1:
+            return richiesta(model, None)
+        risultato, vincente = hedge.gara(modelli, richiesta, BILL_SCHEMA['schema'])
+        return risultato
+
+    risultato = estrai(data,
+                       lambda testo: chiama(lambda m, annulla: _text_request(m, testo, annulla=annulla, **kwargs)),
+                       lambda: chiama(lambda m, annulla: _pdf_request(m, data, annulla=annulla, **kwargs)))
+    # a missing or misnamed field must never reach the cache
+    return hedge.valida(risultato, BILL_SCHEMA['schema']), vincente
+
+
+def _chat_request(model, content, annulla=None, **kwargs) -> dict:
+    url = f'{OPENROUTER_BASE_URL}/chat/completions'
+    headers = {
+        "Authorization": f"Bearer {secrets['OPENROUTER_API_KEY']}",
+        "Content-Type": "application/json"
+    }
+    payload = {
+        'model': model['id'],
+        'messages': [
+            {
+                "role": "user",
+                "content": content
+            }
+        ],
+        'stream': False,
+        'response_format': {
+            'type': 'json_schema',
+            "json_schema": BILL_SCHEMA
+        },
+        **kwargs
+    }
+    if annulla is not None:
+        return _chat_stream(url, headers, {**payload, 'stream': True}, annulla)
+    response = sessione().post(url=url, headers=headers, json=payload, timeout=TIMEOUT).json()
     # with open("./tmp.json", mode="a") as f:
         # f.write(json.dumps(response, indent=4))
-    return json.loads(response['choices'][0]['message']['content'])
\ No newline at end of file
+    return json.loads(response['choices'][0]['message']['content'])
+
+
+def _chat_stream(url, headers, payload, annulla) -> dict:
+    ''' Streamed (SSE) request that can be cancelled: closing the connection stops the generation.'''
+    parti = []
+    with sessione().post(url=url, headers=headers, json=payload, stream=True, timeout=TIMEOUT) as response:
+        annulla.registra(response)
+        response.raise_for_status()
+        for riga in response.iter_lines(decode_unicode=True):
+            if annulla.is_set():
+                raise hedge.Annullata()
+            # le righe che iniziano con ':' sono commenti di keep-alive
+            if not riga or not riga.startswith('data: '):
+                continue
+            dato = riga[len('data: '):]
+            if dato == '[DONE]':
+                break
+            evento = json.loads(dato)
+            if 'error' in evento:
+                raise RuntimeError(evento['error'].get('message', 'OpenRouter error'))
+            parti.append(evento['choices'][0]['delta'].get('content') or '')
+    if annulla.is_set():
+        raise hedge.Annullata()
+    return json.loads(''.join(parti))
+
+
+def _text_request(model, testo, annulla=None, **kwargs) -> dict:
+    ''' Only the text of the relevant pages, extracted locally: no base64 file, no file-parser plugin.'''
+    return _chat_request(model, [
+        {
+            "type": "text",
+            "text": PROMPT + "\n\nText of the bill:\n" + testo
+        },
+    ], annulla, **kwargs)
+
+
+def _pdf_request(model, data, annulla=None, **kwargs) -> dict:
+    kwargs = {
+        'plugins': [
+            {
+                "id": "file-parser",
+                "pdf": {
+                    "engine": "pdf-text",
+                },
+            },
+        ],
+        **kwargs
+    }
+    return _chat_request(model, [
+        {
+            "type": "text",
+            "text": PROMPT
+        },
+        {
+            "type": "file",
+            "file": {
+                "filename": "document.pdf",
+                "file_data": f"data:application/pdf;base64,{base64.b64encode(data).decode('utf-8')}"
+            }
+        },
+    ], annulla, **kwargs)
@@ -0,0 +1,180 @@
+"""
+Profilo di consumo orario (8760 valori, es. dall'hub domotico) e prezzatura del
+catalogo Mercato Libero con PUN mensile.
+
+Ogni ora viene assegnata alla fascia ARERA con un classificatore vettoriale sul
+calendario italiano:
+  F1  lun-ven 8-19, esclusi i festivi nazionali
+  F2  lun-ven 7-8 e 19-23, sabato 7-23, esclusi i festivi nazionali
+  F3  lun-sab 23-7, domeniche e festivi nazionali tutto il giorno
+I kWh vengono sommati per mese e per fascia; le offerte variabili si prezzano sul
+PUN del mese corrispondente. Le ore sono locali e consecutive (il cambio dell'ora
+legale non viene modellato).
+"""
+import os
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from .catalog_registry import registry
+from .mercato_libero import PUN_DEFAULT
+
+FASCE_ORARIE = ('F1', 'F2', 'F3')
+
+# Festività nazionali a data fissa (mese, giorno); Pasquetta si calcola per anno
+FESTIVI_FISSI = ((1, 1), (1, 6), (4, 25), (5, 1), (6, 2), (8, 15), (11, 1), (12, 8), (12, 25), (12, 26))
+
+
+def pasqua(anno) -> date:
+    """Domenica di Pasqua (calendario gregoriano, algoritmo di Meeus/Jones/Butcher)"""
+    a, b, c = anno % 19, anno // 100, anno % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    mese = (h + l - 7 * m + 114) // 31
+    giorno = (h + l - 7 * m + 114) % 31 + 1
+    return date(anno, mese, giorno)
+
+
+def festivita(anni) -> np.ndarray:
+    """Festività nazionali degli anni indicati, come datetime64[D]"""
+    giorni = []
+    for anno in anni:
+        giorni += [date(anno, m, g) for m, g in FESTIVI_FISSI]
+        giorni.append(pasqua(anno) + timedelta(days=1))  # Lunedì dell'Angelo
+    return np.array(giorni, dtype='datetime64[D]')
+
+
+def classifica_fasce(orari) -> np.ndarray:
+    """Fascia di ogni ora (datetime64): 0 = F1, 1 = F2, 2 = F3"""
+    orari = np.asarray(orari, dtype='datetime64[h]')
+    giorni = orari.astype('datetime64[D]')
+    ora = (orari - giorni).astype(np.int64)
+    settimana = (giorni.astype(np.int64) + 3) % 7  # 1970-01-01 era giovedì: 0 = lunedì
+
+    anni = np.unique(giorni.astype('datetime64[Y]').astype(np.int64) + 1970)
+    festivo = (settimana == 6) | np.isin(giorni, festivita(anni.tolist()))
+    feriale = (settimana < 5) & ~festivo
+    sabato = (settimana == 5) & ~festivo
+
+    fasce = np.full(len(orari), 2, dtype=np.int8)
+    fasce[(feriale | sabato) & (ora >= 7) & (ora < 23)] = 1
+    fasce[feriale & (ora >= 8) & (ora < 19)] = 0
+    return fasce
+
+
+class ProfiloOrario:
+    """
+    Serie oraria di consumi (kWh) a partire da `inizio` (default: 1 gennaio dell'anno).
+    `kwh_mensili` è la matrice (12, 3) dei consumi per mese e fascia F1/F2/F3.
+    """
+
+    def __init__(self, consumi, anno=None, inizio=None):
+        self.consumi = np.asarray(consumi, dtype=float)
+        if inizio is None:
+            inizio = f'{anno if anno is not None else date.today().year}-01-01T00'
+        self.orari = np.datetime64(inizio, 'h') + np.arange(len(self.consumi))
+        self.fasce = classifica_fasce(self.orari)
+        self.mesi = self.orari.astype('datetime64[M]').astype(np.int64) % 12
+
+        self.kwh_mensili = np.bincount(self.mesi * 3 + self.fasce, weights=self.consumi,
+                                       minlength=36).reshape(12, 3)
+        self.kwh_fasce = self.kwh_mensili.sum(axis=0)
+        self.consumo_annuo = float(self.kwh_fasce.sum())
+
+    @property
+    def ripartizione(self) -> dict:
+        """Quote F1/F2/F3 del consumo, nel formato di profilo['ripartizione']"""
+        if self.consumo_annuo <= 0:
+            return {"F1": 0.33, "F2": 0.33, "F3": 0.34}
+        return {f: float(kwh / self.consumo_annuo) for f, kwh in zip(FASCE_ORARIE, self.kwh_fasce)}
+
+    def pun_effettivo(self, pun_mensile) -> dict:
+        """
+        PUN per fascia pesato sui consumi di ogni mese: il costo variabile
+        sum_f (PUN_f * (1 + lambda) + spread_f) * kWh_f calcolato con questi valori
+        coincide con la somma mese per mese sul PUN mensile.
+        """
+        pun_mensile = np.asarray(pun_mensile, dtype=float)
+        media = pun_mensile.mean(axis=0)
+        costo = (pun_mensile * self.kwh_mensili).sum(axis=0)
+        pun = {f: float(costo[j] / self.kwh_fasce[j]) if self.kwh_fasce[j] > 0 else float(media[j])
+               for j, f in enumerate(FASCE_ORARIE)}
+        kwh_23 = self.kwh_fasce[1:].sum()
+        pun['F23'] = float(costo[1:].sum() / kwh_23) if kwh_23 > 0 else float(media[1:].mean())
+        pun['F0'] = float(costo.sum() / self.consumo_annuo) if self.consumo_annuo > 0 else float(media.mean())
+        return pun
+
+    def profilo(self, potenza, residente, target) -> dict:
+        """Profilo per CalcolatoreSpesa con consumo annuo e ripartizione reali"""
+        return {
+            "consumo_annuo": self.consumo_annuo, "potenza": potenza,
+            "residente": residente, "target": target,
+            "ripartizione": self.ripartizione,
+        }
+
+
+def leggi_consumi_orari(file) -> np.ndarray:
+    """Consumi orari da CSV: l'ultima colonna numerica (kWh), una riga per ora"""
+    df = pd.read_csv(file, sep=None, engine='python')
+    numeriche = df.apply(lambda c: pd.to_numeric(c.astype(str).str.replace(',', '.'), errors='coerce'))
+    colonna = [c for c in numeriche.columns if numeriche[c].notna().any()][-1]
+    return numeriche[colonna].fillna(0.0).to_numpy(dtype=float)
+
+
+def _mese(valore):
+    """Mese 0-11 da 1-12 o da AAAAMM (es. 202411), -1 se non valido"""
+    if np.isnan(valore):
+        return -1
+    valore = int(valore)
+    return (valore % 100 if valore > 12 else valore) - 1
+
+
+def carica_pun_mensile(filepath) -> np.ndarray:
+    """
+    PUN per mese e fascia, matrice (12, 3), dallo stesso CSV di carica_pun_da_csv.
+    Il mese viene dalla colonna MESE o ANNOMESE se c'è (1-12 o AAAAMM), altrimenti
+    dall'ordine delle righe; con più anni vale l'ultima riga del mese.
+    I mesi mancanti prendono la media di quelli presenti.
+    """
+    try:
+        df = pd.read_csv(filepath, sep=';', encoding='utf-8')
+        df.columns = [c.strip().upper() for c in df.columns]
+        valori = np.column_stack([pd.to_numeric(df[next(c for c in df.columns if f in c)], errors='coerce')
+                                  for f in FASCE_ORARIE])
+        col_mese = next((c for c in df.columns if c in ('MESE', 'ANNOMESE')), None)
+        if col_mese:
+            mesi = [_mese(v) for v in pd.to_numeric(df[col_mese], errors='coerce').to_numpy(dtype=float)]
+        else:
+            mesi = np.arange(len(df)) % 12
+
+        pun = np.full((12, 3), np.nan)
+        for mese, riga in zip(mesi, valori):
+            if 0 <= mese < 12:
+                pun[int(mese)] = riga
+        media = np.nanmean(valori, axis=0)
+        return np.where(np.isnan(pun), media, pun)
+    except Exception:
+        return np.tile([PUN_DEFAULT[f] for f in FASCE_ORARIE], (12, 1))
+
+
+def load_pun_mensile(path) -> np.ndarray:
+    """PUN mensile condiviso tra le sessioni (valori di default se il file non c'è)"""
+    if not os.path.exists(path):
+        return np.tile([PUN_DEFAULT[f] for f in FASCE_ORARIE], (12, 1))
+    return registry.get(path, carica_pun_mensile, namespace='pun_mensile')
+
+
+def prezza_profilo_orario(tariffe, pun_mensile, profilo_orario, potenza, residente, target):
+    """
+    Voci di calcola_dettaglio (array per offerta) di tutto il catalogo per un profilo orario:
+    kWh per fascia reali e offerte variabili prezzate sul PUN di ogni mese.
+    `tariffe` è il catalogo compilato condiviso (load_tariffe): cambia solo il PUN delle variabili.
+    """
+    return tariffe.con_pun(profilo_orario.pun_effettivo(pun_mensile)).calcola(
+        profilo_orario.profilo(potenza, residente, target))
@@ -0,0 +1,201 @@
+"""
+Snapshot binari dei cataloghi ARERA.
+
+Un file sorgente (CSV PLACET, XML Mercato Libero) viene compilato una volta in una
+cartella `<sorgente>.snapshot/` con un file `.npy` per colonna e un `manifest.json`
+legato allo SHA-256 del sorgente. Le colonne si aprono in memory-map e i loader
+tornano al parsing del sorgente se lo snapshot manca o non corrisponde più al file.
+
+Il DataFrame PLACET usa direttamente le colonne numeriche mappate (nessuna copia,
+pagine condivise tra i processi che leggono lo stesso snapshot); testo e categorie
+vengono ricostruiti in memoria. Per l'XML Mercato Libero lo snapshot evita il parsing,
+ma i dizionari `dati` vengono comunque ricostruiti (vedi columns_to_offerte).
+
+Uso: python -m utils.snapshot assets/offers/PO_Offerte_E_PLACET_20251113.csv [altri file...]
+"""
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+from .catalog_registry import file_sha256
+
+SNAPSHOT_VERSION = 2
+MANIFEST = 'manifest.json'
+# colonna booleana dei valori mancanti di una colonna di testo ('' resta un testo valido)
+MISSING = '.missing'
+
+
+def snapshot_dir(source_path):
+    return os.path.abspath(source_path) + '.snapshot'
+
+
+def _text_to_array(values):
+    """Testo come array unicode a larghezza fissa (mappabile) più la maschera dei valori mancanti"""
+    mancanti = np.array([v is None or (isinstance(v, float) and np.isnan(v)) for v in values], dtype=bool)
+    testo = np.array(['' if m else str(v) for v, m in zip(values, mancanti.tolist())], dtype=str)
+    return testo, mancanti
+
+
+def text_values(columns, name, missing=None):
+    """Colonna di testo dello snapshot come array object, con `missing` al posto dei valori mancanti"""
+    obj = np.array(columns[name], dtype=object)
+    if name + MISSING in columns:
+        obj[np.asarray(columns[name + MISSING])] = missing
+    return obj
+
+
+def write_snapshot(source_path, columns: dict, text_columns=(), meta=None):
+    """
+    Scrive lo snapshot di `source_path`. `columns` mappa nome -> array numerico;
+    le colonne in `text_columns` vengono salvate come testo (None/NaN = mancante).
+    """
+    st = os.stat(source_path)
+    target = snapshot_dir(source_path)
+    tmp = target + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    manifest = {
+        'version': SNAPSHOT_VERSION,
+        'source': os.path.basename(source_path),
+        'source_sha256': file_sha256(source_path),
+        'source_size': st.st_size,
+        'source_mtime_ns': st.st_mtime_ns,
+        'meta': meta or {},
+        'columns': {},
+    }
+    for i, (name, values) in enumerate(columns.items()):
+        info = {'file': f'{i:03d}.npy'}
+        if name in text_columns:
+            arr, mancanti = _text_to_array(values)
+            info['kind'] = 'text'
+            if mancanti.any():
+                info['missing'] = f'{i:03d}{MISSING}.npy'
+                np.save(os.path.join(tmp, info['missing']), mancanti, allow_pickle=False)
+        else:
+            arr, info['kind'] = np.ascontiguousarray(values), 'numeric'
+        np.save(os.path.join(tmp, info['file']), arr, allow_pickle=False)
+        manifest['columns'][name] = info
+
+    with open(os.path.join(tmp, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # sostituzione della cartella solo a scrittura completata
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    return target
+
+
+def read_snapshot(source_path):
+    """
+    Apre lo snapshot di `source_path` in memory-map.
+    Restituisce (colonne, manifest) oppure None se manca o è obsoleto; per le colonne
+    di testo con valori mancanti c'è anche la maschera `<nome>.missing` (vedi text_values).
+    """
+    target = snapshot_dir(source_path)
+    try:
+        with open(os.path.join(target, MANIFEST)) as f:
+            manifest = json.load(f)
+        st = os.stat(source_path)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != SNAPSHOT_VERSION:
+        return None
+
+    # mtime e dimensione invariati: niente hash; altrimenti verifica il contenuto
+    if (manifest['source_size'], manifest['source_mtime_ns']) != (st.st_size, st.st_mtime_ns):
+        if manifest['source_sha256'] != file_sha256(source_path):
+            return None
+
+    try:
+        columns = {}
+        for name, info in manifest['columns'].items():
+            columns[name] = np.load(os.path.join(target, info['file']), mmap_mode='r', allow_pickle=False)
+            if 'missing' in info:
+                columns[name + MISSING] = np.load(os.path.join(target, info['missing']), allow_pickle=False)
+    except (OSError, ValueError):
+        return None
+    return columns, manifest
+
+
+# --- DataFrame (CSV PLACET) ---
+
+CATEGORIES = '.categories'
+
+
+def write_frame_snapshot(source_path, df: pd.DataFrame):
+    columns = {'__index__': df.index.to_numpy()}
+    text_columns = []
+    categorical = []
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            # codici interi mappabili + dizionario delle categorie come testo
+            columns[col] = df[col].cat.codes.to_numpy()
+            columns[col + CATEGORIES] = df[col].cat.categories.to_numpy(dtype=object)
+            text_columns.append(col + CATEGORIES)
+            categorical.append(col)
+            continue
+        values = df[col].to_numpy()
+        if values.dtype.kind in 'biuf':
+            columns[col] = values
+        else:
+            columns[col] = df[col].to_numpy(dtype=object)
+            text_columns.append(col)
+    return write_snapshot(source_path, columns, text_columns, meta={'categorical': categorical})
+
+
+def read_frame_snapshot(source_path, snap=None):
+    """
+    DataFrame dallo snapshot (o da `snap`, già aperto con read_snapshot): le colonne numeriche
+    sono le memory-map stesse, un blocco per colonna senza consolidamento; categorie dai
+    codici e testo ricostruiti in memoria.
+    """
+    if snap is None:
+        snap = read_snapshot(source_path)
+    if snap is None:
+        return None
+    columns, manifest = snap
+    categorical = manifest['meta'].get('categorical', [])
+    data = {}
+    for name, info in manifest['columns'].items():
+        if name == '__index__' or name.endswith(CATEGORIES):
+            continue
+        values = columns[name]
+        if name in categorical:
+            categorie = columns[name + CATEGORIES].astype(object)
+            data[name] = pd.Categorical.from_codes(values.view(np.ndarray), categorie)
+        elif info['kind'] == 'text':
+            data[name] = text_values(columns, name, np.nan)
+        else:
+            data[name] = values.view(np.ndarray)
+    # copy=False: il costruttore da dizionario non consolida le colonne in blocchi 2D (che le copierebbe)
+    return pd.DataFrame(data, index=pd.Index(np.asarray(columns['__index__'])), copy=False)
+
+
+def main(argv=None):
+    from . import analysis_offerte, mercato_libero
+
+    paths = argv if argv is not None else sys.argv[1:]
+    if not paths:
+        print(__doc__.strip())
+        return 1
+    for path in paths:
+        if path.lower().endswith('.csv'):
+            target = analysis_offerte.compile_arera_offers(path)
+        elif path.lower().endswith('.xml'):
+            target = mercato_libero.compile_offerte_xml(path)
+        else:
+            print(f'Formato non supportato: {path}')
+            continue
+        print(f'{path} -> {target}')
+        if path.lower().endswith('.csv'):
+            print(f'  {analysis_offerte.footprint(analysis_offerte.parse_arera_offers(path)):.1f} byte/offerta in memoria')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
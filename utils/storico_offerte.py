@@ -0,0 +1,125 @@
+"""
+Storico prezzi del Mercato Libero: ingestione in parallelo degli snapshot mensili
+`PO_Offerte_E_MLIBERO_YYYYMMDD.xml` di una cartella.
+
+Ogni file viene parsato in un processo separato (il parsing è CPU-bound, il GIL
+esclude i thread) e il worker restituisce colonne numpy (offerte_to_columns) invece
+di liste di dizionari, così il trasferimento al processo principale resta leggero.
+Le colonne dei vari mesi vengono poi unite in un unico archivio `.npz` offerte x mese.
+Un file malformato viene segnalato e saltato, senza fermare gli altri.
+
+Uso: python -m utils.storico_offerte cartella_xml [--output storico.npz] [--workers N] [--serial] [--confronta]
+"""
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .mercato_libero import CAMPI_TESTO, iter_offerte_xml, offerte_to_columns
+
+PATTERN_SNAPSHOT = 'PO_Offerte_E_MLIBERO_*.xml'
+_DATA_FILE = re.compile(r'(\d{8})')
+
+
+def data_snapshot(path) -> int:
+    """Data YYYYMMDD dal nome del file (0 se assente)"""
+    m = _DATA_FILE.search(os.path.basename(path))
+    return int(m.group(1)) if m else 0
+
+
+def parsa_snapshot(path):
+    """
+    Worker: parsa un XML e restituisce (path, colonne, secondi).
+    Il testo diventa array unicode, tutte le colonne sono array numpy.
+    """
+    inizio = time.perf_counter()
+    colonne = offerte_to_columns(list(iter_offerte_xml(path)))
+    for k in CAMPI_TESTO:
+        colonne[k] = np.array(['' if v is None else str(v) for v in colonne[k]], dtype=str)
+    return path, colonne, time.perf_counter() - inizio
+
+
+def _parsa_o_errore(path):
+    """Worker: come parsa_snapshot, ma un errore diventa (path, None, secondi, messaggio)"""
+    inizio = time.perf_counter()
+    try:
+        return parsa_snapshot(path) + (None,)
+    except Exception as e:
+        return path, None, time.perf_counter() - inizio, f"{type(e).__name__}: {e}"
+
+
+def unisci(risultati) -> dict:
+    """Colonne di più snapshot in un unico archivio, con la data dello snapshot per ogni offerta"""
+    risultati = sorted(risultati, key=lambda r: data_snapshot(r[0]))
+    if not risultati:
+        return {}
+    storico = {'data': np.concatenate([np.full(len(c['p_fix_comm']), data_snapshot(p), dtype=np.int32)
+                                       for p, c, _ in risultati])}
+    for k in risultati[0][1]:
+        storico[k] = np.concatenate([c[k] for _, c, _ in risultati])
+    return storico
+
+
+def ingest(cartella, workers=None, serial=False):
+    """
+    Parsa tutti gli snapshot della cartella.
+    Restituisce (storico, tempi per file, secondi totali, errori per file); i file con
+    errori non entrano nello storico.
+    """
+    paths = sorted(glob.glob(os.path.join(cartella, PATTERN_SNAPSHOT)), key=data_snapshot)
+    inizio = time.perf_counter()
+    if serial or workers == 1:
+        risultati = [_parsa_o_errore(p) for p in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            risultati = list(executor.map(_parsa_o_errore, paths))
+    totale = time.perf_counter() - inizio
+    tempi = {p: secondi for p, _, secondi, _ in risultati}
+    errori = {p: errore for p, _, _, errore in risultati if errore is not None}
+    return unisci([r[:3] for r in risultati if r[3] is None]), tempi, totale, errori
+
+
+def carica_storico(path) -> dict:
+    """Archivio offerte x mese scritto da `python -m utils.storico_offerte`"""
+    with np.load(path, allow_pickle=False) as archivio:
+        return {k: archivio[k] for k in archivio.files}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingestione in parallelo degli snapshot XML Mercato Libero")
+    parser.add_argument('cartella', help="cartella con i file " + PATTERN_SNAPSHOT)
+    parser.add_argument('--output', default='storico_mercato_libero.npz')
+    parser.add_argument('--workers', type=int, default=None, help="processi (default: numero di CPU)")
+    parser.add_argument('--serial', action='store_true', help="parsing sequenziale, come riferimento")
+    parser.add_argument('--confronta', action='store_true',
+                        help="ripete l'ingestione in sequenziale e riporta lo speedup misurato")
+    args = parser.parse_args(argv)
+
+    storico, tempi, totale, errori = ingest(args.cartella, args.workers, args.serial)
+    if not tempi:
+        print(f"Nessun file {PATTERN_SNAPSHOT} in {args.cartella}", file=sys.stderr)
+        return 1
+    for path, secondi in tempi.items():
+        print(f"{os.path.basename(path)}: {secondi:.2f} s" + (f" ERRORE {errori[path]}" if path in errori else ""))
+    if not storico:
+        print("Nessuno snapshot letto correttamente", file=sys.stderr)
+        return 1
+    np.savez(args.output, **storico)
+
+    print(f"{len(storico['data'])} offerte da {len(tempi) - len(errori)} snapshot -> {args.output}"
+          + (f" ({len(errori)} saltati per errori)" if errori else ""))
+    print(f"tempo totale {totale:.2f} s, somma dei tempi per file {sum(tempi.values()):.2f} s")
+    if args.confronta and not (args.serial or args.workers == 1):
+        # speedup misurato contro un'ingestione sequenziale reale degli stessi file
+        _, _, sequenziale, _ = ingest(args.cartella, serial=True)
+        print(f"sequenziale {sequenziale:.2f} s, speedup x{sequenziale / totale:.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Benchmark del parsing delle offerte Mercato Libero: offerte al secondo della
+visita in un solo passaggio (_parsa_offerta) contro la versione con ricerche
+XPath per campo (_parsa_offerta_xpath), con verifica che i `dati` coincidano.
+
+Senza file viene generato un XML sintetico con la stessa struttura del tracciato ARERA.
+
+Uso: python -m utils.xml_benchmark [file.xml] [--offerte 5000] [--ripetizioni 3]
+"""
+import argparse
+import random
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+from . import mercato_libero as ml
+
+NS_OFFERTE = 'http://www.acquirenteunico.it/schemas/SII_AU/OffertaRetail/01'
+
+
+def _intervallo(prezzo, unita, fascia=None):
+    fascia = f'<FASCIA_COMPONENTE>{fascia}</FASCIA_COMPONENTE>' if fascia else ''
+    return (f'<IntervalloPrezzi>{fascia}<CONSUMO_DA>0</CONSUMO_DA><CONSUMO_A>0</CONSUMO_A>'
+            f'<PREZZO>{prezzo}</PREZZO><UNITA_MISURA>{unita}</UNITA_MISURA></IntervalloPrezzi>')
+
+
+def xml_sintetico(n_offerte, seed=0) -> str:
+    """XML Mercato Libero sintetico: componenti fisse, variabili, energia per fascia e FER"""
+    rnd = random.Random(seed)
+    fasce = [['01', '02', '03'], ['01', '91'], [None]]
+    offerte = []
+    for i in range(n_offerte):
+        componenti = [('01', [_intervallo(round(rnd.uniform(1, 200), 2), '01')])]
+        if rnd.random() < .5:
+            componenti.append(('02', [_intervallo(round(rnd.uniform(0, .05), 6), '03', f) for f in rnd.choice(fasce)]))
+        energia = [_intervallo(round(rnd.uniform(.01, .2), 6), '03', f) for f in rnd.choice(fasce)]
+        if rnd.random() < .3:
+            energia.append(_intervallo(round(rnd.uniform(1, 3), 2), '02'))
+        componenti.append(('04', energia))
+        if rnd.random() < .3:
+            componenti.append(('06', [_intervallo(round(rnd.uniform(1, 3), 2), '01'),
+                                      _intervallo(round(rnd.uniform(0, .02), 6), '03')]))
+        idx = '01' if rnd.random() < .5 else ''
+        offerte.append(
+            f'<offerta><IdentificativiOfferta><PIVA_UTENTE>00000000000</PIVA_UTENTE><COD_OFFERTA>OFF{i:06d}</COD_OFFERTA></IdentificativiOfferta>'
+            f'<DettaglioOfferta><TIPO_MERCATO>01</TIPO_MERCATO><TIPO_CLIENTE>{rnd.choice(["01", "02"])}</TIPO_CLIENTE>'
+            f'<NOME_OFFERTA>Offerta {i}</NOME_OFFERTA><DESCRIZIONE>Descrizione offerta {i}</DESCRIZIONE><DURATA>12</DURATA></DettaglioOfferta>'
+            f'<RiferimentiPrezzoEnergia><IDX_PREZZO_ENERGIA>{idx}</IDX_PREZZO_ENERGIA></RiferimentiPrezzoEnergia>'
+            + ''.join(f'<ComponenteImpresa><NOME>C{j}</NOME><DESCRIZIONE>Componente</DESCRIZIONE><TIPOLOGIA>01</TIPOLOGIA>'
+                      f'<MACROAREA>{macro}</MACROAREA>{"".join(intervalli)}</ComponenteImpresa>'
+                      for j, (macro, intervalli) in enumerate(componenti))
+            + '</offerta>')
+    return f'<?xml version="1.0" encoding="UTF-8"?>\n<Offerte xmlns="{NS_OFFERTE}">' + ''.join(offerte) + '</Offerte>'
+
+
+def _offerte_al_secondo(parser, offerte, ns, ripetizioni):
+    migliore = float('inf')
+    for _ in range(ripetizioni):
+        t = time.perf_counter()
+        for offerta in offerte:
+            parser(offerta, ns)
+        migliore = min(migliore, time.perf_counter() - t)
+    return len(offerte) / migliore
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Throughput del parser offerte Mercato Libero")
+    parser.add_argument('xml', nargs='?', help="file XML (default: sintetico)")
+    parser.add_argument('--offerte', type=int, default=5000, help="offerte dell'XML sintetico")
+    parser.add_argument('--ripetizioni', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.xml:
+        root = ET.parse(args.xml).getroot()
+    else:
+        root = ET.fromstring(xml_sintetico(args.offerte))
+    ns = root.tag.split('}')[0] + "}" if '}' in root.tag else ""
+    offerte = root.findall(f".//{ns}offerta") if root.tag != f"{ns}offerta" else [root]
+
+    if [ml._parsa_offerta(o, ns) for o in offerte] != [ml._parsa_offerta_xpath(o, ns) for o in offerte]:
+        print("ERRORE: i due parser producono dati diversi", file=sys.stderr)
+        return 1
+
+    xpath = _offerte_al_secondo(ml._parsa_offerta_xpath, offerte, ns, args.ripetizioni)
+    singolo = _offerte_al_secondo(ml._parsa_offerta, offerte, ns, args.ripetizioni)
+    print(f"{len(offerte)} offerte, dati identici")
+    print(f"  XPath per campo:      {xpath:10.0f} offerte/s")
+    print(f"  passaggio singolo:    {singolo:10.0f} offerte/s  (x{singolo / xpath:.1f})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())